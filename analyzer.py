@@ -1,19 +1,73 @@
 """Gemini による口コミ分析モジュール。"""
 
-import json
+import asyncio
+import contextvars
 import os
-import re
-import time
+import random
+import threading
 from collections import Counter, defaultdict
-from datetime import datetime
 
 from google import genai
+from google.genai import types
 from dotenv import load_dotenv
 
+from batching import (MAX_ITEMS, PER_REVIEW_CAPS, TOKEN_BUDGETS, batch_tokens, estimate_tokens, pack_batches,
+                      truncate_to_tokens)
+from compression import PromptCompressor
+from dates import anchor_date, period_of, recent_cutoff, reference_day, resolve_date_range, review_date_range
+from dedupe import NearDuplicateIndex, split_duplicates, summarize_duplicates
+from discovery import DiscoveryTracker
+from incremental import STATS_VERSION, KandoStats, KeywordStats, review_key
+from kando_matrix import KandoMatrix
+from keyword_index import KeywordIndex, rating_bucket
+from lexicon import KeywordLexicon
+from llm_control import LLMController
+from llm_json import iter_json_items, parse_json_object
+from llm_scheduler import scheduler, scheduling
+from normalizer import normalize_review
+from profiler import profiler
+from sampling import (representative_sample, required_sample_size, sample_texts, stratified_estimate_from_moments,
+                      stratified_sample)
+from stage_cache import StageCache, digest
+from timeseries import build_trends
+
 load_dotenv()
 
 _client = genai.Client(api_key=os.getenv("GEMINI_API_KEY", ""))
 MODEL = "gemini-2.5-flash"
+LIGHT_MODEL = "gemini-2.5-flash-lite"
+# ステージごとのモデル（環境変数 GEMINI_MODEL_<STAGE> で上書き、例: GEMINI_MODEL_KANDO=gemini-2.5-pro）
+# タグ付け程度のキーワード抽出・表記判定は軽量モデルで十分なため LIGHT_MODEL を使う
+STAGE_MODELS = {
+    stage: os.getenv(f"GEMINI_MODEL_{stage.upper()}", default)
+    for stage, default in {
+        "keywords": LIGHT_MODEL,
+        "keyword_normalize": LIGHT_MODEL,
+        "kando": MODEL,
+        "kando_comment": MODEL,
+        "experience": MODEL,
+        "gap": MODEL,
+        "gap_map": MODEL,
+        "gap_reduce": MODEL,
+    }.items()
+}
+# プロンプトの版。プロンプトや応答の解釈を変えたら上げると、そのステージのキャッシュ（stage_cache.py）が無効になる
+PROMPT_VERSIONS = {stage: 1 for stage in STAGE_MODELS}
+# キャッシュ単位の分析ステージ → そのステージが使う LLM ステージ（experience は keywords の出力に依存する）
+ANALYSIS_STAGES = {
+    "keywords": ("keywords", "keyword_normalize"),
+    "experience": ("experience",),
+    "kando": ("kando", "kando_comment"),
+    "gap": ("gap", "gap_map", "gap_reduce"),
+}
+# True のとき、軽量モデルで欠落または確信度の低かった要素を ESCALATION_MODEL で再判定する
+ESCALATE_LOW_CONFIDENCE = os.getenv("GEMINI_ESCALATE", "") == "1"
+ESCALATION_MODEL = os.getenv("GEMINI_ESCALATION_MODEL", MODEL)
+ESCALATE_CONFIDENCE = 0.6
+# True のとき、スキーマを持つステージは JSON スキーマ制約付きで応答させる
+STRUCTURED_OUTPUT = True
+# 応答から欠落した ID だけを再リクエストする回数
+MISSING_RETRY_ROUNDS = 2
 
 KANDO_TYPES = ["threshold", "surprise", "resonance", "rescue", "awe", "participation", "growth"]
 KANDO_LABELS = {
@@ -27,117 +81,608 @@ KANDO_LABELS = {
 }
 
 
-def _generate(prompt: str) -> str:
-    response = _client.models.generate_content(model=MODEL, contents=prompt)
-    return response.text
+# ステージごとのトークン使用量（analyze_reviews の実行ごと・店舗ごとに別の dict）
+_token_usage: contextvars.ContextVar[dict[str, dict] | None] = contextvars.ContextVar("token_usage", default=None)
+_usage_lock = threading.Lock()
+# 全ステージ共通の呼び出し制御（リトライ・バックオフ・同時実行数の AIMD 調整）
+_controller = LLMController()
+
+
+_models_checked = False
+
+
+def stage_model(stage: str) -> str:
+    return STAGE_MODELS.get(stage, MODEL)
+
+
+async def _check_stage_models() -> None:
+    """設定されたモデルが API キーで利用可能か（list_models.py と同じ一覧で）確認し、なければ MODEL に戻す。"""
+    global _models_checked
+    if _models_checked:
+        return
+    _models_checked = True
+    from list_models import available_models
+
+    try:
+        available = set(await asyncio.to_thread(available_models, _client))
+    except Exception as e:
+        print(f"  ⚠️ モデル一覧を取得できませんでした（ステージ別モデルは未検証のまま使用）: {e}")
+        return
+    for stage, model in STAGE_MODELS.items():
+        if model not in available:
+            print(f"  ⚠️ {stage} のモデル {model} は利用できないため {MODEL} を使います")
+            STAGE_MODELS[stage] = MODEL
+
+
+async def _generate(prompt: str, stage: str = "other", schema: dict | None = None, model: str | None = None) -> str:
+    model = model or stage_model(stage)
+    config = None
+    if schema is not None and STRUCTURED_OUTPUT:
+        config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+    # クォータは入力 + 出力の概算で予約し、応答後に実トークン数で精算する
+    estimated = estimate_tokens(prompt) * 2
+
+    tokens: list[int] = []
+
+    async def admit():
+        return await scheduler.acquire(model, estimated)
+
+    async def call():
+        # LLM の区間は API 呼び出しそのものだけ（枠・クォータの待ちは LLMController が "queue" で記録する）
+        with profiler.span(stage, "llm", model=model) as span:
+            try:
+                response = await _client.aio.models.generate_content(model=model, contents=prompt, config=config)
+            except Exception:
+                span["failed"] = 1
+                raise
+            tokens[:] = _record_usage(stage, model, prompt, response)
+            span.update(input_tokens=tokens[0], output_tokens=tokens[1])
+        return response
+
+    response = await _controller.call(call, label=f"（{stage}）", admit=admit, name=stage)
+    scheduler.settle(model, estimated, sum(tokens))
+    return response.text or ""
+
+
+async def _request_object(stage: str, prompt: str, schema: dict, label: str) -> dict | None:
+    """JSON オブジェクト 1 つを返すステージ用。読めない応答は同じプロンプトで再リクエストする。"""
+    for attempt in range(1 + MISSING_RETRY_ROUNDS):
+        if attempt:
+            print(f"    🔁 {label}を再リクエスト...")
+        try:
+            obj = parse_json_object(await _generate(prompt, stage=stage, schema=schema))
+        except Exception as e:
+            print(f"    ⚠️ {label}エラー: {e}")
+            continue
+        if obj is not None:
+            return obj
+        print(f"    ⚠️ {label}: 応答から JSON を読み取れませんでした")
+    return None
+
+
+async def _request_by_id(stage: str, entries: list, build_prompt, schema: dict, label: str = "") -> dict[int, dict]:
+    """entries を 0 始まりの id 付きで build_prompt に渡し、id ごとの応答要素を返す。
+
+    応答の壊れた要素は読み飛ばし、欠落した id の分だけを作り直したプロンプトで再リクエストする。
+    ESCALATE_LOW_CONFIDENCE のときは、最後まで欠落した要素と confidence が低い要素を
+    ESCALATION_MODEL でもう一度判定する。
+    返り値のキーは entries 内の位置。最後まで得られなかった位置は含まれない。
+    """
+    results: dict[int, dict] = {}
+
+    def collect(text: str, pending: list[int]) -> None:
+        for item in iter_json_items(text):
+            local = item.get("id") if isinstance(item, dict) else None
+            if isinstance(local, int) and 0 <= local < len(pending):
+                results[pending[local]] = item
+
+    pending = list(range(len(entries)))
+    for attempt in range(1 + MISSING_RETRY_ROUNDS):
+        if not pending:
+            break
+        if attempt:
+            print(f"    🔁 欠落 {len(pending)}件を再リクエスト{label}...")
+        try:
+            text = await _generate(build_prompt([entries[k] for k in pending]), stage=stage, schema=schema)
+        except Exception as e:
+            print(f"    ⚠️ エラー{label}: {e}")
+            continue
+        collect(text, pending)
+        pending = [k for k in pending if k not in results]
+
+    if ESCALATE_LOW_CONFIDENCE and stage_model(stage) != ESCALATION_MODEL:
+        low = [k for k in range(len(entries)) if k not in results or _confidence(results[k]) < ESCALATE_CONFIDENCE]
+        if low:
+            print(f"    ⬆️ {len(low)}件を {ESCALATION_MODEL} で再判定{label}...")
+            try:
+                collect(await _generate(build_prompt([entries[k] for k in low]), stage=stage, schema=schema,
+                                        model=ESCALATION_MODEL), low)
+            except Exception as e:
+                print(f"    ⚠️ エラー{label}: {e}")
+    return results
+
+
+def _confidence(item: dict) -> float:
+    try:
+        return float(item.get("confidence", 1.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _usage_by_stage() -> dict[str, dict]:
+    """現在の実行のステージ別トークン使用量。begin_run() の外からの呼び出しでは、そのコンテキストに新しく作る。"""
+    usage = _token_usage.get()
+    if usage is None:
+        usage = {}
+        _token_usage.set(usage)
+    return usage
+
+
+def _record_usage(stage: str, model: str, prompt: str, response) -> tuple[int, int]:
+    """API が返す実トークン数（取得できない場合は推定値）をステージ別に積算し、(入力, 出力) を返す。"""
+    meta = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(meta, "prompt_token_count", None) or estimate_tokens(prompt)
+    output_tokens = getattr(meta, "candidates_token_count", None) or estimate_tokens(response.text or "")
+    with _usage_lock:
+        usage = _usage_by_stage().setdefault(stage, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+        usage["calls"] += 1
+        usage["input_tokens"] += input_tokens
+        usage["output_tokens"] += output_tokens
+        models = usage.setdefault("models", {})
+        models[model] = models.get(model, 0) + 1
+    return input_tokens, output_tokens
 
 
 # ---------------------------------------------------------------------------
 # メインエントリ
 # ---------------------------------------------------------------------------
 
-def _clean_text(text: str) -> str:
-    """Google マップが付加するメタデータ（食事の種類・料金・評点など）を本文から除去する。"""
-    metadata_markers = [
-        r'食事の種類',
-        r'1\s*人あたりの料金',
-        r'食事[:：]\s*\d',
-        r'サービス[:：]\s*\d',
-        r'雰囲気[:：]\s*\d',
-        r'予約\n',
-        r'グループの人数',
-    ]
-    pattern = '|'.join(f'(?:{m})' for m in metadata_markers)
-    m = re.search(pattern, text)
-    if m:
-        text = text[:m.start()].strip()
-    return text
-
-
-def analyze_reviews(reviews: list[dict], include_gap: bool = False) -> dict:
-    # 保存済みデータ内のメタデータを除去（--skip-scrape 時も対応）
-    reviews = [dict(r, text=_clean_text(r.get("text", ""))) for r in reviews]
-    print(f"\n🤖 Gemini 分析開始（{len(reviews)}件）...")
-
-    keywords = _extract_keywords(reviews)
-    experience = _analyze_experience(reviews, keywords)
-    timeseries_keywords = _analyze_timeseries_keywords(reviews, keywords)
-    kando = _analyze_kando(reviews)
-    gap = _analyze_gap(reviews) if include_gap else None
+def analyze_reviews(reviews: list[dict], **kwargs) -> dict:
+    """analyze_reviews_async の同期版（引数は同じ）。イベントループの外から呼ぶ。"""
+    return asyncio.run(analyze_reviews_async(reviews, **kwargs))
+
+
+async def analyze_reviews_async(reviews: list[dict], include_gap: bool = False, keyword_engine: str = "llm",
+                                store_name: str | None = None, discovery: str = "full",
+                                discovery_threshold: float = 1.0, kando_margin: float | None = None,
+                                priority: str = "interactive", gap_mode: str = "single",
+                                trend_granularity: str = "month", compress: bool = True,
+                                force_stages=()) -> dict:
+    """口コミ全体を分析する。
+
+    互いに依存しないステージ（キーワード → 体験価値 / 感動分析 / ギャップ分析）は並行に進める。
+    各ステージの出力は入力・プロンプトの版・モデルのハッシュごとに保存し（stage_cache.py）、
+    再実行時は変わったステージだけを計算する。force_stages に挙げたステージは必ず計算し直す。
+    近似重複の口コミ（dedupe.py）は代表 1 件だけを分析し、件数を結果の duplicates に残す。
+    LLM 呼び出しはプロセス共有のクォータスケジューラを通り、store_name と priority
+    （"interactive" / "batch"）で店舗間の公平性と優先度が決まる。複数店舗を同じイベントループで
+    並行に分析してよい。スクレイピングと並行に分析する場合は pipeline.ReviewStream を使う。
+    """
+    with scheduling(store_name or "default", priority):
+        # 未正規化の保存済みデータ（旧形式の reviews_raw.json など）はここで正規化する
+        with profiler.span("prepare", "analysis", reviews=len(reviews)):
+            reviews = [prepare_review(r) for r in reviews]
+        with profiler.span("dedupe", "analysis"):
+            reviews, duplicates = split_duplicates(reviews)
+        print(f"\n🤖 Gemini 分析開始（{len(reviews)}件）...")
+        print_duplicates(duplicates)
+        await begin_run()
+        return await analyze_prepared(reviews, include_gap=include_gap, keyword_engine=keyword_engine,
+                                      store_name=store_name, discovery=discovery,
+                                      discovery_threshold=discovery_threshold, kando_margin=kando_margin,
+                                      gap_mode=gap_mode, trend_granularity=trend_granularity,
+                                      duplicates=duplicates, compress=compress, force_stages=force_stages)
+
+
+def plan_analysis(reviews: list[dict], include_gap: bool = False, keyword_engine: str = "llm",
+                  store_name: str | None = None, discovery: str = "full", discovery_threshold: float = 1.0,
+                  kando_margin: float | None = None, priority: str = "interactive", gap_mode: str = "single",
+                  trend_granularity: str = "month", compress: bool = True, force_stages=()) -> list[dict]:
+    """analyze_reviews_async を同じ引数で実行した場合の、ステージごとの実行予定を返す（LLM は呼ばない）。
+
+    戻り値: [{"stage", "status": "cached" / "run" / "forced", "key"}]。上流（keywords）を計算する場合、
+    experience のキーは上流の結果が出るまで決まらないので key は None（status は "run"）。
+    """
+    reviews, _ = split_duplicates([prepare_review(r) for r in reviews])
+    cache = StageCache(force=force_stages)
+    facets = _review_facets(reviews)
+    keys = _stage_keys(cache, reviews, facets, keyword_engine, store_name, discovery, discovery_threshold,
+                       kando_margin, gap_mode, compress)
+    plan = [{"stage": "keywords", "status": cache.status("keywords", keys["keywords"]), "key": keys["keywords"]}]
+    upstream = cache.load("keywords", keys["keywords"]) if plan[0]["status"] == "cached" else None
+    if upstream is not None:
+        key = _stage_keys(cache, reviews, facets, keyword_engine, store_name, discovery, discovery_threshold,
+                          kando_margin, gap_mode, compress, keywords=upstream["keywords"])["experience"]
+        plan.append({"stage": "experience", "status": cache.status("experience", key), "key": key})
+    else:
+        plan.append({"stage": "experience", "status": "forced" if "experience" in cache.force else "run", "key": None})
+    plan.append({"stage": "kando", "status": cache.status("kando", keys["kando"]), "key": keys["kando"]})
+    if include_gap:
+        plan.append({"stage": "gap", "status": cache.status("gap", keys["gap"]), "key": keys["gap"]})
+    return plan
+
+
+def _stage_inputs(stage: str, **inputs) -> dict:
+    """ステージのキャッシュキーの材料（inputs に使用モデルとプロンプトの版を加える）。"""
+    llm_stages = ANALYSIS_STAGES[stage]
+    return {
+        **inputs,
+        "models": {s: stage_model(s) for s in llm_stages},
+        "escalation": ESCALATION_MODEL if ESCALATE_LOW_CONFIDENCE else None,
+        "prompts": {s: PROMPT_VERSIONS[s] for s in llm_stages},
+    }
+
+
+def _stage_keys(cache: StageCache, reviews: list[dict], facets: dict[str, list[str]], keyword_engine: str,
+                store_name: str | None, discovery: str, discovery_threshold: float, kando_margin: float | None,
+                gap_mode: str, compress: bool, keywords: list[dict] | None = None) -> dict[str, str]:
+    """ステージごとのキャッシュキー。experience のキーは keywords（上流の出力）を渡したときだけ含める。
+
+    キーワード辞書（lexicon.py）の状態はキーに含めない（辞書が育っても、同じ口コミのキーワードは再利用する）。
+    """
+    base = {"reviews": digest([review_key(r) for r in reviews]), "facets": digest(facets)}
+    keys = {
+        "keywords": cache.key("keywords", _stage_inputs(
+            "keywords", reviews=base["reviews"], compress=compress, engine=keyword_engine, store_name=store_name,
+            discovery=discovery, discovery_threshold=discovery_threshold)),
+        "kando": cache.key("kando", _stage_inputs("kando", **base, compress=compress, margin=kando_margin)),
+        "gap": cache.key("gap", _stage_inputs("gap", **base, compress=compress, mode=gap_mode)),
+    }
+    if keywords is not None:
+        keys["experience"] = cache.key("experience", _stage_inputs("experience", **base, keywords=digest(keywords)))
+    return keys
+
+
+def prepare_review(review: dict) -> dict:
+    """口コミ 1 件の取り込み処理（その場で更新して返す）。
+
+    本文はスクレイピング時に正規化済みなら触らない（normalizer.normalize_review）。
+    日付は取得時刻基準の範囲に正規化する。
+    """
+    normalize_review(review)
+    if "date_range" not in review:
+        resolved = resolve_date_range(review.get("date", ""), anchor_date(review))
+        review["date_range"] = list(resolved) if resolved else None
+    return review
+
+
+async def begin_run() -> None:
+    """1 回の分析の開始処理（トークン集計と呼び出し統計のリセット、モデルの確認）。scheduling() の中で呼ぶ。"""
+    _token_usage.set({})
+    _controller.begin_run()
+    await _check_stage_models()
+
+
+async def analyze_prepared(reviews: list[dict], include_gap: bool = False, keyword_engine: str = "llm",
+                           store_name: str | None = None, discovery: str = "full",
+                           discovery_threshold: float = 1.0, kando_margin: float | None = None,
+                           gap_mode: str = "single", trend_granularity: str = "month",
+                           discovered: "KeywordDiscovery | None" = None,
+                           kando_scored: dict[int, list[int]] | None = None,
+                           duplicates: list[dict] | None = None, compress: bool = True,
+                           compressor: PromptCompressor | None = None, force_stages=()) -> dict:
+    """前処理済みの口コミ全体（近似重複を除いた代表）を分析して結果 dict を返す。
+
+    discovered / kando_scored にストリーミング中に済ませたキーワード発見・感動スコアを渡すと、
+    その部分の LLM 呼び出しを省いて全体集計だけを行う（そのステージのキャッシュは結果で上書きする）。
+    キーワード抽出・感動採点・ギャップ分析には圧縮した本文を渡す（compress=False で無効）。
+    compressor にはストリーミング中に到着順で圧縮済みのものを渡す。
+    """
+    if compressor is None:
+        compressor = PromptCompressor(enabled=compress)
+        with profiler.span("compression", "analysis"):
+            for r in reviews:
+                compressor.add(r.get("text", ""))
+    texts = compressor.texts
+    _print_compression(compressor.report())
+    with profiler.span("keyword_index", "analysis"):
+        facets = _review_facets(reviews)
+        index = KeywordIndex.build([r.get("text", "") for r in reviews], facets=facets)
+    discovery_stats: dict = {}
+    cache = StageCache(force=force_stages)
+    key_options = (keyword_engine, store_name, discovery, discovery_threshold, kando_margin, gap_mode,
+                   compressor.enabled)
+    keys = _stage_keys(cache, reviews, facets, *key_options)
+
+    async def keywords_and_experience():
+        computed = False
+
+        async def extract():
+            nonlocal computed
+            computed = True
+            keywords = await _extract_keywords(reviews, index, engine=keyword_engine, store_name=store_name,
+                                               discovery=discovery, discovery_threshold=discovery_threshold,
+                                               stats=discovery_stats, discovered=discovered, texts=texts)
+            return {"keywords": keywords, "discovery": discovery_stats}
+
+        out = await cache.run("keywords", keys["keywords"], extract, refresh=discovered is not None)
+        keywords = out["keywords"]
+        if not computed:
+            discovery_stats.update(out["discovery"])
+            _restore_keywords(reviews, index, keywords)
+
+        experience_key = _stage_keys(cache, reviews, facets, *key_options, keywords=keywords)["experience"]
+        return keywords, await cache.run("experience", experience_key,
+                                         lambda: _analyze_experience(reviews, keywords, facets))
+
+    async def kando_stage():
+        async def score():
+            kando, stats = await _analyze_kando(reviews, sample_margin=kando_margin, facets=facets,
+                                                scored=kando_scored, texts=texts)
+            return {"result": kando, "stats": stats.to_dict()}
+
+        out = await cache.run("kando", keys["kando"], score, refresh=kando_scored is not None)
+        return out["result"], KandoStats.from_dict(out["stats"], len(KANDO_TYPES))
+
+    async def gap_or_none():
+        if not include_gap:
+            return None
+        return await cache.run("gap", keys["gap"], lambda: _analyze_gap(reviews, mode=gap_mode, texts=texts))
+
+    (keywords, experience), (kando, kando_stats), gap = await asyncio.gather(
+        keywords_and_experience(), kando_stage(), gap_or_none(),
+    )
+    _print_stage_cache(cache.report())
+    with profiler.span("timeseries", "analysis"):
+        keyword_stats = _keyword_stats(index, keywords)
+        timeseries_keywords = _analyze_timeseries_keywords(keyword_stats, keywords)
+    with profiler.span("trends", "analysis"):
+        trends = _analyze_trends(reviews, index, keywords, kando, trend_granularity)
 
     result = {
         "reviews": reviews,
         "keywords": keywords,
         "experience": experience,
         "timeseries_keywords": timeseries_keywords,
+        "trends": trends,
         "kando": kando,
+        "keyword_index": index.to_dict(),
+        "stats": {
+            "version": STATS_VERSION,
+            "review_keys": [review_key(r) for r in reviews],
+            "kando": kando_stats.to_dict(),
+            "keywords": keyword_stats.to_dict(),
+        },
+        "duplicates": summarize_duplicates(duplicates or []),
+        "compression": compressor.report(),
     }
+    if discovery_stats:
+        result["keyword_discovery"] = discovery_stats
+    result["stage_cache"] = cache.report()
+    result["token_usage"] = {stage: dict(u) for stage, u in _usage_by_stage().items()}
+    _print_token_usage(result["token_usage"])
+    result["llm_controller"] = _controller.report()
+    _print_controller_report(result["llm_controller"])
     if gap is not None:
         result["gap"] = gap
     return result
 
 
-# ---------------------------------------------------------------------------
-# キーワード抽出（Gemini バッチ）
-# ---------------------------------------------------------------------------
+def analyze_increment(previous: dict, reviews: list[dict], **kwargs) -> dict:
+    """analyze_increment_async の同期版（引数は同じ）。イベントループの外から呼ぶ。"""
+    return asyncio.run(analyze_increment_async(previous, reviews, **kwargs))
+
+
+async def analyze_increment_async(previous: dict, reviews: list[dict], store_name: str | None = None,
+                                  priority: str = "interactive", trend_granularity: str | None = None,
+                                  compress: bool = True) -> dict:
+    """前回の分析結果に、まだ分析していない口コミだけを足し込む。
+
+    新しい口コミの感動スコアを口コミ別のスコア行列に、キーワード出現を索引に加え、
+    スコア・検出率・出現件数・時期別の出現率を作り直す。LLM を使うのは新しい口コミの感動採点だけで、
+    キーワードは前回のもの（表記ゆれ込み）を数え直す。体験価値・ギャップ分析・感動コメントの文章は前回のまま。
+    層化抽出で分析した結果の場合も、新しい口コミは全件採点して該当する層に加える。
+
+    「直近」の基準日は新しい取得日で進むため、時期（直近 / それ以前）は既存の口コミも含めて現在の基準日で
+    付け直し、層別の統計量と時期別の出現件数はスコア行列と索引から作り直す（LLM は使わない）。
+    trend_granularity を省略すると前回の集計単位を使う。compress=False で感動採点の本文を圧縮しない。
+    """
+    stats = previous.get("stats") or {}
+    if stats.get("version") != STATS_VERSION or "matrix" not in previous.get("kando", {}):
+        raise ValueError("前回の分析結果に増分分析用の統計量がありません。全件分析を実行してください。")
+
+    seen = set(stats["review_keys"]) | set(previous.get("duplicates", {}).get("keys", []))
+    fresh = []
+    for r in reviews:
+        r = prepare_review(r)
+        key = review_key(r)
+        if key not in seen:
+            seen.add(key)
+            fresh.append(r)
+    # 新しい口コミは分析済みの代表とも照合する
+    dedupe_index = NearDuplicateIndex()
+    for key, r in zip(stats["review_keys"], previous.get("reviews", [])):
+        dedupe_index.add(key, r.get("text", ""))
+    added, duplicates = split_duplicates(fresh, dedupe_index)
+    print_duplicates(duplicates)
+    duplicate_summary = summarize_duplicates(duplicates, previous.get("duplicates"))
+    if not added:
+        print("\n✅ 新しい口コミはありません（前回の分析結果をそのまま使います）。")
+        return dict(previous, duplicates=duplicate_summary) if duplicates else previous
+    print(f"\n🤖 増分分析開始（既存 {len(stats['review_keys'])}件 + 新規 {len(added)}件）...")
+
+    with scheduling(store_name or "default", priority):
+        await begin_run()
+        all_reviews = previous.get("reviews", []) + added
+        facets = _review_facets(all_reviews)
+        compressor = PromptCompressor(enabled=compress)
+        for r in added:
+            compressor.add(r.get("text", ""))
+        _print_compression(compressor.report())
+        scored = await _score_kando(added, list(range(len(added))), compressor.texts)
+        matrix = KandoMatrix.from_dict(previous["kando"]["matrix"], len(KANDO_TYPES))
+        matrix.extend(KandoMatrix.from_rows([review_key(r) for r in added],
+                                            [scored.get(pos) for pos in range(len(added))], len(KANDO_TYPES)))
+        kando_stats = _kando_stats_from_matrix(matrix, _kando_strata(facets))
+
+        sampling = "sampling" in previous.get("kando", {})
+        kando = await _summarize_kando(kando_stats, sampling, all_reviews,
+                                       ai_comment=previous.get("kando", {}).get("ai_comment", ""))
+        kando["matrix"] = matrix.to_dict()
+        kando["breakdowns"] = _kando_breakdowns(matrix, facets, sampling)
+        if sampling:
+            kando["sampling"] = dict(previous["kando"]["sampling"],
+                                     sample_size=previous["kando"]["sampling"]["sample_size"] + len(added),
+                                     scored=kando_stats.scored, strata=len(kando_stats.strata))
+
+    # キーワード: 前回のキーワードについて、新しい口コミでの出現を索引に加え、ファセットは全件で付け直す
+    keywords = [dict(k) for k in previous.get("keywords", [])]
+    variants = {k["word"]: k.get("variants", []) for k in keywords}
+    index = KeywordIndex.from_dict(previous.get("keyword_index", {}))
+    index.extend([r.get("text", "") for r in added], variants=variants)
+    for name, labels in facets.items():
+        index.add_facet(name, labels)
+    keyword_stats = _keyword_stats(index, keywords)
+    for k in keywords:
+        k["count"] = keyword_stats.count(k["word"])
+    keywords.sort(key=lambda k: -k["count"])
+
+    result = dict(previous)
+    result.update({
+        "reviews": all_reviews,
+        "keywords": keywords,
+        "timeseries_keywords": _analyze_timeseries_keywords(keyword_stats, keywords),
+        "trends": _analyze_trends(all_reviews, index, keywords, kando,
+                                  trend_granularity or previous.get("trends", {}).get("granularity", "month")),
+        "kando": kando,
+        "keyword_index": index.to_dict(),
+        "stats": {
+            "version": STATS_VERSION,
+            "review_keys": stats["review_keys"] + [review_key(r) for r in added],
+            "kando": kando_stats.to_dict(),
+            "keywords": keyword_stats.to_dict(),
+        },
+        "duplicates": duplicate_summary,
+        "incremental": {"added": len(added), "total": len(all_reviews),
+                        "reused": ["experience", "gap", "kando.ai_comment"]},
+    })
+    result["token_usage"] = {stage: dict(u) for stage, u in _usage_by_stage().items()}
+    _print_token_usage(result["token_usage"])
+    result["llm_controller"] = _controller.report()
+    return result
 
-BATCH_SIZE = 20
 
-def _extract_keywords(reviews: list[dict]) -> list[dict]:
-    """Gemini でキーワードを特定し、実テキスト検索で出現件数を集計する。"""
-    print("  🔑 キーワード抽出中...")
-    word_sentiments: dict[str, list[str]] = defaultdict(list)
-    total_batches = (len(reviews) + BATCH_SIZE - 1) // BATCH_SIZE
+def _print_compression(report: dict) -> None:
+    if report["enabled"] and report["raw_tokens"]:
+        print(f"  🗜️ プロンプト圧縮: {report['raw_tokens']:,} → {report['tokens']:,} tokens（-{report['reduction']}%）")
 
-    for i in range(0, len(reviews), BATCH_SIZE):
-        batch = reviews[i: i + BATCH_SIZE]
-        batch_num = i // BATCH_SIZE + 1
-        print(f"    📦 バッチ {batch_num}/{total_batches}...")
-        texts = "\n".join(f"[{j}] {r['text'][:200]}" for j, r in enumerate(batch))
 
-        prompt = f"""以下の飲食店口コミから、顧客心理・顧客価値を表すキーワードを抽出してください。
+def _print_stage_cache(report: list[dict]) -> None:
+    reused = [r["stage"] for r in report if r["status"] == "cached"]
+    if reused:
+        executed = [r["stage"] for r in report if r["status"] != "cached"]
+        print(f"  ♻️ キャッシュを再利用: {', '.join(reused)}（実行: {', '.join(executed) or 'なし'}）")
 
-【抽出する言葉】
-- 顧客の感情・評価・体験価値を表す言葉（例：美味しい、感動、映え、最高、残念、また来たい、コスパ、非日常、待ちすぎ、雰囲気抜群）
-- 形容詞・評価動詞・印象・満足度を表す表現を優先
 
-【除外する言葉】
-- 「料理」「食事」「スタッフ」「ドリンク」「席」「店内」「お店」「メニュー」「注文」「テーブル」「ランチ」「ディナー」「飲み物」「食べ物」「店員」「店舗」など、飲食店として当たり前の物・場所・人を表す一般名詞
-- 助詞・接続詞・語尾
+def print_duplicates(duplicates: list[dict]) -> None:
+    if duplicates:
+        sources = "、".join(f"{k} {v}件" for k, v in summarize_duplicates(duplicates)["by_source"].items())
+        print(f"  🔁 近似重複 {len(duplicates)}件を除外（{sources}）")
 
-【統一ルール】
-- 類似表現は代表的な表記に統一（例:「美味しい」「おいしい」→「美味しい」）
-- 各キーワードのポジネガも判定
 
-口コミ:
-{texts}
+def _print_token_usage(usage: dict[str, dict]) -> None:
+    if not usage:
+        return
+    print("  🧾 トークン使用量:")
+    for stage, u in usage.items():
+        models = " / ".join(u.get("models", {}))
+        print(f"    {stage:<18} {u['calls']:>4}回  入力 {u['input_tokens']:>8,}  出力 {u['output_tokens']:>7,}  {models}")
 
-出力形式（JSONのみ）:
-[{{"word":"キーワード","sentiment":"positive|negative|neutral"}}]"""
 
-        try:
-            response_text = _generate(prompt)
-            json_match = re.search(r"\[.*\]", response_text, re.DOTALL)
-            if json_match:
-                for item in json.loads(json_match.group()):
-                    w = item.get("word", "").strip()
-                    s = item.get("sentiment", "neutral")
-                    if w and len(w) >= 2:
-                        word_sentiments[w].append(s)
-            time.sleep(2)
-        except Exception as e:
-            print(f"    ⚠️ エラー（バッチ {batch_num}）: {e}")
-
-    # 一般名詞除外リスト
-    GENERIC_WORDS = {
-        "料理", "食事", "スタッフ", "ドリンク", "席", "店内", "お店", "メニュー",
-        "注文", "テーブル", "ランチ", "ディナー", "飲み物", "食べ物", "店員", "店舗",
-        "お料理", "飲食", "朝食", "昼食", "夕食", "夜ご飯", "昼ご飯", "朝ご飯",
-        "入口", "出口", "入り口", "トイレ", "駐車場", "予約", "会計", "レジ",
-        "店", "方", "人", "時", "方々", "皆さん", "皆様", "こちら", "こと",
+def _print_controller_report(report: dict) -> None:
+    if not report["calls"]:
+        return
+    errors = "、".join(f"{k} {v}回" for k, v in report["errors"].items()) or "なし"
+    print(f"  🚦 同時実行数: {report['initial_concurrency']:.0f} → {report['settled_concurrency']:.1f}"
+          f"  スループット {report['throughput_per_min']}回/分  平均応答 {report['avg_latency_sec']}秒"
+          f"  再試行 {report['retries']}回（{errors}）")
+
+
+def _prompt_texts(reviews: list[dict], texts: list[str] | None) -> list[str]:
+    return texts if texts is not None else [r.get("text", "") for r in reviews]
+
+
+def _representative(reviews: list[dict], positions, facets: dict[str, list[str]], budget: int, cap: int,
+                    max_items: int) -> list[int]:
+    """positions の口コミから要約プロンプト用の代表を選び、reviews 内の位置で返す（sampling.representative_sample）。"""
+    positions = list(positions)
+    if not positions or max_items <= 0:
+        return []
+    picked = representative_sample([reviews[i].get("text", "") for i in positions], budget, cap,
+                                   {name: [labels[i] for i in positions] for name, labels in facets.items()},
+                                   max_items=max_items)
+    return [positions[j] for j in picked]
+
+
+def _review_facets(reviews: list[dict]) -> dict[str, list[str]]:
+    """ビットマップ索引用に、各口コミのサイト・評点・時期ラベルを返す。
+
+    時期は正規化済みの日付範囲を、最新の取得日から3ヶ月前の日付と比べて決める。
+    """
+    cutoff = recent_cutoff(reference_day(reviews))
+    periods = [period_of(review_date_range(r), cutoff) for r in reviews]
+    return {
+        "source": [r.get("source", "unknown") for r in reviews],
+        "rating": [rating_bucket(r.get("rating")) for r in reviews],
+        "period": periods,
     }
 
-    # ポジネガを多数決で決定し、実テキスト検索で出現件数を集計
+
+def _kando_strata(facets: dict[str, list[str]]) -> list[str]:
+    """感動分析の層化抽出用ラベル（サイト × 評点帯 × 時期）。評点は ★3以下 / ★4以上 / 不明 に粗くまとめる。"""
+    bands = ["none" if b == "0" else "low" if int(b) <= 3 else "high" for b in facets["rating"]]
+    return [f"{s}|{b}|{p}" for s, b, p in zip(facets["source"], bands, facets["period"])]
+
+
+# ---------------------------------------------------------------------------
+# キーワード抽出（Gemini バッチ）
+# ---------------------------------------------------------------------------
+
+KEYWORD_ENGINES = ("llm", "janome", "hybrid")
+NORMALIZE_BATCH = 150
+DISCOVERY_MODES = ("full", "adaptive")
+DISCOVERY_SEED = 42
+
+# 一般名詞除外リスト
+GENERIC_WORDS = {
+    "料理", "食事", "スタッフ", "ドリンク", "席", "店内", "お店", "メニュー",
+    "注文", "テーブル", "ランチ", "ディナー", "飲み物", "食べ物", "店員", "店舗",
+    "お料理", "飲食", "朝食", "昼食", "夕食", "夜ご飯", "昼ご飯", "朝ご飯",
+    "入口", "出口", "入り口", "トイレ", "駐車場", "予約", "会計", "レジ",
+    "店", "方", "人", "時", "方々", "皆さん", "皆様", "こちら", "こと",
+}
+
+
+async def _extract_keywords(reviews: list[dict], index: KeywordIndex, engine: str = "llm",
+                            store_name: str | None = None, discovery: str = "full",
+                            discovery_threshold: float = 1.0, stats: dict | None = None,
+                            discovered: "KeywordDiscovery | None" = None,
+                            texts: list[str] | None = None) -> list[dict]:
+    """キーワードを特定し、ビットマップ索引で出現件数を集計する。
+
+    engine: "llm"（Gemini バッチ）/ "janome"（形態素解析のみ）/ "hybrid"（Janome 候補を Gemini で選別）
+    表記統一とポジネガは店舗横断のキーワード辞書で解決し、未知の表記だけを Gemini に判定させる。
+    discovery="adaptive" では発見が飽和した時点で LLM 呼び出しを打ち切る（件数集計は常に全件）。
+    stats を渡すと発見曲線と推定再現率を書き込む。
+    discovered を渡すと（ストリーミング時）、済んでいるバッチ処理の結果から続きだけを行う。
+    texts は LLM に渡す本文（圧縮済み）。出現件数は常に元の本文で数える。
+    """
+    print(f"  🔑 キーワード抽出中...（エンジン: {engine}）")
+    lexicon = discovered.lexicon if discovered is not None else KeywordLexicon.load()
+    if discovered is not None:
+        word_sentiments = await discovered.finish(stats)
+    elif engine == "llm":
+        word_sentiments = await _discover_keywords_llm(reviews, lexicon, discovery, discovery_threshold, stats, texts)
+    elif engine == "janome":
+        # 形態素解析は CPU 処理なのでイベントループを塞がないようスレッドで実行する
+        word_sentiments = await asyncio.to_thread(_discover_keywords_janome, reviews, index, lexicon, store_name)
+    elif engine == "hybrid":
+        word_sentiments = await _discover_keywords_hybrid(reviews, lexicon, store_name)
+    else:
+        raise ValueError(f"未知のキーワードエンジン: {engine}（{' / '.join(KEYWORD_ENGINES)}）")
+    lexicon.save()
+
+    # ポジネガを多数決で決定し、表記ゆれも含めて索引に登録して出現件数を集計
     all_texts = [r.get("text", "") for r in reviews]
     ranked = []
     for word, sents in word_sentiments.items():
@@ -145,19 +690,294 @@ def _extract_keywords(reviews: list[dict]) -> list[dict]:
             continue
         pos, neg = sents.count("positive"), sents.count("negative")
         sentiment = "positive" if pos > neg else "negative" if neg > pos else "neutral"
-        count = sum(1 for t in all_texts if word in t)
+        count = index.add_keyword(word, all_texts, lexicon.variants(word)).bit_count()
         if count > 0:
             ranked.append({"word": word, "count": count, "sentiment": sentiment})
 
     ranked.sort(key=lambda x: -x["count"])
-    return ranked[:50]
+    ranked = ranked[:50]
+    index.retain(k["word"] for k in ranked)
+    for k in ranked:
+        variants = lexicon.variants(k["word"])
+        if variants:
+            k["variants"] = variants
+    return ranked
+
+
+def _restore_keywords(reviews: list[dict], index: KeywordIndex, keywords: list[dict]) -> None:
+    """キャッシュから読み込んだキーワード（表記ゆれ込み）を索引に登録し直す。"""
+    all_texts = [r.get("text", "") for r in reviews]
+    for k in keywords:
+        index.add_keyword(k["word"], all_texts, k.get("variants", []))
+    index.retain(k["word"] for k in keywords)
+
+
+class KeywordDiscovery:
+    """LLM によるキーワード発見の途中経過。バッチごとに fetch() の結果を add() で追加していき、finish() で確定する。
+
+    一括実行（_discover_keywords_llm）とストリーミング（pipeline.ReviewStream）の両方から使う。
+    """
+
+    def __init__(self, lexicon: KeywordLexicon, threshold: float = 1.0):
+        self.lexicon = lexicon
+        self.tracker = DiscoveryTracker(threshold=threshold)
+        self.word_sentiments: dict[str, list[str]] = defaultdict(list)
+        self.unknown: Counter[str] = Counter()
+        self.batches_total = 0
+        self.stopped = False
+
+    def should_stop(self) -> bool:
+        return self.tracker.should_stop()
+
+    async def fetch(self, batch: list[tuple[int, str, int]], label: str = "") -> dict[int, dict]:
+        return await _request_by_id("keywords", [text for _, text, _ in batch], _keyword_prompt,
+                                    KEYWORDS_SCHEMA, label=label)
+
+    def add(self, items: dict[int, dict]) -> None:
+        lexicon = self.lexicon
+        found: set[str] = set()
+        for item in items.values():
+            for w in item.get("words", []):
+                w = str(w).strip()
+                if len(w) < 2:
+                    continue
+                found.add(lexicon.resolve(w) or w)
+        # 1 バッチ内の重複は 1 票として数える
+        for w in found:
+            if lexicon.resolve(w):
+                self.word_sentiments[w].append(lexicon.sentiment(w))
+            elif w not in lexicon.rejected:
+                self.unknown[w] += 1
+        self.tracker.record({w for w in found if w not in lexicon.rejected})
+
+    async def finish(self, stats: dict | None = None) -> dict[str, list[str]]:
+        summary = self.tracker.summary(self.batches_total, self.stopped)
+        if self.stopped:
+            print(f"    🛑 新規キーワードの発見が飽和したため打ち切り"
+                  f"（{summary['batches_used']}/{self.batches_total} バッチ）")
+        print(f"    📈 発見キーワード: {summary['observed']}語 / 推定再現率 {summary['estimated_recall'] * 100:.0f}%")
+        if stats is not None:
+            stats.update(summary)
+
+        # 辞書にない表記だけをまとめて判定し、出現バッチ数ぶんの票として数える
+        for surface, canonical, sentiment in await _normalize_surfaces(list(self.unknown), self.lexicon):
+            self.word_sentiments[canonical].extend([sentiment] * self.unknown[surface])
+        return self.word_sentiments
+
+
+async def _discover_keywords_llm(reviews: list[dict], lexicon: KeywordLexicon, discovery: str = "full",
+                                 discovery_threshold: float = 1.0, stats: dict | None = None,
+                                 texts: list[str] | None = None) -> dict[str, list[str]]:
+    """口コミ本文を Gemini にバッチで渡して表現を抜き出し、辞書で代表表記・ポジネガを解決する。
+
+    adaptive モードではバッチをランダム順に処理し、新規キーワードの発見数が閾値を下回ったら停止する。
+    """
+    if discovery not in DISCOVERY_MODES:
+        raise ValueError(f"未知の発見モード: {discovery}（{' / '.join(DISCOVERY_MODES)}）")
+    state = KeywordDiscovery(lexicon, threshold=discovery_threshold)
+    batches = list(enumerate(pack_batches(_prompt_texts(reviews, texts), "keywords"), 1))
+    state.batches_total = len(batches)
+    if discovery == "adaptive":
+        random.Random(DISCOVERY_SEED).shuffle(batches)
+
+    async def request(entry):
+        n, (batch_num, batch) = entry
+        order = f"{n}番目・" if discovery == "adaptive" else ""
+        print(f"    📦 バッチ {batch_num}/{state.batches_total}（{order}{len(batch)}件・約{batch_tokens(batch):,} tokens）...")
+        return await state.fetch(batch, label=f"（バッチ {batch_num}）")
+
+    # full は全バッチを並行に、adaptive は同時実行数ぶんずつ処理して波の間で停止判定する
+    pending = list(enumerate(batches, 1))
+    while pending:
+        if discovery == "adaptive" and state.should_stop():
+            state.stopped = True
+            break
+        wave_size = _controller.limit if discovery == "adaptive" else len(pending)
+        wave, pending = pending[:wave_size], pending[wave_size:]
+        # 発見曲線が実行ごとに変わらないよう、結果は完了順ではなくバッチ順に記録する
+        for items in await _controller.map(request, wave):
+            state.add(items)
+    return await state.finish(stats)
+
+
+KEYWORDS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "words": {"type": "ARRAY", "items": {"type": "STRING"}},
+        },
+        "required": ["id", "words"],
+    },
+}
+
+
+def _keyword_prompt(texts: list[str]) -> str:
+    # 表記統一・ポジネガ判定は辞書側で行うため、ここでは表現の抜き出しだけを頼む
+    rows = "\n".join(f"[{j}] {t}" for j, t in enumerate(texts))
+    return f"""以下の飲食店口コミから、顧客心理・顧客価値を表すキーワードを抽出してください。
+
+【抽出する言葉】
+- 顧客の感情・評価・体験価値を表す言葉（例：美味しい、感動、映え、最高、残念、また来たい、コスパ、非日常、待ちすぎ、雰囲気抜群）
+- 形容詞・評価動詞・印象・満足度を表す表現を優先
+- 口コミ中の表記のまま出力する
+
+【除外する言葉】
+- 「料理」「食事」「スタッフ」「ドリンク」「席」「店内」「お店」「メニュー」「注文」「テーブル」「ランチ」「ディナー」「飲み物」「食べ物」「店員」「店舗」など、飲食店として当たり前の物・場所・人を表す一般名詞
+- 助詞・接続詞・語尾
+
+口コミ:
+{rows}
+
+出力形式（JSONのみ、口コミごとに1件、idは0始まり。該当なしは空配列）:
+[{{"id":0,"words":["キーワード"]}}]"""
+
+
+def _discover_keywords_janome(reviews: list[dict], index: KeywordIndex, lexicon: KeywordLexicon,
+                              store_name: str | None) -> dict[str, list[str]]:
+    """Janome の候補をそのままキーワードとする。
+
+    辞書にある表記は代表表記と蓄積済みのポジネガに寄せ、未知の語は出現口コミの平均評点から推定する。
+    """
+    from keyword_engine import rank_candidates
+
+    all_texts = [r.get("text", "") for r in reviews]
+    candidates = rank_candidates(all_texts, GENERIC_WORDS, store_name=store_name)
+    word_sentiments: dict[str, list[str]] = defaultdict(list)
+    for c in candidates:
+        if c["word"] in lexicon.rejected:
+            continue
+        canonical = lexicon.resolve(c["word"])
+        if canonical:
+            word_sentiments[canonical].append(lexicon.sentiment(canonical))
+            continue
+        index.add_keyword(c["word"], all_texts)
+        ratings = [float(reviews[i].get("rating") or 0) for i in index.reviews(c["word"])]
+        ratings = [x for x in ratings if x > 0]
+        avg = sum(ratings) / len(ratings) if ratings else 0
+        word_sentiments[c["word"]].append(
+            "positive" if avg >= 4 else "negative" if 0 < avg <= 3 else "neutral"
+        )
+    return word_sentiments
+
+
+async def _discover_keywords_hybrid(reviews: list[dict], lexicon: KeywordLexicon,
+                              store_name: str | None) -> dict[str, list[str]]:
+    """Janome の候補を辞書で解決し、未知の候補だけを Gemini に選別・表記統一・ポジネガ判定させる。"""
+    from keyword_engine import rank_candidates
+
+    candidates = await asyncio.to_thread(rank_candidates, [r.get("text", "") for r in reviews], GENERIC_WORDS,
+                                         store_name=store_name)
+    word_sentiments: dict[str, list[str]] = defaultdict(list)
+    unknown = []
+    for c in candidates:
+        canonical = lexicon.resolve(c["word"])
+        if canonical:
+            word_sentiments[canonical].append(lexicon.sentiment(canonical))
+        elif c["word"] not in lexicon.rejected:
+            unknown.append(c["word"])
+    print(f"    🧮 Janome 候補: {len(candidates)}語（辞書で解決: {len(candidates) - len(unknown)}語）")
+
+    for _, canonical, sentiment in await _normalize_surfaces(unknown, lexicon):
+        word_sentiments[canonical].append(sentiment)
+    return word_sentiments
+
+
+async def _normalize_surfaces(surfaces: list[str], lexicon: KeywordLexicon) -> list[tuple[str, str, str]]:
+    """辞書にない表記を Gemini で選別・代表表記化・ポジネガ判定し、辞書に登録する。
+
+    返り値は (表記, 代表表記, ポジネガ) のリスト。キーワードでないと判定された表記は除外語として記録する。
+    """
+    resolved: list[tuple[str, str, str]] = []
+    if not surfaces:
+        return resolved
+    total_batches = (len(surfaces) + NORMALIZE_BATCH - 1) // NORMALIZE_BATCH
+    print(f"    📖 辞書にない表記: {len(surfaces)}語")
+
+    async def request(i):
+        batch = surfaces[i: i + NORMALIZE_BATCH]
+        batch_num = i // NORMALIZE_BATCH + 1
+        print(f"    📦 表記判定バッチ {batch_num}/{total_batches}...")
+        return batch, await _request_by_id("keyword_normalize", batch, _normalize_prompt, NORMALIZE_SCHEMA,
+                                           label=f"（表記判定バッチ {batch_num}）")
+
+    for batch, items in await _controller.map(request, list(range(0, len(surfaces), NORMALIZE_BATCH))):
+        for k, item in items.items():
+            surface = batch[k]
+            word = str(item.get("word", "")).strip()
+            if not word or len(word) < 2 or word in GENERIC_WORDS:
+                lexicon.reject(surface)
+                continue
+            sentiment = item.get("sentiment", "neutral")
+            lexicon.record(surface, word, sentiment)
+            resolved.append((surface, lexicon.resolve(surface), sentiment))
+    return resolved
+
+
+NORMALIZE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "word": {"type": "STRING"},
+            "sentiment": {"type": "STRING", "enum": ["positive", "negative", "neutral"]},
+            "confidence": {"type": "NUMBER"},
+        },
+        "required": ["id", "word", "sentiment", "confidence"],
+    },
+}
+
+
+def _normalize_prompt(surfaces: list[str]) -> str:
+    listing = "\n".join(f"[{j}] {w}" for j, w in enumerate(surfaces))
+    return f"""以下は飲食店口コミから抽出した表現の一覧です。各表現について判定してください。
+
+【キーワードとして残す言葉】
+- 顧客の感情・評価・体験価値を表す言葉（例：美味しい、感動、映え、最高、残念、また来たい、コスパ、非日常、待ちすぎ、雰囲気抜群）
+
+【キーワードにしない言葉】（word を空文字にする）
+- 飲食店として当たり前の物・場所・人を表す一般名詞、地名、固有名詞、意味をなさない断片
+
+【統一ルール】
+- word には代表的な表記を入れる（例:「おいしい」「美味しかった」→「美味しい」）
+- 各キーワードのポジネガも判定
+- confidence には判定の確信度（0〜1）を入れる
+
+表現:
+{listing}
+
+出力形式（JSONのみ、表現ごとに1件、idは0始まり）:
+[{{"id":0,"word":"代表表記または空文字","sentiment":"positive|negative|neutral","confidence":0.9}}]"""
 
 
 # ---------------------------------------------------------------------------
 # 顧客体験価値分析
 # ---------------------------------------------------------------------------
 
-def _analyze_experience(reviews: list[dict], keywords: list[dict]) -> dict:
+_TITLED_ITEMS = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"title": {"type": "STRING"}, "description": {"type": "STRING"}},
+        "required": ["title", "description"],
+    },
+}
+EXPERIENCE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "headline": {"type": "STRING"},
+        "summary": {"type": "STRING"},
+        "strengths": _TITLED_ITEMS,
+        "weaknesses": _TITLED_ITEMS,
+    },
+    "required": ["headline", "summary", "strengths", "weaknesses"],
+}
+
+
+async def _analyze_experience(reviews: list[dict], keywords: list[dict],
+                              facets: dict[str, list[str]] | None = None) -> dict:
     print("  ✨ 顧客体験価値を分析中...")
     total = len(reviews)
 
@@ -167,19 +987,24 @@ def _analyze_experience(reviews: list[dict], keywords: list[dict]) -> dict:
     pos_summary = "、".join(f"{k['word']}({k['count']}件)" for k in pos_kws[:15])
     neg_summary = "、".join(f"{k['word']}({k['count']}件)" for k in neg_kws[:15])
 
-    # 低評価・ネガティブ口コミを優先してサンプルに含める
-    low_rated = [r for r in reviews if r.get("rating") is not None and float(r.get("rating", 5)) <= 3]
-    high_rated = [r for r in reviews if r not in low_rated]
-    # 低評価を最大15件 + 高評価から15件
-    sample = low_rated[:15] + high_rated[:15]
-    sample_text = "\n".join(f"[★{r.get('rating','?')}] {r['text'][:200]}" for r in sample)
+    # 低評価（★3以下）を優先して予算の半分を割り当て、残りを他の口コミの代表で埋める
+    facets = facets or _review_facets(reviews)
+    low = [i for i, b in enumerate(facets["rating"]) if b in ("1", "2", "3")]
+    low_set = set(low)
+    rest = [i for i in range(total) if i not in low_set]
+    budget, cap, limit = TOKEN_BUDGETS["experience"], PER_REVIEW_CAPS["experience"], MAX_ITEMS["experience"]
+    sample = _representative(reviews, low, facets, budget // 2, cap, limit // 2)
+    used = sum(min(estimate_tokens(reviews[i].get("text", "")), cap) for i in sample)
+    sample += _representative(reviews, rest, facets, budget - used, cap, limit - len(sample))
+    sample_text = "\n".join(f"[★{reviews[i].get('rating','?')}] {truncate_to_tokens(reviews[i]['text'], cap)}"
+                            for i in sample)
 
     prompt = f"""以下の飲食店口コミデータを分析し、客観的なデータに基づいて記述してください。
 
 【基本情報】総口コミ数:{total}件
 【ポジティブキーワード Top15】{pos_summary}
 【ネガティブキーワード Top15】{neg_summary}
-【代表的な口コミ（低評価優先サンプル）】
+【代表的な口コミ（低評価優先・内容の偏りを抑えたサンプル）】
 {sample_text}
 
 ## 記述ルール（厳守）
@@ -199,12 +1024,9 @@ def _analyze_experience(reviews: list[dict], keywords: list[dict]) -> dict:
 以下の形式でJSONのみ出力（前置き不要）:
 {{"headline":"20文字以内","summary":"150文字程度","strengths":[{{"title":"観点","description":"件数を含む客観的説明"}}],"weaknesses":[{{"title":"観点","description":"件数を含む客観的説明"}}]}}"""
 
-    try:
-        json_match = re.search(r"\{.*\}", _generate(prompt), re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-    except Exception as e:
-        print(f"    ⚠️ 顧客体験価値分析エラー: {e}")
+    result = await _request_object("experience", prompt, EXPERIENCE_SCHEMA, label="顧客体験価値分析")
+    if result is not None:
+        return result
     return {"headline": "分析エラー", "summary": "", "strengths": [], "weaknesses": []}
 
 
@@ -212,50 +1034,39 @@ def _analyze_experience(reviews: list[dict], keywords: list[dict]) -> dict:
 # 時系列キーワード変化分析
 # ---------------------------------------------------------------------------
 
-def _is_recent(date_str: str) -> bool | None:
-    """直近3ヶ月かどうか判定。None = 判定不能（どちらにも含めない）。"""
-    if not date_str:
-        return None
-    # 「最終編集: X か月前」などのプレフィックスを除去
-    s = re.sub(r'^最終編集[:：]\s*', '', date_str.strip())
-    # 日・時間・分・週間前 → 直近3ヶ月以内
-    if re.search(r'\d+\s*(日|時間|分|週間)前', s):
-        return True
-    # か月前 / ヶ月前 / ヵ月前
-    m = re.search(r'(\d+)\s*[かヶヵ]月前', s)
-    if m:
-        return int(m.group(1)) <= 3
-    # 年前 → それ以前
-    if re.search(r'\d+\s*年前', s):
-        return False
-    # 絶対日付
-    ym = _extract_year_month(s)
-    if ym:
-        try:
-            d = datetime.strptime(ym, "%Y-%m")
-            cutoff = datetime(2025, 11, 24)
-            return d >= cutoff
-        except Exception:
-            pass
-    return None
+TREND_KEYWORDS = 10
 
 
-def _analyze_timeseries_keywords(reviews: list[dict], all_keywords: list[dict]) -> dict:
-    """直近3ヶ月 vs それ以前のキーワード出現率を比較。"""
-    print("  📅 時系列キーワード変化を分析中...")
-    recent = [r for r in reviews if _is_recent(r.get("date", "")) is True]
-    older  = [r for r in reviews if _is_recent(r.get("date", "")) is False]
+def _analyze_trends(reviews: list[dict], index: KeywordIndex, keywords: list[dict], kando: dict,
+                    granularity: str = "month") -> dict:
+    """月別・週別のキーワード出現率・平均評点・感動スコアと変化点（索引と口コミ別スコア行列から集計）。"""
+    print(f"  📈 トレンドを集計中...（{granularity}）")
+    matrix = KandoMatrix.from_dict(kando["matrix"], len(KANDO_TYPES)) if "matrix" in kando else None
+    bits = {k["word"]: index.keywords[k["word"]] for k in keywords[:TREND_KEYWORDS] if k["word"] in index.keywords}
+    trends = build_trends([review_date_range(r) for r in reviews], [r.get("rating") for r in reviews],
+                          bits, index.size, matrix, KANDO_TYPES, granularity)
+    if trends["changes"]:
+        print(f"    ⚡ 変化点 {len(trends['changes'])}件")
+    return trends
+
+
+def _keyword_stats(index: KeywordIndex, keywords: list[dict]) -> KeywordStats:
+    """索引から時期バケット別の出現件数（増分分析で足し込める形）を取り出す。"""
+    periods = list(index.facets.get("period", {}))
+    return KeywordStats(
+        {p: index.count(period=p) for p in periods},
+        {k["word"]: {p: index.count(k["word"], period=p) for p in periods} for k in keywords},
+    )
 
-    def count_rate(word: str, review_list: list) -> tuple[int, float]:
-        c = sum(1 for r in review_list if word in r.get("text", ""))
-        rate = round(c / len(review_list) * 100, 1) if review_list else 0.0
-        return c, rate
 
+def _analyze_timeseries_keywords(stats: KeywordStats, all_keywords: list[dict]) -> dict:
+    """直近3ヶ月 vs それ以前のキーワード出現率を比較（時期バケット別の出現件数から集計）。"""
+    print("  📅 時系列キーワード変化を分析中...")
     changes = []
     for kw in all_keywords[:30]:
         word = kw["word"]
-        rc, rr = count_rate(word, recent)
-        oc, or_ = count_rate(word, older)
+        rc, rr = stats.rate(word, "recent")
+        oc, or_ = stats.rate(word, "older")
         diff = round(rr - or_, 1)
         changes.append({
             "word": word,
@@ -269,8 +1080,8 @@ def _analyze_timeseries_keywords(reviews: list[dict], all_keywords: list[dict])
 
     changes.sort(key=lambda x: abs(x["change"]), reverse=True)
     return {
-        "recent_count": len(recent),
-        "older_count": len(older),
+        "recent_count": stats.buckets.get("recent", 0),
+        "older_count": stats.buckets.get("older", 0),
         "keywords": changes,
     }
 
@@ -279,23 +1090,164 @@ def _analyze_timeseries_keywords(reviews: list[dict], all_keywords: list[dict])
 # 感動の7類型分析
 # ---------------------------------------------------------------------------
 
-KANDO_BATCH = 15
+KANDO_SAMPLE_SEED = 42
+KANDO_SCORE_TOLERANCE = 0.5  # サンプリング時、スコアの信頼区間の半幅がこれ以下なら信頼できるとみなす
+
 
-def _analyze_kando(reviews: list[dict]) -> dict:
-    """感動の7類型でスコアリングし、レーダーチャートデータを生成。"""
+async def _analyze_kando(reviews: list[dict], sample_margin: float | None = None,
+                         facets: dict[str, list[str]] | None = None,
+                         scored: dict[int, list[int]] | None = None,
+                         texts: list[str] | None = None) -> tuple[dict, KandoStats]:
+    """感動の7類型でスコアリングし、レーダーチャートデータと層別の十分統計量を返す。
+
+    sample_margin を指定すると、facets（サイト・評点・時期）から作る層で層化無作為抽出した
+    口コミだけを採点し、スコアと検出率を 95% 信頼区間付きで推定する。
+    scored（位置 → 7類型のスコア）を渡すと（ストリーミング時）、採点を省いて集計だけを行う。
+    口コミ別のスコアは行列として結果に残し、facets ごとの内訳もそこから求める。
+    texts はプロンプト用の本文（圧縮済み）。省略時は口コミ本文をそのまま使う。
+    """
     print("  🎭 感動の7類型を分析中...")
 
-    all_scores: dict[str, list[int]] = {t: [] for t in KANDO_TYPES}
-    detection: dict[str, int] = {t: 0 for t in KANDO_TYPES}
-    total_batches = (len(reviews) + KANDO_BATCH - 1) // KANDO_BATCH
+    total = len(reviews)
+    strata = _kando_strata(facets) if facets else ["all"] * total
+    targets = list(range(total))
+    if scored is None:
+        if sample_margin:
+            n = required_sample_size(total, sample_margin)
+            if n < total:
+                targets = stratified_sample(strata, n, seed=KANDO_SAMPLE_SEED)
+                print(f"    🎲 層化抽出: {total}件中 {len(targets)}件を採点（誤差目標 ±{sample_margin * 100:.0f}pt）")
+        scored = await _score_kando(reviews, targets, texts)
+    sampling = len(targets) < total
+
+    stats = KandoStats(len(KANDO_TYPES))
+    for pos, label in enumerate(strata):
+        stats.add(label, scored.get(pos))
+    matrix = KandoMatrix.from_rows([review_key(r) for r in reviews], [scored.get(pos) for pos in range(total)],
+                                   len(KANDO_TYPES))
+    result = await _summarize_kando(stats, sampling, reviews)
+    result["matrix"] = matrix.to_dict()
+    if facets:
+        result["breakdowns"] = _kando_breakdowns(matrix, facets, sampling)
+    if sampling:
+        result["sampling"] = {
+            "margin": sample_margin,
+            "sample_size": len(targets),
+            "scored": len(scored),
+            "strata": len(set(strata)),
+        }
+    return result, stats
+
+
+async def _score_kando(reviews: list[dict], targets: list[int], texts: list[str] | None = None) -> dict[int, list[int]]:
+    """targets の位置の口コミをバッチで並行に採点し、位置 → 7類型のスコアを返す。"""
+    texts = _prompt_texts(reviews, texts)
+    batches = pack_batches([texts[p] for p in targets], "kando", positions=targets)
+    total_batches = len(batches)
+
+    async def request(entry):
+        batch_num, batch = entry
+        print(f"    📦 感動分析バッチ {batch_num}/{total_batches}（{len(batch)}件・約{batch_tokens(batch):,} tokens）...")
+        return await score_kando_batch(batch, label=f"（バッチ {batch_num}）")
+
+    scored: dict[int, list[int]] = {}
+    for part in await _controller.map(request, list(enumerate(batches, 1))):
+        scored.update(part)
+    return scored
+
+
+async def _summarize_kando(stats: KandoStats, sampling: bool, reviews: list[dict],
+                           ai_comment: str | None = None) -> dict:
+    """十分統計量からスコア・検出率を求め、強み・弱みとコメントをまとめる。
+
+    ai_comment を渡すと（増分分析時）コメントを生成し直さずにそのまま使う。
+    """
+    aggregated = _aggregate_kando_sample(stats) if sampling else _aggregate_kando(stats)
+
+    sorted_types = sorted(KANDO_TYPES, key=lambda t: aggregated[t]["score"], reverse=True)
+    strengths  = sorted_types[:2]
+    weaknesses = sorted_types[-2:]
+
+    # AI コンサルコメント生成
+    if ai_comment is None:
+        comment_prompt = _kando_comment_prompt(aggregated, reviews)
+        try:
+            ai_comment = await _generate(comment_prompt, stage="kando_comment")
+        except Exception as e:
+            ai_comment = f"コメント生成エラー: {e}"
+
+    return {
+        "aggregated": aggregated,
+        "strengths": strengths,
+        "weaknesses": weaknesses,
+        "ai_comment": ai_comment,
+        "total_analyzed": stats.population,
+    }
+
+
+def _kando_stats_from_matrix(matrix: KandoMatrix, strata: list[str]) -> KandoStats:
+    """口コミ別のスコア行列から層別の十分統計量を作る（strata は口コミごとの層ラベル）。"""
+    stats = KandoStats(len(KANDO_TYPES))
+    for label, row, ok in zip(strata, matrix.scores.tolist(), matrix.scored.tolist()):
+        stats.add(label, row if ok else None)
+    return stats
+
+
+def _kando_breakdowns(matrix: KandoMatrix, facets: dict[str, list[str]], sampling: bool) -> dict:
+    """サイト別・評点別・時期別の類型スコアと検出率（口コミ別スコア行列から集計、LLM 呼び出しなし）。
+
+    全件採点時は未採点の口コミを 0 点として含め、サンプリング時は採点済みの口コミだけで平均する。
+    """
+    breakdowns = {}
+    for name in ("source", "rating", "period"):
+        groups = matrix.breakdown(facets[name], missing_as_zero=not sampling)
+        breakdowns[name] = {
+            label: {
+                "reviews": g["reviews"],
+                "scored": g["scored"],
+                "score": dict(zip(KANDO_TYPES, g["score"])),
+                "detection_rate": dict(zip(KANDO_TYPES, g["detection_rate"])),
+            }
+            for label, g in groups.items()
+        }
+    return breakdowns
+
 
-    for i in range(0, len(reviews), KANDO_BATCH):
-        batch = reviews[i: i + KANDO_BATCH]
-        batch_num = i // KANDO_BATCH + 1
-        print(f"    📦 感動分析バッチ {batch_num}/{total_batches}...")
+def _aggregate_kando(stats: KandoStats) -> dict:
+    """全件採点の集計。再リクエストでも得られなかった口コミは従来どおり 0 点として平均に含める。"""
+    total = stats.population
+    aggregated = {}
+    for k, t in enumerate(KANDO_TYPES):
+        score_sum, detected = stats.totals(k)
+        aggregated[t] = {
+            "label": KANDO_LABELS[t],
+            "score": round(score_sum / total, 2) if total else 0.0,
+            "detection_rate": round(detected / total * 100, 1) if total else 0.0,
+            "review_count": detected,
+            "is_reliable": detected >= 3,
+        }
+    return aggregated
+
+
+async def score_kando_batch(batch: list[tuple[int, str, int]], label: str = "") -> dict[int, list[int]]:
+    """1 バッチを採点し、口コミ位置 → 7類型のスコアを返す（得られなかった口コミは含めない）。"""
+    items = await _request_by_id("kando", [text for _, text, _ in batch], _kando_prompt, KANDO_SCHEMA, label=label)
+    return {batch[k][0]: [_clamp_score(item.get(t, 0)) for t in KANDO_TYPES] for k, item in items.items()}
+
+
+KANDO_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": {"type": "INTEGER"}, **{t: {"type": "INTEGER"} for t in KANDO_TYPES}},
+        "required": ["id", *KANDO_TYPES],
+    },
+}
 
-        rows = "\n".join(f"[{j}] {r['text'][:200]}" for j, r in enumerate(batch))
-        prompt = f"""以下の飲食店口コミを「感動の7類型」で評価し、JSON配列のみを出力してください。
+
+def _kando_prompt(texts: list[str]) -> str:
+    rows = "\n".join(f"[{j}] {t}" for j, t in enumerate(texts))
+    return f"""以下の飲食店口コミを「感動の7類型」で評価し、JSON配列のみを出力してください。
 
 ## 7類型（各0〜5点）
 ① threshold（しきい値突破）: 期待を超える圧倒的体験・最上級表現
@@ -314,49 +1266,18 @@ def _analyze_kando(reviews: list[dict]) -> dict:
 出力（JSON配列のみ、idは0始まり）:
 [{{"id":0,"threshold":0,"surprise":0,"resonance":0,"rescue":0,"awe":0,"participation":0,"growth":0}}]"""
 
-        try:
-            json_match = re.search(r'\[.*\]', _generate(prompt), re.DOTALL)
-            if json_match:
-                for item in json.loads(json_match.group()):
-                    idx = item.get("id", 0)
-                    if 0 <= idx < len(batch):
-                        for t in KANDO_TYPES:
-                            score = int(item.get(t, 0))
-                            all_scores[t].append(score)
-                            if score > 0:
-                                detection[t] += 1
-            time.sleep(2)
-        except Exception as e:
-            print(f"    ⚠️ エラー（バッチ {batch_num}）: {e}")
-            for _ in batch:
-                for t in KANDO_TYPES:
-                    all_scores[t].append(0)
-
-    total = len(reviews)
-    aggregated = {}
-    for t in KANDO_TYPES:
-        scores = all_scores[t]
-        avg = round(sum(scores) / len(scores), 2) if scores else 0.0
-        aggregated[t] = {
-            "label": KANDO_LABELS[t],
-            "score": avg,
-            "detection_rate": round(detection[t] / total * 100, 1) if total else 0.0,
-            "review_count": detection[t],
-            "is_reliable": detection[t] >= 3,
-        }
-
-    sorted_types = sorted(KANDO_TYPES, key=lambda t: aggregated[t]["score"], reverse=True)
-    strengths  = sorted_types[:2]
-    weaknesses = sorted_types[-2:]
 
-    # AI コンサルコメント生成
+def _kando_comment_prompt(aggregated: dict, reviews: list[dict]) -> str:
     radar_summary = "\n".join(
         f"- {aggregated[t]['label']}: {aggregated[t]['score']:.1f}/5 (検出率{aggregated[t]['detection_rate']}%)"
         for t in KANDO_TYPES
     )
-    top_reviews_text = "\n".join(f"「{r['text'][:100]}」" for r in reviews[:10] if r.get("text"))
+    cap = PER_REVIEW_CAPS["kando_comment"]
+    sample = _representative(reviews, range(len(reviews)), _review_facets(reviews),
+                             TOKEN_BUDGETS["kando_comment"], cap, MAX_ITEMS["kando_comment"])
+    top_reviews_text = "\n".join(f"「{truncate_to_tokens(reviews[i]['text'], cap)}」" for i in sample)
 
-    comment_prompt = f"""以下の口コミ分析データをもとに、感動の7類型ごとの分析結果を客観的に記述してください。
+    return f"""以下の口コミ分析データをもとに、感動の7類型ごとの分析結果を客観的に記述してください。
 
 ## 分析データ
 {radar_summary}
@@ -376,32 +1297,110 @@ def _analyze_kando(reviews: list[dict]) -> dict:
 
 分析結果テキストのみ出力（前置き不要）:"""
 
+
+def _clamp_score(value) -> int:
     try:
-        ai_comment = _generate(comment_prompt)
-    except Exception as e:
-        ai_comment = f"コメント生成エラー: {e}"
+        return max(0, min(5, int(value)))
+    except (TypeError, ValueError):
+        return 0
 
-    return {
-        "aggregated": aggregated,
-        "strengths": strengths,
-        "weaknesses": weaknesses,
-        "ai_comment": ai_comment,
-        "total_analyzed": total,
-    }
+
+def _aggregate_kando_sample(stats: KandoStats) -> dict:
+    """層化標本の採点結果から、類型ごとの平均スコアと検出率を信頼区間付きで推定する。
+
+    採点できなかった口コミは 0 点で埋めると推定が偏るため標本から外す。
+    is_reliable は「検出率の区間が 0 を含まない」かつ「スコアの区間の半幅が許容幅以下」で判定する。
+    """
+    sizes = stats.sizes()
+    total = stats.population
+    aggregated = {}
+    for k, t in enumerate(KANDO_TYPES):
+        score, score_lo, score_hi = stratified_estimate_from_moments(stats.moments(k), sizes)
+        rate, rate_lo, rate_hi = stratified_estimate_from_moments(stats.moments(k, hits=True), sizes)
+        rate_lo, rate_hi = max(rate_lo, 0.0), min(rate_hi, 1.0)
+        aggregated[t] = {
+            "label": KANDO_LABELS[t],
+            "score": round(score, 2),
+            "score_ci": [round(max(score_lo, 0.0), 2), round(min(score_hi, 5.0), 2)],
+            "detection_rate": round(rate * 100, 1),
+            "detection_rate_ci": [round(rate_lo * 100, 1), round(rate_hi * 100, 1)],
+            "review_count": round(rate * total),
+            "is_reliable": rate_lo > 0 and (score_hi - score_lo) / 2 <= KANDO_SCORE_TOLERANCE,
+        }
+    return aggregated
 
 
 # ---------------------------------------------------------------------------
 # 顧客ギャップ分析（来店前動機 vs 期待充足度）
 # ---------------------------------------------------------------------------
 
-def _analyze_gap(reviews: list[dict]) -> dict:
-    """口コミから来店前動機を抽出し、期待が充足されているかを分析する。"""
-    print("  🔍 顧客ギャップ分析中...")
+_EVIDENCE_ITEMS = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"index": {"type": "INTEGER"}, "quote": {"type": "STRING"}},
+        "required": ["index", "quote"],
+    },
+}
+GAP_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "motivations": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "title": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "evidence": _EVIDENCE_ITEMS,
+                    "satisfaction": {"type": "STRING", "enum": ["satisfied", "partial", "gap"]},
+                    "satisfaction_score": {"type": "INTEGER"},
+                    "satisfaction_desc": {"type": "STRING"},
+                    "satisfaction_evidence": _EVIDENCE_ITEMS,
+                },
+                "required": ["title", "description", "evidence", "satisfaction",
+                             "satisfaction_score", "satisfaction_desc", "satisfaction_evidence"],
+            },
+        },
+        "overall_comment": {"type": "STRING"},
+    },
+    "required": ["motivations", "overall_comment"],
+}
 
-    all_texts = "\n".join(
-        f"[{i}] {r.get('text', '')[:300]}"
-        for i, r in enumerate(reviews[:80])
-    )
+
+GAP_MODES = ("single", "mapreduce")
+# 再集計した充足率（充足 + 部分充足×0.5）/ 言及数 の判定境界
+GAP_SATISFIED_RATIO = 0.7
+GAP_GAP_RATIO = 0.4
+GAP_EVIDENCE_LIMIT = 4
+
+
+async def _analyze_gap(reviews: list[dict], mode: str = "single", texts: list[str] | None = None) -> dict:
+    """口コミから来店前動機を抽出し、期待が充足されているかを分析する。
+
+    mode="single"（既定）は予算に収まる代表的な口コミだけを 1 回で分析する従来方式。
+    mode="mapreduce" は全口コミをチャンクに分けて並行に動機・根拠・充足件数を抽出し（map）、
+    動機の統合・重複除去を 1 回で行ったうえで（reduce）、充足度を件数から再計算する。
+    呼び出しはチャンク数 + 1 回になるので、generate_v2.py --gap-mode mapreduce のように明示して使う。
+    texts はプロンプト用の本文（compression.py で圧縮済み）。省略時は口コミ本文をそのまま使う。
+    """
+    if mode not in GAP_MODES:
+        raise ValueError(f"未知のギャップ分析モード: {mode}（{' / '.join(GAP_MODES)}）")
+    print(f"  🔍 顧客ギャップ分析中...（{mode}）")
+    if mode == "single":
+        return await _analyze_gap_single(reviews, texts)
+    return await _analyze_gap_mapreduce(reviews, texts)
+
+
+async def _analyze_gap_single(reviews: list[dict], texts: list[str] | None = None) -> dict:
+    """予算に収まる代表的な口コミだけを 1 回の呼び出しで分析する。"""
+    cap = PER_REVIEW_CAPS["gap"]
+    sample = sorted(_representative(reviews, range(len(reviews)), _review_facets(reviews),
+                                    TOKEN_BUDGETS["gap"], cap, MAX_ITEMS["gap"]))
+    first = [(i, text, estimate_tokens(text))
+             for i, text in zip(sample, sample_texts(_prompt_texts(reviews, texts), sample, cap))]
+    print(f"    📦 {len(first)}/{len(reviews)}件（約{batch_tokens(first):,} tokens）")
+    all_texts = "\n".join(f"[{i}] {text}" for i, text, _ in first)
 
     prompt = f"""以下は飲食店の口コミ一覧です。
 
@@ -445,41 +1444,212 @@ def _analyze_gap(reviews: list[dict]) -> dict:
   "overall_comment": "総合コメント"
 }}"""
 
-    try:
-        response_text = _generate(prompt)
-        json_match = re.search(r"\{.*\}", response_text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-    except Exception as e:
-        print(f"    ⚠️ ギャップ分析エラー: {e}")
+    result = await _request_object("gap", prompt, GAP_SCHEMA, label="ギャップ分析")
+    if result is not None:
+        return result
     return {"motivations": [], "overall_comment": "分析エラー"}
 
 
-# ---------------------------------------------------------------------------
-# ユーティリティ
-# ---------------------------------------------------------------------------
+GAP_MAP_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "motivations": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "title": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "evidence": _EVIDENCE_ITEMS,
+                    "mention_count": {"type": "INTEGER"},
+                    "satisfied_count": {"type": "INTEGER"},
+                    "partial_count": {"type": "INTEGER"},
+                    "gap_count": {"type": "INTEGER"},
+                    "satisfaction_evidence": _EVIDENCE_ITEMS,
+                },
+                "required": ["title", "description", "evidence", "mention_count", "satisfied_count",
+                             "partial_count", "gap_count", "satisfaction_evidence"],
+            },
+        },
+    },
+    "required": ["motivations"],
+}
+GAP_REDUCE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "motivations": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "title": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "members": {"type": "ARRAY", "items": {"type": "INTEGER"}},
+                    "satisfaction_desc": {"type": "STRING"},
+                },
+                "required": ["title", "description", "members", "satisfaction_desc"],
+            },
+        },
+        "overall_comment": {"type": "STRING"},
+    },
+    "required": ["motivations", "overall_comment"],
+}
+
+
+async def _analyze_gap_mapreduce(reviews: list[dict], texts: list[str] | None = None) -> dict:
+    batches = pack_batches(_prompt_texts(reviews, texts), "gap_map")
+    total_batches = len(batches)
+
+    async def request(entry):
+        batch_num, batch = entry
+        print(f"    📦 動機抽出チャンク {batch_num}/{total_batches}（{len(batch)}件・約{batch_tokens(batch):,} tokens）...")
+        mapped = await _request_object("gap_map", _gap_map_prompt(batch), GAP_MAP_SCHEMA,
+                                       label=f"動機抽出（チャンク {batch_num}）")
+        return _clean_gap_candidates(mapped, batch)
+
+    candidates = [c for chunk in await _controller.map(request, list(enumerate(batches, 1))) for c in chunk]
+    if not candidates:
+        return {"motivations": [], "overall_comment": "分析エラー"}
+    print(f"    🧩 動機候補 {len(candidates)}件を統合中...")
+
+    merged = await _request_object("gap_reduce", _gap_reduce_prompt(candidates, len(reviews)), GAP_REDUCE_SCHEMA,
+                                   label="動機の統合")
+    if merged is None:
+        return {"motivations": [], "overall_comment": "分析エラー"}
 
-def _extract_year_month(date_str: str) -> str | None:
-    if not date_str:
-        return None
-    patterns = [
-        (r"(\d{4})[/-](\d{1,2})", lambda m: f"{m.group(1)}-{int(m.group(2)):02d}"),
-        (r"(\d{4})年\s*(\d{1,2})月", lambda m: f"{m.group(1)}-{int(m.group(2)):02d}"),
-        (
-            r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\w*\s+(\d{4})",
-            lambda m: f"{m.group(2)}-{_month_to_num(m.group(1)):02d}",
-        ),
-    ]
-    for pattern, formatter in patterns:
-        m = re.search(pattern, date_str, re.IGNORECASE)
-        if m:
+    motivations = []
+    for m in merged.get("motivations", []):
+        members = sorted({k for k in m.get("members", []) if isinstance(k, int) and 0 <= k < len(candidates)})
+        if not members:
+            continue
+        group = [candidates[k] for k in members]
+        counts = {key: sum(c[key] for c in group) for key in ("mention_count", "satisfied_count",
+                                                              "partial_count", "gap_count")}
+        satisfaction, score = _gap_satisfaction(counts)
+        motivations.append({
+            "title": m.get("title", ""),
+            "description": m.get("description", ""),
+            "evidence": _merge_evidence(c["evidence"] for c in group),
+            "satisfaction": satisfaction,
+            "satisfaction_score": score,
+            "satisfaction_desc": m.get("satisfaction_desc", ""),
+            "satisfaction_evidence": _merge_evidence(c["satisfaction_evidence"] for c in group),
+            "review_count": counts["mention_count"],
+            "satisfaction_counts": {k: counts[f"{k}_count"] for k in ("satisfied", "partial", "gap")},
+        })
+    motivations.sort(key=lambda m: -m["review_count"])
+    return {
+        "motivations": motivations,
+        "overall_comment": merged.get("overall_comment", ""),
+        "coverage": {"reviews": len(reviews), "chunks": total_batches, "candidates": len(candidates)},
+    }
+
+
+def _clean_gap_candidates(mapped: dict | None, batch: list[tuple[int, str, int]]) -> list[dict]:
+    """map 結果を検証する。根拠の index はチャンク内の実在する口コミ位置だけを残す。"""
+    if not mapped:
+        return []
+    positions = {pos for pos, _, _ in batch}
+
+    def evidence(items) -> list[dict]:
+        kept = []
+        for e in items or []:
+            index = e.get("index") if isinstance(e, dict) else None
+            if isinstance(index, int) and index in positions:
+                kept.append({"index": index, "quote": str(e.get("quote", ""))})
+        return kept
+
+    candidates = []
+    for m in mapped.get("motivations", []):
+        if not isinstance(m, dict) or not m.get("title"):
+            continue
+        counts = {}
+        for key in ("mention_count", "satisfied_count", "partial_count", "gap_count"):
             try:
-                return formatter(m)
-            except Exception:
-                continue
-    return None
+                counts[key] = max(0, min(len(batch), int(m.get(key, 0))))
+            except (TypeError, ValueError):
+                counts[key] = 0
+        candidates.append({
+            "title": str(m["title"]),
+            "description": str(m.get("description", "")),
+            "evidence": evidence(m.get("evidence")),
+            "satisfaction_evidence": evidence(m.get("satisfaction_evidence")),
+            **counts,
+        })
+    return candidates
+
+
+def _gap_satisfaction(counts: dict[str, int]) -> tuple[str, int]:
+    """充足・部分充足・ギャップの件数から充足状況と 1〜5 のスコアを再計算する。"""
+    judged = counts["satisfied_count"] + counts["partial_count"] + counts["gap_count"]
+    if not judged:
+        return "partial", 3
+    ratio = (counts["satisfied_count"] + 0.5 * counts["partial_count"]) / judged
+    score = max(1, min(5, round(1 + 4 * ratio)))
+    if ratio >= GAP_SATISFIED_RATIO:
+        return "satisfied", score
+    if ratio < GAP_GAP_RATIO:
+        return "gap", score
+    return "partial", score
+
+
+def _merge_evidence(groups) -> list[dict]:
+    """複数チャンクの根拠を口コミ位置で重複除去し、チャンクをまたいで交互に選ぶ。"""
+    groups = [list(g) for g in groups]
+    merged, seen = [], set()
+    for rank in range(max((len(g) for g in groups), default=0)):
+        for g in groups:
+            if rank < len(g) and g[rank]["index"] not in seen:
+                seen.add(g[rank]["index"])
+                merged.append(g[rank])
+                if len(merged) >= GAP_EVIDENCE_LIMIT:
+                    return merged
+    return merged
+
+
+def _gap_map_prompt(batch: list[tuple[int, str, int]]) -> str:
+    rows = "\n".join(f"[{pos}] {text}" for pos, text, _ in batch)
+    return f"""以下は飲食店の口コミの一部です（[N] は口コミ番号）。
+
+---
+{rows}
+---
+
+口コミの文脈から「来店前にどんな期待・目的を持って来たか」を推測し、この口コミ群に現れる来店動機を最大5個抽出してください。
+各動機について：
+- title: 動機のタイトル（10〜20文字）
+- description: 動機の説明（30〜50文字）
+- evidence: その動機を推測した根拠となる口コミの引用（2〜4件、口コミ番号 index と50文字以内の引用 quote）
+- mention_count: その動機が読み取れる口コミの件数
+- satisfied_count / partial_count / gap_count: そのうち期待が 充足 / 部分的に充足 / 充足されなかった 口コミの件数
+- satisfaction_evidence: 充足・不充足を示す口コミの引用（2〜4件、index と quote）
+
+index には上の口コミ番号をそのまま使うこと。主観的評価語は避け、口コミの記述に基づくこと。
+
+出力形式（JSONのみ、前置き不要）:
+{{"motivations":[{{"title":"動機タイトル","description":"動機の説明","evidence":[{{"index":数字,"quote":"引用テキスト"}}],"mention_count":数字,"satisfied_count":数字,"partial_count":数字,"gap_count":数字,"satisfaction_evidence":[{{"index":数字,"quote":"引用テキスト"}}]}}]}}"""
 
 
-def _month_to_num(abbr: str) -> int:
-    return {"jan":1,"feb":2,"mar":3,"apr":4,"may":5,"jun":6,
-            "jul":7,"aug":8,"sep":9,"oct":10,"nov":11,"dec":12}.get(abbr.lower()[:3], 1)
+def _gap_reduce_prompt(candidates: list[dict], total: int) -> str:
+    listing = "\n".join(
+        f"[{k}] {c['title']}: {c['description']}（言及{c['mention_count']}件 / 充足{c['satisfied_count']}"
+        f"・部分{c['partial_count']}・ギャップ{c['gap_count']}）"
+        for k, c in enumerate(candidates)
+    )
+    return f"""以下は飲食店の口コミ（全{total}件）をチャンクごとに分析して得た来店動機の候補です。
+同じ動機を表す候補をまとめ、主要な来店動機を3〜5個に統合してください。
+
+候補:
+{listing}
+
+各動機について：
+- title: 動機のタイトル（10〜20文字）
+- description: 動機の説明（30〜50文字）
+- members: まとめた候補の番号（[N] の N）。どの動機にも当てはまらない少数の候補は含めなくてよい
+- satisfaction_desc: まとめた候補の件数を合計し、充足状況を件数を含めて説明（40〜60文字）
+
+overall_comment には、来店動機と実体験のギャップについて、店舗の打ち出し（マーケティング）へのインサイトを含めて200文字程度で記述してください。
+主観的評価語は避け、件数に基づいた客観的な表現を使うこと。
+
+出力形式（JSONのみ、前置き不要）:
+{{"motivations":[{{"title":"動機タイトル","description":"動機の説明","members":[0],"satisfaction_desc":"充足状況の説明"}}],"overall_comment":"総合コメント"}}"""
@@ -0,0 +1,110 @@
+"""トークン予算ベースのバッチ詰めモジュール。
+
+口コミを固定件数で区切るのではなく、ステージごとのトークン予算まで詰めてプロンプトを作る。
+短い口コミが多い店舗では呼び出し回数が減り、長い口コミは 1 件あたりの上限を超えた分だけを切り詰める。
+トークン数は API を呼ばずに文字種から概算する。
+"""
+
+import math
+
+# ステージごとの口コミ部分の入力トークン予算
+TOKEN_BUDGETS = {
+    "keywords": 4000,
+    "kando": 3000,
+    "gap": 24000,
+    "gap_map": 6000,
+    "experience": 4000,
+    "kando_comment": 1200,
+}
+# 1 件あたりの上限（これを超える部分だけを切り詰める）
+PER_REVIEW_CAPS = {
+    "keywords": 400,
+    "kando": 400,
+    "gap": 300,
+    "gap_map": 300,
+    "experience": 200,
+    "kando_comment": 100,
+}
+# 出力が件数に比例して伸びるステージの 1 バッチあたり最大件数（要約ステージは代表口コミの最大件数）
+MAX_ITEMS = {
+    "keywords": 60,
+    "kando": 40,
+    "gap": 1000,
+    "gap_map": 150,
+    "experience": 30,
+    "kando_comment": 10,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算。かな・漢字は 1 文字 ≒ 1 トークン、ASCII は 4 文字 ≒ 1 トークンとみなす。"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return math.ceil((len(text) - ascii_chars) + ascii_chars / 4)
+
+
+def truncate_to_tokens(text: str, cap: int) -> str:
+    """推定トークン数が cap を超える場合だけ末尾を切り詰める。"""
+    if estimate_tokens(text) <= cap:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= cap:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+class BatchPacker:
+    """口コミを 1 件ずつ受け取り、予算いっぱいになったバッチを順に返す（ストリーミング用）。
+
+    各バッチは (元の位置, 切り詰め後テキスト, 推定トークン数) のリスト。
+    """
+
+    def __init__(self, stage: str, budget: int | None = None):
+        self.budget = budget or TOKEN_BUDGETS[stage]
+        self.cap = PER_REVIEW_CAPS[stage]
+        self.max_items = MAX_ITEMS.get(stage)
+        self.current: list[tuple[int, str, int]] = []
+        self.used = 0
+
+    def add(self, pos: int, text: str) -> list[tuple[int, str, int]] | None:
+        """1 件追加する。追加によって前のバッチが確定した場合はそれを返す。"""
+        text = truncate_to_tokens(text, self.cap)
+        # 行頭の "[N] " と改行の分も数える
+        tokens = estimate_tokens(text) + 4
+        full = None
+        if self.current and (self.used + tokens > self.budget
+                             or (self.max_items is not None and len(self.current) >= self.max_items)):
+            full = self.flush()
+        self.current.append((pos, text, tokens))
+        self.used += tokens
+        return full
+
+    def flush(self) -> list[tuple[int, str, int]] | None:
+        """詰めかけのバッチを確定して返す（空なら None）。"""
+        batch, self.current, self.used = self.current, [], 0
+        return batch or None
+
+
+def pack_batches(texts: list[str], stage: str, positions: list[int] | None = None,
+                 budget: int | None = None) -> list[list[tuple[int, str, int]]]:
+    """テキストを予算いっぱいまで順に詰めたバッチのリストを返す。
+
+    各バッチは (元の位置, 切り詰め後テキスト, 推定トークン数) のリスト。
+    positions を渡すと texts はその位置の口コミとみなす（サンプリング時など）。
+    """
+    packer = BatchPacker(stage, budget)
+    positions = positions if positions is not None else list(range(len(texts)))
+    batches = [b for pos, text in zip(positions, texts) if (b := packer.add(pos, text))]
+    last = packer.flush()
+    if last:
+        batches.append(last)
+    return batches
+
+
+def batch_tokens(batch: list[tuple[int, str, int]]) -> int:
+    return sum(tokens for _, _, tokens in batch)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""プロンプト圧縮（compression.py）の有無で、トークン数と判定結果の一致度を比較するベンチマーク。
+
+既存の分析結果（reviews_analyzed.json）の口コミから先頭 --sample 件を使い、
+元の本文と圧縮後の本文で同じステージを実行する（API を消費する）。元の本文の結果を基準とし、
+一致度は bench_models.py と同じ指標で表示する。
+
+- keywords: 口コミごとのキーワード集合の Jaccard 係数の平均
+- kando:    口コミ×類型ごとの検出有無（スコア > 0）の一致率（平均絶対誤差も併記）
+- gap:      抽出した動機テキストの文字 bigram の Jaccard 係数
+
+--dry-run では API を呼ばずに、圧縮によるトークン数の変化と除去内容だけを表示する。
+
+使用例:
+  python bench_compression.py --dry-run
+  python bench_compression.py --input reviews_analyzed_v2.json --stages keywords,kando --sample 80
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from bench_models import _agreement
+
+STAGES = ("keywords", "kando", "gap")
+
+
+async def _run_stage(stage: str, reviews: list[dict], texts: list[str]):
+    import analyzer
+    from batching import pack_batches
+
+    if stage == "keywords":
+        batch = pack_batches(texts, "keywords")[0]
+        items = await analyzer._request_by_id("keywords", [t for _, t, _ in batch], analyzer._keyword_prompt,
+                                              analyzer.KEYWORDS_SCHEMA)
+        return {k: {str(w) for w in item.get("words", [])} for k, item in items.items()}
+    if stage == "kando":
+        batch = pack_batches(texts, "kando")[0]
+        items = await analyzer._request_by_id("kando", [t for _, t, _ in batch], analyzer._kando_prompt,
+                                              analyzer.KANDO_SCHEMA)
+        return {k: [analyzer._clamp_score(item.get(t, 0)) for t in analyzer.KANDO_TYPES] for k, item in items.items()}
+    if stage == "gap":
+        result = await analyzer._analyze_gap(reviews, mode="single", texts=texts)
+        return "\n".join(f"{m.get('title', '')} {m.get('description', '')}" for m in result.get("motivations", []))
+    raise ValueError(stage)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="プロンプト圧縮の効果と精度のベンチマーク")
+    parser.add_argument("--input", default="reviews_analyzed.json", help="分析結果 JSON（reviews を含む）")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"対象ステージ（{' / '.join(STAGES)}）")
+    parser.add_argument("--sample", type=int, default=60, help="使用する口コミ件数")
+    parser.add_argument("--dry-run", action="store_true", help="API を呼ばずにトークン数だけを比較する")
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        analysis = json.load(f)
+    reviews = [r for r in analysis.get("reviews", []) if r.get("text")][:args.sample]
+    if not reviews:
+        print(f"❌ {args.input} に口コミがありません。")
+        sys.exit(1)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"❌ 未知のステージ: {', '.join(unknown)}")
+        sys.exit(1)
+
+    from compression import PromptCompressor
+
+    raw = [r["text"] for r in reviews]
+    compressor = PromptCompressor()
+    for text in raw:
+        compressor.add(text)
+    report = compressor.report()
+    removed = "、".join(f"{k} {v}件" for k, v in report["removed"].items())
+    print(f"📂 {args.input}: {len(reviews)}件")
+    print(f"🗜️ 推定トークン {report['raw_tokens']:,} → {report['tokens']:,}（-{report['reduction']}%）／ 文の除去: {removed}")
+    if args.dry_run:
+        return
+
+    import analyzer
+
+    # 比較のため、再判定（エスカレーション）は行わない
+    analyzer.ESCALATE_LOW_CONFIDENCE = False
+
+    rows = []
+    for stage in stages:
+        outputs = {}
+        for variant, texts in (("raw", raw), ("compressed", compressor.texts)):
+            start = time.perf_counter()
+            try:
+                outputs[variant] = asyncio.run(_run_stage(stage, reviews, texts))
+            except Exception as e:
+                print(f"  ⚠️ {stage} / {variant}: {e}")
+                continue
+            rows.append({"stage": stage, "variant": variant, "seconds": round(time.perf_counter() - start, 2),
+                         **_agreement(stage, outputs.get("raw", outputs[variant]), outputs[variant])})
+
+    print(f"\n{'ステージ':<12} {'本文':<12} {'時間(秒)':>6} {'一致度':>5}  備考")
+    for r in rows:
+        note = f"MAE {r['mae']}" if "mae" in r else ""
+        print(f"{r['stage']:<16} {r['variant']:<14} {r['seconds']:>8.2f} {r['agreement']:>8.3f}  {note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Janome キーワードエンジンと Gemini キーワードの速度・重なりを比較するベンチマーク。
+
+既存の分析結果（reviews_analyzed.json）に保存された Gemini のキーワードを正解とみなし、
+同じ口コミに対して Janome エンジンを実行して処理時間と上位語の一致率を表示する。
+--live を付けると Gemini 経路も実際に実行して処理時間を計測する（API を消費する）。
+
+使用例:
+  python bench_keywords.py
+  python bench_keywords.py --input reviews_analyzed_v2.json --top 30 --live
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+
+def _overlap(reference: list[str], candidate: list[str]) -> dict:
+    ref, cand = set(reference), set(candidate)
+    inter = ref & cand
+    return {
+        "common": len(inter),
+        "precision": round(len(inter) / len(cand), 3) if cand else 0.0,
+        "recall": round(len(inter) / len(ref), 3) if ref else 0.0,
+        "jaccard": round(len(inter) / len(ref | cand), 3) if ref | cand else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="キーワードエンジン比較ベンチマーク")
+    parser.add_argument("--input", default="reviews_analyzed.json", help="分析結果 JSON（reviews と keywords を含む）")
+    parser.add_argument("--top", type=int, default=30, help="比較する上位キーワード数")
+    parser.add_argument("--live", action="store_true", help="Gemini 経路も実行して計測する（API を消費）")
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        analysis = json.load(f)
+    reviews = analysis.get("reviews", [])
+    if not reviews:
+        print(f"❌ {args.input} に口コミがありません。")
+        sys.exit(1)
+
+    from analyzer import _extract_keywords, _review_facets
+    from keyword_index import KeywordIndex
+
+    def run(engine: str) -> tuple[list[str], float]:
+        index = KeywordIndex.build([r.get("text", "") for r in reviews], facets=_review_facets(reviews))
+        start = time.perf_counter()
+        kws = asyncio.run(_extract_keywords(reviews, index, engine=engine))
+        return [k["word"] for k in kws[:args.top]], time.perf_counter() - start
+
+    print(f"📂 {args.input}: {len(reviews)}件")
+    results = {"janome": run("janome")}
+    if args.live:
+        results["llm"] = run("llm")
+        results["hybrid"] = run("hybrid")
+        reference = results["llm"][0]
+    else:
+        reference = [k["word"] for k in analysis.get("keywords", [])[:args.top]]
+
+    print(f"\n📊 Gemini キーワード（上位{args.top}）との比較")
+    print(f"  {'engine':<8} {'time(s)':>8} {'common':>7} {'precision':>10} {'recall':>7} {'jaccard':>8}")
+    for engine, (words, elapsed) in results.items():
+        o = _overlap(reference, words)
+        print(f"  {engine:<8} {elapsed:>8.2f} {o['common']:>7} {o['precision']:>10} {o['recall']:>7} {o['jaccard']:>8}")
+
+    janome_words = results["janome"][0]
+    print(f"\n  共通: {'、'.join(w for w in reference if w in janome_words)}")
+    print(f"  Gemini のみ: {'、'.join(w for w in reference if w not in janome_words)}")
+    print(f"  Janome のみ: {'、'.join(w for w in janome_words if w not in reference)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""ステージごとにモデルを切り替えて、応答時間と基準モデルとの一致度を比較するベンチマーク。
+
+既存の分析結果（reviews_analyzed.json）の口コミから先頭 --sample 件を使い、
+--models の各モデルで同じステージを実行する（API を消費する）。先頭のモデルを基準とし、
+一致度は次の指標で表示する。
+
+- keywords:       口コミごとのキーワード集合の Jaccard 係数の平均
+- kando:          口コミ×類型ごとの検出有無（スコア > 0）の一致率（平均絶対誤差も併記）
+- experience / kando_comment / gap: 出力テキストの文字 bigram の Jaccard 係数
+
+使用例:
+  python bench_models.py
+  python bench_models.py --input reviews_analyzed_v2.json --models gemini-2.5-flash,gemini-2.5-flash-lite --stages keywords,kando
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+STAGES = ("keywords", "kando", "experience", "kando_comment", "gap")
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def _bigrams(text: str) -> set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+async def _run_stage(stage: str, reviews: list[dict], analysis: dict):
+    import analyzer
+    from batching import pack_batches
+
+    texts = [r.get("text", "") for r in reviews]
+    if stage == "keywords":
+        batch = pack_batches(texts, "keywords")[0]
+        items = await analyzer._request_by_id("keywords", [t for _, t, _ in batch], analyzer._keyword_prompt,
+                                              analyzer.KEYWORDS_SCHEMA)
+        return {k: {str(w) for w in item.get("words", [])} for k, item in items.items()}
+    if stage == "kando":
+        batch = pack_batches(texts, "kando")[0]
+        items = await analyzer._request_by_id("kando", [t for _, t, _ in batch], analyzer._kando_prompt,
+                                              analyzer.KANDO_SCHEMA)
+        return {k: [analyzer._clamp_score(item.get(t, 0)) for t in analyzer.KANDO_TYPES] for k, item in items.items()}
+    if stage == "experience":
+        result = await analyzer._analyze_experience(reviews, analysis.get("keywords", []))
+        parts = [result.get("headline", ""), result.get("summary", "")]
+        parts += [i.get("title", "") for i in result.get("strengths", []) + result.get("weaknesses", [])]
+        return "\n".join(parts)
+    if stage == "kando_comment":
+        aggregated = analysis.get("kando", {}).get("aggregated")
+        if not aggregated:
+            return ""
+        return await analyzer._generate(analyzer._kando_comment_prompt(aggregated, reviews), stage="kando_comment")
+    if stage == "gap":
+        result = await analyzer._analyze_gap(reviews, mode="single")
+        return "\n".join(f"{m.get('title', '')} {m.get('description', '')}" for m in result.get("motivations", []))
+    raise ValueError(stage)
+
+
+def _agreement(stage: str, reference, candidate) -> dict:
+    if stage == "keywords":
+        common = reference.keys() & candidate.keys()
+        scores = [_jaccard(reference[k], candidate[k]) for k in common]
+        return {"agreement": round(sum(scores) / len(scores), 3) if scores else 0.0}
+    if stage == "kando":
+        pairs = [(a, b) for k in reference.keys() & candidate.keys() for a, b in zip(reference[k], candidate[k])]
+        if not pairs:
+            return {"agreement": 0.0}
+        return {
+            "agreement": round(sum((a > 0) == (b > 0) for a, b in pairs) / len(pairs), 3),
+            "mae": round(sum(abs(a - b) for a, b in pairs) / len(pairs), 2),
+        }
+    return {"agreement": round(_jaccard(_bigrams(reference), _bigrams(candidate)), 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ステージ別モデル比較ベンチマーク")
+    parser.add_argument("--input", default="reviews_analyzed.json", help="分析結果 JSON（reviews を含む）")
+    parser.add_argument("--models", default="gemini-2.5-flash,gemini-2.5-flash-lite",
+                        help="比較するモデル（カンマ区切り、先頭が基準）")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"対象ステージ（{' / '.join(STAGES)}）")
+    parser.add_argument("--sample", type=int, default=60, help="使用する口コミ件数")
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        analysis = json.load(f)
+    reviews = [r for r in analysis.get("reviews", []) if r.get("text")][:args.sample]
+    if not reviews:
+        print(f"❌ {args.input} に口コミがありません。")
+        sys.exit(1)
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"❌ 未知のステージ: {', '.join(unknown)}")
+        sys.exit(1)
+
+    import analyzer
+
+    # 比較のため、再判定（エスカレーション）は行わない
+    analyzer.ESCALATE_LOW_CONFIDENCE = False
+    print(f"📂 {args.input}: {len(reviews)}件 / 基準モデル {models[0]}")
+
+    rows = []
+    for stage in stages:
+        reference = None
+        for model in models:
+            analyzer.STAGE_MODELS[stage] = model
+            start = time.perf_counter()
+            try:
+                output = asyncio.run(_run_stage(stage, reviews, analysis))
+            except Exception as e:
+                print(f"  ⚠️ {stage} / {model}: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = output
+            rows.append({"stage": stage, "model": model, "seconds": round(elapsed, 2),
+                         **_agreement(stage, reference, output)})
+
+    print(f"\n{'ステージ':<12} {'モデル':<25} {'時間(秒)':>6} {'一致度':>5}  備考")
+    for r in rows:
+        note = f"MAE {r['mae']}" if "mae" in r else ""
+        print(f"{r['stage']:<16} {r['model']:<28} {r['seconds']:>8.2f} {r['agreement']:>8.3f}  {note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""合成口コミコーパスで analyze_reviews と generate_report の規模特性を測るベンチマーク。
+
+--sizes の件数ごとに日本語の合成口コミ（評点・サイト・日付付き、一部は別サイトへの転載）を作り、
+Gemini の代わりに決定的なローカルのモック（mock_backend.MockBackend）で分析してからレポートを生成する（API は使わない）。
+件数ごとに別プロセスで実行し、次の値を記録する。
+
+- 分析・レポート生成の所要時間、最大 RSS、レポート HTML のサイズ
+- ステージごとの LLM 呼び出し回数と再試行回数
+- 分析処理・分析ステージ・レポートの区間ごとの時間（profiler.py の集計）
+
+モックは応答までに --latency 秒前後待ち、--error-rate / --rate-limit-rate の割合で一時エラー /
+レート制限を返す（プロンプトと試行回数から決まるので、同じ設定なら毎回同じ呼び出しが失敗する）。
+再試行の待ち時間の基準（LLMController.base_delay）は --latency に合わせる。
+クォータ（llm_scheduler の RPM / TPM）は既定では無制限にする。--real-quota で実際の上限を使う。
+
+--output に結果を保存し、次回 --baseline に渡すと前回との比（時間・RSS・HTML サイズ・呼び出し回数）を表示する。
+
+使用例:
+  python bench_scale.py --sizes 100,1000
+  python bench_scale.py --latency 0.2 --error-rate 0.05 --output bench_scale.json
+  python bench_scale.py --sizes 10000 --baseline bench_scale.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_backend import UNLIMITED_QUOTA, MockBackend, synthetic_reviews
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000)
+SPAN_CATEGORIES = ("analysis", "stage", "report")
+
+# ---------------------------------------------------------------------------
+# 計測
+# ---------------------------------------------------------------------------
+
+def run_size(n: int, args: argparse.Namespace) -> dict:
+    """n 件のコーパスを分析してレポートを生成し、計測結果を返す（作業ディレクトリは一時ディレクトリ）。"""
+    if not args.real_quota:
+        os.environ["GEMINI_RPM"] = UNLIMITED_QUOTA
+        os.environ["GEMINI_TPM"] = UNLIMITED_QUOTA
+    os.environ.setdefault("GEMINI_API_KEY", "mock")
+    import analyzer
+    from profiler import profiler
+    from reporter import generate_report
+
+    analyzer._client = MockBackend(args.latency, args.error_rate, args.rate_limit_rate)
+    analyzer._models_checked = True
+    analyzer._controller.base_delay = max(args.latency, 0.01)
+
+    reviews = synthetic_reviews(n, args.seed)
+    log = io.StringIO()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(log):
+        # キーワード辞書とステージキャッシュは一時ディレクトリに作る（毎回全ステージを計算する）
+        os.chdir(workdir)
+        start = time.perf_counter()
+        analysis = analyzer.analyze_reviews(reviews, include_gap=not args.no_gap, gap_mode="mapreduce",
+                                            kando_margin=args.kando_margin)
+        analyzed = time.perf_counter()
+        path = generate_report("ベンチマーク食堂", analysis, output_path="report.html", open_browser=False)
+        reported = time.perf_counter()
+        html_bytes = os.path.getsize(path)
+        os.chdir(cwd)
+
+    controller = analysis["llm_controller"]
+    return {
+        "reviews": n,
+        "analyzed": len(analysis["reviews"]),
+        "analyze_sec": round(analyzed - start, 3),
+        "report_sec": round(reported - analyzed, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "html_kb": round(html_bytes / 1024, 1),
+        "calls": {stage: u["calls"] for stage, u in analysis["token_usage"].items()},
+        "retries": controller["retries"],
+        "spans": {f"{g['category']}:{g['name']}": round(g["total_sec"], 3) for g in profiler.summary()
+                  if g["category"] in SPAN_CATEGORIES},
+    }
+
+
+def _worker_args(args: argparse.Namespace) -> list[str]:
+    argv = ["--latency", str(args.latency), "--error-rate", str(args.error_rate),
+            "--rate-limit-rate", str(args.rate_limit_rate), "--seed", str(args.seed)]
+    if args.kando_margin is not None:
+        argv += ["--kando-margin", str(args.kando_margin)]
+    if args.no_gap:
+        argv.append("--no-gap")
+    if args.real_quota:
+        argv.append("--real-quota")
+    return argv
+
+
+def _ratio(now: float, before: float | None) -> str:
+    return f"×{now / before:.2f}" if before else "-"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="合成コーパスとモック LLM による分析・レポート生成の規模ベンチマーク")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="口コミ件数（カンマ区切り）")
+    parser.add_argument("--latency", type=float, default=0.05, help="モックの平均応答時間（秒）")
+    parser.add_argument("--error-rate", dest="error_rate", type=float, default=0.0, help="一時エラー（503）の割合")
+    parser.add_argument("--rate-limit-rate", dest="rate_limit_rate", type=float, default=0.0,
+                        help="レート制限（429）の割合")
+    parser.add_argument("--kando-margin", dest="kando_margin", type=float, default=None,
+                        help="感動分析の層化抽出の誤差目標（省略時は全件採点）")
+    parser.add_argument("--no-gap", dest="no_gap", action="store_true", help="ギャップ分析を行わない")
+    parser.add_argument("--real-quota", dest="real_quota", action="store_true",
+                        help="llm_scheduler の実際の RPM / TPM 上限で流量を制限する")
+    parser.add_argument("--seed", type=int, default=42, help="コーパス生成の乱数シード")
+    parser.add_argument("--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果 JSON（--output で保存したもの）")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)  # 件数ごとの子プロセス用
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_size(args.worker, args), ensure_ascii=False))
+        return
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {r["reviews"]: r for r in json.load(f)}
+
+    results = []
+    for n in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"⏳ {n:,}件を分析中...")
+        # 最大 RSS を件数ごとに測るため、子プロセスで実行する
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), *_worker_args(args), "--worker", str(n)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"  ❌ 失敗しました:\n{proc.stderr[-2000:]}")
+            sys.exit(1)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        calls = sum(result["calls"].values())
+        print(f"  ✅ 分析 {result['analyze_sec']:.2f}秒 / レポート {result['report_sec']:.2f}秒 / "
+              f"最大RSS {result['peak_rss_mb']:.0f}MB / LLM {calls:,}回（再試行 {result['retries']}回）")
+
+    print(f"\n{'件数':>8} {'分析(秒)':>8} {'レポート(秒)':>9} {'最大RSS(MB)':>10} {'HTML(KB)':>9} {'LLM回数':>7}")
+    for r in results:
+        print(f"{r['reviews']:>10,} {r['analyze_sec']:>10.2f} {r['report_sec']:>13.2f} {r['peak_rss_mb']:>13.1f} "
+              f"{r['html_kb']:>10.1f} {sum(r['calls'].values()):>10,}")
+
+    stages = sorted({s for r in results for s in r["calls"]})
+    print("\n📞 ステージ別の LLM 呼び出し回数")
+    print(f"{'件数':>8} " + " ".join(f"{s:>17}" for s in stages))
+    for r in results:
+        print(f"{r['reviews']:>10,} " + " ".join(f"{r['calls'].get(s, 0):>17,}" for s in stages))
+
+    spans = sorted({s for r in results for s in r["spans"]}, key=lambda s: -results[-1]["spans"].get(s, 0))
+    print("\n⏱️ 区間別の時間（秒、最大件数での降順）")
+    for name in spans:
+        print(f"  {name:<26} " + " ".join(f"{r['spans'].get(name, 0):>9.3f}" for r in results))
+
+    if baseline:
+        print(f"\n📊 前回（{args.baseline}）との比")
+        print(f"{'件数':>8} {'分析':>8} {'レポート':>8} {'最大RSS':>8} {'HTML':>8} {'LLM回数':>7}")
+        for r in results:
+            b = baseline.get(r["reviews"])
+            if not b:
+                continue
+            print(f"{r['reviews']:>10,} {_ratio(r['analyze_sec'], b['analyze_sec']):>10} "
+                  f"{_ratio(r['report_sec'], b['report_sec']):>12} {_ratio(r['peak_rss_mb'], b['peak_rss_mb']):>11} "
+                  f"{_ratio(r['html_kb'], b['html_kb']):>10} "
+                  f"{_ratio(sum(r['calls'].values()), sum(b['calls'].values())):>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 結果を {args.output} に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""LLM に渡す口コミ本文の圧縮モジュール。
+
+キーワード抽出・感動採点・ギャップ分析のバッチには、判定に寄与しない部分を削った本文を渡す。
+元の本文（出現件数の集計・レポート表示に使う）は変えない。
+
+- 定型文: 「もっと見る」「(Google による翻訳)」などサイトが付ける文言と URL
+- 絵文字・装飾記号（★☆ は評点の言及に使われるので残す）
+- 繰り返し: 「！！！」「。。。」「www」「笑笑笑」→ 1 つ、同じ文字（数字と ★☆ を除く）の 4 連続以上 → 3 つ、
+  改行 → 空白
+- 口コミ内で重複する文
+- 複数の口コミに繰り返し現れる文: SHARED_MIN_CHARS 文字以上の文が、先行する SHARED_KEEP 件の口コミに
+  既に出ていれば削る（店舗の定型紹介文のコピーなど）。口コミの到着順で決まるので、
+  一括分析とストリーミングで結果が変わらない。
+
+圧縮の前後のトークン数（推定）は report() で確認できる（analysis["compression"]）。
+"""
+
+import re
+
+from batching import estimate_tokens
+
+SHARED_MIN_CHARS = 12
+SHARED_KEEP = 2
+
+_BOILERPLATE = re.compile(
+    r"https?://\S+"
+    r"|[(（]\s*(?:Google\s*による翻訳|Translated by Google|原文|Original)\s*[)）]"
+    r"|もっと見る|続きを読む|全文を表示|原文を表示|詳細を表示|Read more|Show more",
+    re.IGNORECASE,
+)
+_EMOJI = re.compile(r"[\U0001F000-\U0001FAFF\u2600-\u2604\u2607-\u27BF\u2B00-\u2BFF\uFE0E\uFE0F\u200D\u20E3]+")
+_REPEATED_MARK = re.compile(r"([!?！？。、,.…~〜・wｗ笑♪])\1+")
+_REPEATED_CHAR = re.compile(r"([^\d★☆])\1{3,}")
+_NEWLINES = re.compile(r"\s*\n\s*")
+_SPACES = re.compile(r"[ \t　]{2,}")
+_SENTENCE_END = re.compile(r"(?<=[。!?！？])")
+_SENTENCE_KEY = re.compile(r"[\s。、!?！？,.…・「」『』()（）]")
+
+
+def compress_text(text: str) -> str:
+    """1 件の本文に定型文・絵文字・繰り返しの除去をかける（文単位の重複除去は PromptCompressor で行う）。"""
+    text = _BOILERPLATE.sub("", text)
+    text = _EMOJI.sub("", text)
+    text = _REPEATED_MARK.sub(r"\1", text)
+    text = _REPEATED_CHAR.sub(r"\1\1\1", text)
+    text = _NEWLINES.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+class PromptCompressor:
+    """口コミを到着順に圧縮し、プロンプト用の本文（texts）と削減量を記録する。"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.texts: list[str] = []
+        self.raw_tokens = 0
+        self.tokens = 0
+        self.removed = {"duplicate_sentences": 0, "shared_sentences": 0}
+        self._shared: dict[str, int] = {}  # 文 → 出現した口コミ数
+
+    def add(self, text: str) -> str:
+        """本文を圧縮して texts に追加し、圧縮後の本文を返す。"""
+        text = text or ""
+        out = self._compress(text) if self.enabled else text
+        self.texts.append(out)
+        self.raw_tokens += estimate_tokens(text)
+        self.tokens += estimate_tokens(out)
+        return out
+
+    def _compress(self, text: str) -> str:
+        sentences = [s for s in _SENTENCE_END.split(compress_text(text)) if s.strip()]
+        kept, seen = [], set()
+        for s in sentences:
+            key = _SENTENCE_KEY.sub("", s)
+            if key in seen:
+                self.removed["duplicate_sentences"] += 1
+                continue
+            seen.add(key)
+            if len(key) >= SHARED_MIN_CHARS:
+                count = self._shared.get(key, 0)
+                self._shared[key] = count + 1
+                if count >= SHARED_KEEP:
+                    self.removed["shared_sentences"] += 1
+                    continue
+            kept.append(s)
+        # 全文が他の口コミと共通なら、その口コミの判定材料がなくなるので残す
+        return "".join(kept or sentences).strip()
+
+    def report(self) -> dict:
+        reduction = (1 - self.tokens / self.raw_tokens) * 100 if self.raw_tokens else 0.0
+        return {
+            "enabled": self.enabled,
+            "reviews": len(self.texts),
+            "raw_tokens": self.raw_tokens,
+            "tokens": self.tokens,
+            "reduction": round(reduction, 1),
+            "removed": dict(self.removed),
+        }
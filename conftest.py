@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+
+@pytest.fixture
+def mock_llm(monkeypatch, tmp_path):
+    """analyzer の Gemini クライアントを MockBackend に差し替える（応答待ちなし・クォータ無制限）。
+
+    キーワード辞書・DF・ステージキャッシュは一時ディレクトリに作る。差し替えたモックを返す。
+    """
+    import analyzer
+    from mock_backend import UNLIMITED_QUOTA, MockBackend
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMINI_RPM", UNLIMITED_QUOTA)
+    monkeypatch.setenv("GEMINI_TPM", UNLIMITED_QUOTA)
+    backend = MockBackend(latency=0)
+    monkeypatch.setattr(analyzer, "_client", backend)
+    monkeypatch.setattr(analyzer, "_models_checked", True)
+    return backend
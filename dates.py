@@ -0,0 +1,127 @@
+"""口コミの日付正規化モジュール。
+
+サイトごとの自由形式の日付（「2 週間前」「最終編集: 3 か月前」「2024年5月」「2024/05訪問」など）を、
+取得時刻（scraped_at）を基準に絶対日付の範囲へ一度だけ変換する。範囲は date.toordinal() の
+整数 [最早, 最遅] で持つので、直近3ヶ月の判定や月別・週別の集計は整数の比較だけで済む。
+
+相対表記の範囲は「N か月前」= 取得日の N+1 か月前の翌日〜N か月前、のように幅を持たせる。
+取得時刻のない口コミ（古い reviews_raw.json など）は分析日を基準にする。
+"""
+
+import calendar
+import re
+from datetime import date, datetime
+
+RECENT_MONTHS = 3
+
+_EDITED_PREFIX = re.compile(r"^最終編集[:：]\s*")
+_JUST_NOW = re.compile(r"(\d+\s*(秒|分|時間)前|たった今|今日|just now|today|(\d+|an?)\s*(second|minute|hour)s?\s+ago)",
+                       re.IGNORECASE)
+_YESTERDAY = re.compile(r"昨日|yesterday", re.IGNORECASE)
+_RELATIVE = re.compile(r"(\d+)\s*(日|週間|[かヶヵカケ]月|年)前")
+_RELATIVE_EN = re.compile(r"(\d+|an?)\s*(day|week|month|year)s?\s+ago", re.IGNORECASE)
+_YMD = re.compile(r"(\d{4})\s*[/\-年.]\s*(\d{1,2})\s*[/\-月.]\s*(\d{1,2})")
+_YM = re.compile(r"(\d{4})\s*[/\-年.]\s*(\d{1,2})(?!\d)")
+_MONTH_NAME_Y = re.compile(r"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\w*\.?\s+(\d{4})", re.IGNORECASE)
+_YEAR = re.compile(r"(\d{4})\s*年")
+_MONTH_NAMES = {m.lower(): i for i, m in enumerate(calendar.month_abbr) if m}
+_UNIT_EN = {"day": "日", "week": "週間", "month": "か月", "year": "年"}
+
+
+def add_months(day: date, n: int) -> date:
+    """n か月後（負なら前）の同じ日。月末を超える日は月末に丸める。"""
+    y, m = divmod(day.month - 1 + n, 12)
+    year, month = day.year + y, m + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def anchor_date(review: dict) -> date:
+    """相対表記の基準日（取得時刻の日付、なければ今日）。"""
+    scraped_at = review.get("scraped_at")
+    if scraped_at:
+        try:
+            return datetime.fromisoformat(scraped_at).date()
+        except ValueError:
+            pass
+    return date.today()
+
+
+def resolve_date_range(text: str, anchor: date) -> tuple[int, int] | None:
+    """日付表記を [最早, 最遅] の序数（date.toordinal）に変換する。解釈できなければ None。"""
+    if not text:
+        return None
+    s = _EDITED_PREFIX.sub("", text.strip())
+    a = anchor.toordinal()
+
+    if _JUST_NOW.search(s):
+        return a, a
+    if _YESTERDAY.search(s):
+        return a - 1, a - 1
+    m = _RELATIVE.search(s)
+    if m:
+        return _relative_range(anchor, int(m.group(1)), m.group(2))
+    m = _RELATIVE_EN.search(s)
+    if m:
+        n = 1 if m.group(1).lower() in ("a", "an") else int(m.group(1))
+        return _relative_range(anchor, n, _UNIT_EN[m.group(2).lower()])
+
+    m = _YMD.search(s)
+    if m:
+        try:
+            d = date(int(m.group(1)), int(m.group(2)), int(m.group(3))).toordinal()
+            return d, d
+        except ValueError:
+            pass
+    m = _YM.search(s)
+    if m:
+        return _month_range(int(m.group(1)), int(m.group(2)))
+    m = _MONTH_NAME_Y.search(s)
+    if m:
+        return _month_range(int(m.group(2)), _MONTH_NAMES[m.group(1).lower()[:3]])
+    m = _YEAR.search(s)
+    if m:
+        year = int(m.group(1))
+        return date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal()
+    return None
+
+
+def review_date_range(review: dict) -> tuple[int, int] | None:
+    """口コミの日付範囲。取り込み時に正規化済み（date_range あり）ならそれを使う。"""
+    if "date_range" in review:
+        r = review["date_range"]
+        return (r[0], r[1]) if r else None
+    return resolve_date_range(review.get("date", ""), anchor_date(review))
+
+
+def reference_day(reviews: list[dict]) -> int:
+    """「直近」の基準日（最も新しい取得日、なければ今日）の序数。"""
+    return max((anchor_date(r).toordinal() for r in reviews if r.get("scraped_at")),
+               default=date.today().toordinal())
+
+
+def recent_cutoff(reference: int, months: int = RECENT_MONTHS) -> int:
+    return add_months(date.fromordinal(reference), -months).toordinal()
+
+
+def period_of(date_range: tuple[int, int] | None, cutoff: int) -> str:
+    """"recent"（範囲の最遅日が cutoff 以降）/ "older" / "unknown"。"""
+    if date_range is None:
+        return "unknown"
+    return "recent" if date_range[1] >= cutoff else "older"
+
+
+def _relative_range(anchor: date, n: int, unit: str) -> tuple[int, int]:
+    a = anchor.toordinal()
+    if unit == "日":
+        return a - n, a - n
+    if unit == "週間":
+        return a - 7 * n - 6, a - 7 * n
+    months = n if unit != "年" else 12 * n
+    span = 1 if unit != "年" else 12
+    return add_months(anchor, -(months + span)).toordinal() + 1, add_months(anchor, -months).toordinal()
+
+
+def _month_range(year: int, month: int) -> tuple[int, int] | None:
+    if not 1 <= month <= 12:
+        return None
+    return date(year, month, 1).toordinal(), date(year, month, calendar.monthrange(year, month)[1]).toordinal()
@@ -0,0 +1,147 @@
+"""口コミの近似重複検出モジュール（MinHash + LSH）。
+
+同じ口コミが Google マップと TripAdvisor に投稿されていたり、編集（「最終編集」）で
+少しだけ変わった本文が再取得されたりすると、キーワード件数が水増しされ LLM の呼び出しも増える。
+ここでは本文の文字 SHINGLE_CHARS-gram 集合の Jaccard 類似度で近似重複を判定する。
+
+- 各口コミの shingle 集合から NUM_PERM 個の MinHash 署名を作り、BANDS 個の帯に分けて
+  帯ごとのハッシュ表（LSH）に登録する。同じ帯の値を持つ口コミだけを候補として比べるので、
+  口コミ数が数万件でも全ペア比較にならない。
+- 候補は 1 件につき 1 回だけ、まず署名の一致率（Jaccard の推定値）で絞り、推定値が
+  SIMILARITY_THRESHOLD - ESTIMATE_MARGIN 以上のものだけを推定値の高い順に shingle 集合の正確な
+  Jaccard 類似度で比べ、SIMILARITY_THRESHOLD 以上なら重複とする。
+- 定型文の多い口コミ群では同じ帯の値を持つ口コミが膨らむので、帯ごとのバケットに登録する代表は
+  MAX_BUCKET 件までとする（真の重複は多くの帯で一致するので、他の帯で候補になる）。
+- 先に登録された口コミを代表とし、後から来た重複には dup_of（代表の review_key）を付けて
+  LLM ステージと集計から外す。登録順で決まるので、一括分析・ストリーミング・増分分析で同じ結果になる。
+- 本文が MIN_CHARS 文字未満の口コミ（「美味しかった」など）は別人の投稿でも一致しやすいので対象外。
+"""
+
+import re
+
+import numpy as np
+
+from incremental import review_key
+
+SHINGLE_CHARS = 3
+NUM_PERM = 128
+BANDS = 32  # 帯あたり 4 行。Jaccard 0.6 の組が候補になる確率は約 99%
+SIMILARITY_THRESHOLD = 0.6
+ESTIMATE_MARGIN = 0.15  # 推定値の標準誤差（128 個で約 0.04）の 3 倍強。これより低い候補は正確に比べない
+MAX_BUCKET = 64
+MIN_CHARS = 20
+
+_SPACES = re.compile(r"\s+")
+_GRAM_BASE = np.uint64(0x110000)  # Unicode のコードポイント数。k ≤ 3 なら k-gram がそのまま一意な整数になる
+_rng = np.random.default_rng(20240501)
+_A = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str, k: int = SHINGLE_CHARS) -> np.ndarray:
+    """空白を除いた本文の文字 k-gram のハッシュ（昇順・重複なし）。"""
+    codes = np.frombuffer(_SPACES.sub("", text).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < k:
+        return np.empty(0, dtype=np.uint64)
+    grams = codes[:len(codes) - k + 1].copy()
+    for i in range(1, k):
+        grams = grams * _GRAM_BASE + codes[i:len(codes) - k + 1 + i]
+    return np.unique(grams)
+
+
+def minhash(shingle_hashes: np.ndarray) -> np.ndarray:
+    """MinHash 署名（NUM_PERM 個）。ハッシュ族は multiply-shift（(a·x + b) mod 2^64 の上位 32 ビット）。"""
+    values = (_A[:, None] * shingle_hashes[None, :] + _B[:, None]) >> np.uint64(32)
+    return values.min(axis=1).astype(np.uint32)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    inter = len(np.intersect1d(a, b, assume_unique=True))
+    union = len(a) + len(b) - inter
+    return inter / union if union else 0.0
+
+
+class NearDuplicateIndex:
+    """代表口コミの LSH 索引。add() で 1 件ずつ照合・登録する。"""
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // BANDS
+        self.tables: list[dict[bytes, list[int]]] = [{} for _ in range(BANDS)]
+        self.keys: list[str] = []
+        self.shingles: list[np.ndarray] = []
+        self.signatures = np.empty((0, NUM_PERM), dtype=np.uint32)  # 先頭 len(self) 行が有効（容量は倍々で確保）
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, text: str) -> str | None:
+        """本文を照合し、近似重複なら代表のキーを返す（登録しない）。重複でなければ登録して None。"""
+        if len(text) < MIN_CHARS:
+            return None
+        sh = shingles(text)
+        if not len(sh):
+            return None
+        signature = minhash(sh)
+        bands = [signature[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(BANDS)]
+
+        candidates: set[int] = set()
+        for table, band in zip(self.tables, bands):
+            candidates.update(table.get(band, ()))
+        if candidates:
+            ids = np.array(sorted(candidates))
+            estimates = (self.signatures[ids] == signature).mean(axis=1)
+            # 推定値の高い順（同じなら先に登録された代表から）
+            for i in np.argsort(-estimates, kind="stable"):
+                if estimates[i] < self.threshold - ESTIMATE_MARGIN:
+                    break
+                if jaccard(sh, self.shingles[ids[i]]) >= self.threshold:
+                    return self.keys[ids[i]]
+
+        pos = len(self.keys)
+        self.keys.append(key)
+        self.shingles.append(sh)
+        if pos == len(self.signatures):
+            grown = np.empty((max(64, 2 * pos), NUM_PERM), dtype=np.uint32)
+            grown[:pos] = self.signatures
+            self.signatures = grown
+        self.signatures[pos] = signature
+        for table, band in zip(self.tables, bands):
+            bucket = table.setdefault(band, [])
+            if len(bucket) < MAX_BUCKET:
+                bucket.append(pos)
+        return None
+
+    def mark(self, review: dict) -> bool:
+        """口コミを照合し、重複なら dup_of（代表の review_key）を付けて True。代表なら登録して False。"""
+        dup_of = self.add(review_key(review), review.get("text", ""))
+        if dup_of is None:
+            review.pop("dup_of", None)
+            return False
+        review["dup_of"] = dup_of
+        return True
+
+
+def split_duplicates(reviews: list[dict], index: NearDuplicateIndex | None = None) -> tuple[list[dict], list[dict]]:
+    """口コミを (代表, 重複) に分ける。index に既存の代表を登録済みの索引を渡すと、それらとも照合する。"""
+    index = index or NearDuplicateIndex()
+    canonical, duplicates = [], []
+    for r in reviews:
+        (duplicates if index.mark(r) else canonical).append(r)
+    return canonical, duplicates
+
+
+def summarize_duplicates(duplicates: list[dict], previous: dict | None = None) -> dict:
+    """重複口コミの集計（analysis["duplicates"]）。previous（前回の集計）があれば足し込む。
+
+    keys（重複の review_key）は増分分析で既知の口コミとして扱う。canonical は代表の review_key。
+    """
+    previous = previous or {}
+    by_source = dict(previous.get("by_source", {}))
+    for r in duplicates:
+        src = r.get("source", "unknown")
+        by_source[src] = by_source.get(src, 0) + 1
+    keys = previous.get("keys", []) + [review_key(r) for r in duplicates]
+    canonical = sorted(set(previous.get("canonical", [])) | {r["dup_of"] for r in duplicates})
+    return {"count": len(keys), "clusters": len(canonical), "by_source": by_source,
+            "keys": keys, "canonical": canonical}
@@ -0,0 +1,63 @@
+"""キーワード発見の飽和判定モジュール。
+
+バッチごとに「新しく見つかったキーワード数」（発見曲線）を記録し、
+直近の発見数が閾値を下回ったら LLM による発見を打ち切る。
+打ち切り時点での取りこぼしは、バッチを標本単位とした Chao2 推定量で見積もる。
+"""
+
+from collections import Counter
+
+
+class DiscoveryTracker:
+    """発見曲線の記録と停止判定。
+
+    threshold: 直近 window バッチの平均新規発見数がこれを下回ったら停止
+    min_batches: 少なくともこのバッチ数は必ず処理する
+    """
+
+    def __init__(self, threshold: float = 1.0, window: int = 3, min_batches: int = 5):
+        self.threshold = threshold
+        self.window = window
+        self.min_batches = min_batches
+        self.curve: list[int] = []
+        self.incidence: Counter[str] = Counter()
+
+    def record(self, keys: set[str]) -> int:
+        """1 バッチで見つかったキーワード集合を記録し、新規発見数を返す。"""
+        new = sum(1 for k in keys if k not in self.incidence)
+        self.incidence.update(keys)
+        self.curve.append(new)
+        return new
+
+    def should_stop(self) -> bool:
+        if len(self.curve) < max(self.min_batches, self.window):
+            return False
+        recent = self.curve[-self.window:]
+        return sum(recent) / len(recent) < self.threshold
+
+    def estimated_total(self) -> float:
+        """Chao2 による全キーワード数の推定値（観測数 + 未発見数の推定）。"""
+        observed = len(self.incidence)
+        m = len(self.curve)
+        if m == 0:
+            return 0.0
+        q1 = sum(1 for c in self.incidence.values() if c == 1)
+        q2 = sum(1 for c in self.incidence.values() if c == 2)
+        factor = (m - 1) / m
+        unseen = factor * q1 * q1 / (2 * q2) if q2 else factor * q1 * (q1 - 1) / 2
+        return observed + unseen
+
+    def estimated_recall(self) -> float:
+        total = self.estimated_total()
+        return round(len(self.incidence) / total, 3) if total else 1.0
+
+    def summary(self, total_batches: int, stopped: bool) -> dict:
+        return {
+            "batches_total": total_batches,
+            "batches_used": len(self.curve),
+            "stopped_early": stopped,
+            "curve": self.curve,
+            "observed": len(self.incidence),
+            "estimated_total": round(self.estimated_total(), 1),
+            "estimated_recall": self.estimated_recall(),
+        }
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
-"""FUTURE TRAIN v2 レポート生成スクリプト（ギャップ分析 + キーワード%表示）。"""
+"""FUTURE TRAIN v2 レポート生成スクリプト（ギャップ分析 + キーワード%表示）。
 
+--gap-mode mapreduce で全口コミを対象にしたギャップ分析にする（既定は代表口コミ 1 回の single）。
+"""
+
+import argparse
 import json
 import os
 import sys
@@ -10,7 +14,7 @@ from pathlib import Path
 # プロジェクトルートをパスに追加
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from analyzer import analyze_reviews
+from analyzer import GAP_MODES, analyze_reviews
 from reporter import generate_report
 
 RAW_JSON = "reviews_raw.json"
@@ -19,6 +23,11 @@ OUTPUT_HTML = "report_v2.html"
 STORE_NAME = "FUTURE TRAIN KYOTO DINER & CAFE"
 PUBLIC_DIR = Path("public") / "FUTURE_TRAIN_v2"
 
+parser = argparse.ArgumentParser(description="FUTURE TRAIN v2 レポート生成")
+parser.add_argument("--gap-mode", dest="gap_mode", choices=GAP_MODES, default="single",
+                    help="ギャップ分析の方式（single: 代表口コミを 1 回で / mapreduce: 全口コミをチャンクごとに）")
+args = parser.parse_args()
+
 if not os.path.exists(RAW_JSON):
     print(f"❌ {RAW_JSON} が見つかりません。")
     sys.exit(1)
@@ -29,7 +38,7 @@ with open(RAW_JSON, encoding="utf-8") as f:
 print(f"  {len(reviews)}件の口コミを読み込みました。")
 
 print("\n🤖 v2 分析開始（ギャップ分析込み）...")
-analysis = analyze_reviews(reviews, include_gap=True)
+analysis = analyze_reviews(reviews, include_gap=True, gap_mode=args.gap_mode)
 
 with open(ANALYZED_JSON, "w", encoding="utf-8") as f:
     json.dump(analysis, f, ensure_ascii=False, indent=2)
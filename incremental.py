@@ -0,0 +1,121 @@
+"""増分分析用の十分統計量モジュール。
+
+reviews_analyzed.json には丸めた平均・件数しか残らないため、口コミが 20 件増えただけでも
+全件を再分析する必要があった。ここでは足し込み可能な統計量を保存し、新しい口コミの分だけを
+加えて派生値（平均スコア・検出率・出現件数・時期別の出現率）を作り直せるようにする。
+
+- 感動の7類型: 層（サイト × 評点帯 × 時期）ごとの 母集団件数 / 採点件数 / 類型別のスコア合計・二乗和・検出件数
+- キーワード: 時期バケットごとの口コミ件数と、キーワード別の出現口コミ件数
+- 分析済み口コミのキー（review_key）: 次回の取得分から未分析の口コミだけを選ぶ
+
+時期（直近 / それ以前）は取得日とともに基準日が進むと既存の口コミでも変わるので、増分分析では
+時期を含む層と時期バケットを、口コミ別の感動スコア行列とキーワード索引から毎回作り直す。
+
+保存形式（analysis["stats"]）:
+{
+  "version": 2,
+  "review_keys": ["3f2a…", …],
+  "kando": {"strata": {"tabelog|high|recent": {"population": 40, "scored": 40,
+                                               "sum": [..7..], "squares": [..7..], "hits": [..7..]}}},
+  "keywords": {"buckets": {"recent": 52, "older": 180}, "counts": {"美味しい": {"recent": 20, "older": 71}}}
+}
+"""
+
+import hashlib
+
+from normalizer import content_hash
+
+STATS_VERSION = 2  # 2: 口コミキーを正規化済み本文のハッシュから作る
+
+
+def review_key(review: dict) -> str:
+    """口コミの同一性を判定するキー（サイト・投稿者・正規化済み本文のハッシュ）。
+
+    「3か月前」のような相対表記は取得日によって変わるため、日付はキーに含めない。
+    本文は取り込み時の content_hash を使う（なければその場で計算する）。
+    """
+    digest = review.get("content_hash") or content_hash(str(review.get("text", "")))
+    raw = "\x1f".join([str(review.get("source", "")), str(review.get("reviewer_name", "")), digest])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class KandoStats:
+    """感動の7類型の層別十分統計量。n_types は類型数。"""
+
+    def __init__(self, n_types: int, strata: dict[str, dict] | None = None):
+        self.n_types = n_types
+        self.strata: dict[str, dict] = strata or {}
+
+    def _stratum(self, label: str) -> dict:
+        if label not in self.strata:
+            zeros = [0] * self.n_types
+            self.strata[label] = {"population": 0, "scored": 0, "sum": list(zeros),
+                                  "squares": list(zeros), "hits": list(zeros)}
+        return self.strata[label]
+
+    def add(self, label: str, row: list[int] | None) -> None:
+        """口コミ 1 件を加える。row は類型ごとのスコア（未採点なら None）。"""
+        h = self._stratum(label)
+        h["population"] += 1
+        if row is None:
+            return
+        h["scored"] += 1
+        for k, v in enumerate(row):
+            h["sum"][k] += v
+            h["squares"][k] += v * v
+            h["hits"][k] += 1 if v > 0 else 0
+
+    @property
+    def population(self) -> int:
+        return sum(h["population"] for h in self.strata.values())
+
+    @property
+    def scored(self) -> int:
+        return sum(h["scored"] for h in self.strata.values())
+
+    def totals(self, k: int) -> tuple[int, int]:
+        """類型 k のスコア合計と検出件数（全層の合計）。"""
+        return (sum(h["sum"][k] for h in self.strata.values()),
+                sum(h["hits"][k] for h in self.strata.values()))
+
+    def moments(self, k: int, hits: bool = False) -> dict[str, tuple[int, float, float]]:
+        """類型 k の層別 (採点件数, 合計, 二乗和)。hits=True なら検出有無（0/1）について返す。"""
+        if hits:
+            return {label: (h["scored"], float(h["hits"][k]), float(h["hits"][k]))
+                    for label, h in self.strata.items()}
+        return {label: (h["scored"], float(h["sum"][k]), float(h["squares"][k]))
+                for label, h in self.strata.items()}
+
+    def sizes(self) -> dict[str, int]:
+        return {label: h["population"] for label, h in self.strata.items()}
+
+    def to_dict(self) -> dict:
+        return {"strata": self.strata}
+
+    @classmethod
+    def from_dict(cls, data: dict, n_types: int) -> "KandoStats":
+        return cls(n_types, {label: dict(h) for label, h in data.get("strata", {}).items()})
+
+
+class KeywordStats:
+    """キーワードの時期バケット別出現件数。"""
+
+    def __init__(self, buckets: dict[str, int] | None = None, counts: dict[str, dict[str, int]] | None = None):
+        self.buckets: dict[str, int] = buckets or {}
+        self.counts: dict[str, dict[str, int]] = counts or {}
+
+    def count(self, word: str, bucket: str | None = None) -> int:
+        per_bucket = self.counts.get(word, {})
+        return per_bucket.get(bucket, 0) if bucket is not None else sum(per_bucket.values())
+
+    def rate(self, word: str, bucket: str) -> tuple[int, float]:
+        """(出現件数, 出現率%) を返す。分母はバケットの口コミ数。"""
+        c, denom = self.count(word, bucket), self.buckets.get(bucket, 0)
+        return c, round(c / denom * 100, 1) if denom else 0.0
+
+    def to_dict(self) -> dict:
+        return {"buckets": self.buckets, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KeywordStats":
+        return cls(dict(data.get("buckets", {})), {w: dict(c) for w, c in data.get("counts", {}).items()})
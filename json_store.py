@@ -0,0 +1,61 @@
+"""店舗をまたいで共有する JSON ファイルの読み書きモジュール。
+
+keyword_lexicon.json（lexicon.py）と keyword_df.json（keyword_engine.py）は、同じプロセスで並行に走る
+分析（llm_scheduler）や別プロセスの分析から更新される。読み込み → 変更 → 上書きでは、
+後から保存した側が先の更新を消してしまう。
+
+update() はロック（プロセス内はスレッドロック、プロセス間は <path>.lock への flock）の中で
+ファイルの最新の内容を読み直し、変更を適用してから一時ファイル + os.replace で置き換える。
+読むだけなら read() をロックなしで使ってよい（置き換えは原子的なので書きかけを読むことはない）。
+
+プロセス間のロックは POSIX（fcntl）でだけ行う。Windows ではプロセス内の更新だけが合算され、
+同時に走る別プロセスの更新は後から保存した側が優先される。
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_lock = threading.Lock()
+
+
+def read(path: str, default=None):
+    """JSON を読む。ファイルがない・壊れている場合は default（省略時は空の dict）。"""
+    if not os.path.exists(path):
+        return {} if default is None else default
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {} if default is None else default
+
+
+def update(path: str, change, indent: int | None = None):
+    """最新の内容 data に change(data) を適用して保存し、保存した内容を返す。change は新しい内容を返す。"""
+    with _locked(path):
+        data = change(read(path))
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp, path)
+        return data
+
+
+@contextmanager
+def _locked(path: str):
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,81 @@
+"""感動の7類型の口コミ別スコア行列モジュール。
+
+採点結果を類型ごとの平坦なリストに集計すると、どの口コミのスコアだったかが失われ、
+サイト別・評点別・時期別に切り分けるには LLM に採点させ直すしかなかった。
+ここでは口コミ × 7類型の整数行列を口コミキー（incremental.review_key）と並べて保持し、
+任意のラベル列による内訳を numpy の集計だけで求める。
+
+保存形式（analysis["kando"]["matrix"]）: 1 行 = 口コミ 1 件、各類型のスコアを 1 桁ずつ並べた文字列。
+採点できなかった口コミは "-"。
+{"ids": ["3f2a…", …], "rows": ["0312000", "-", …]}
+"""
+
+import numpy as np
+
+UNSCORED = "-"
+
+
+class KandoMatrix:
+    """口コミ × 類型のスコア行列。scored[i] が False の行は未採点（スコアは 0 として保持）。"""
+
+    def __init__(self, ids: list[str], scores: np.ndarray, scored: np.ndarray):
+        self.ids = ids
+        self.scores = scores
+        self.scored = scored
+
+    @classmethod
+    def from_rows(cls, ids: list[str], rows: list[list[int] | None], n_types: int) -> "KandoMatrix":
+        scores = np.zeros((len(rows), n_types), dtype=np.int8)
+        scored = np.zeros(len(rows), dtype=bool)
+        for i, row in enumerate(rows):
+            if row is not None:
+                scores[i] = row
+                scored[i] = True
+        return cls(list(ids), scores, scored)
+
+    def extend(self, other: "KandoMatrix") -> None:
+        self.ids += other.ids
+        self.scores = np.vstack([self.scores, other.scores])
+        self.scored = np.concatenate([self.scored, other.scored])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def breakdown(self, labels: list[str], missing_as_zero: bool = False) -> dict[str, dict]:
+        """ラベル（口コミごと）別に、類型ごとの平均スコアと検出率を求める。
+
+        missing_as_zero=True なら未採点の口コミを 0 点として分母に含める（全件採点時の集計と同じ扱い）。
+        戻り値: {ラベル: {"reviews": 件数, "scored": 採点件数, "score": [類型順], "detection_rate": [類型順(%)]}}
+        """
+        if not len(self):
+            return {}
+        keys, inverse = np.unique(np.asarray(labels), return_inverse=True)
+        n_types = self.scores.shape[1]
+        reviews = np.bincount(inverse, minlength=len(keys))
+        scored = np.bincount(inverse, weights=self.scored, minlength=len(keys))
+        sums = np.zeros((len(keys), n_types))
+        hits = np.zeros((len(keys), n_types))
+        np.add.at(sums, inverse, self.scores)
+        np.add.at(hits, inverse, self.scores > 0)
+        denom = (reviews if missing_as_zero else scored).astype(float)[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = np.where(denom > 0, sums / denom, 0.0)
+            rates = np.where(denom > 0, hits / denom * 100, 0.0)
+        return {
+            str(key): {
+                "reviews": int(reviews[g]),
+                "scored": int(scored[g]),
+                "score": [round(float(v), 2) for v in means[g]],
+                "detection_rate": [round(float(v), 1) for v in rates[g]],
+            }
+            for g, key in enumerate(keys)
+        }
+
+    def to_dict(self) -> dict:
+        rows = ["".join(str(v) for v in row) if ok else UNSCORED for row, ok in zip(self.scores.tolist(), self.scored)]
+        return {"ids": self.ids, "rows": rows}
+
+    @classmethod
+    def from_dict(cls, data: dict, n_types: int) -> "KandoMatrix":
+        rows = [None if r == UNSCORED else [int(c) for c in r] for r in data.get("rows", [])]
+        return cls.from_rows(data.get("ids", []), rows, n_types)
@@ -0,0 +1,109 @@
+"""Janome による形態素解析ベースのキーワード候補抽出モジュール（オフライン）。
+
+Gemini を使わずに、口コミ本文から形容詞・評価動詞・名詞句の候補を取り出し、
+店舗内の文書頻度（DF）と店舗横断の TF-IDF で順位付けする。
+analyzer からは次の 2 通りで使われる。
+
+- "janome": LLM 経路の完全な置き換え（ポジネガは評点から推定）
+- "hybrid": 候補リストだけを LLM に渡し、選別・表記統一・ポジネガ判定させる前段フィルタ
+"""
+
+import math
+from collections import Counter
+
+from janome.tokenizer import Tokenizer
+
+import json_store
+
+DF_STORE_PATH = "keyword_df.json"
+
+# 単独では意味を持たない動詞・形容詞（基本形）
+LIGHT_VERBS = {
+    "する", "いる", "ある", "なる", "れる", "られる", "せる", "できる", "いく", "行く", "来る", "くる",
+    "思う", "言う", "いう", "見る", "くれる", "もらう", "いただく", "おる", "しまう", "やる", "くださる",
+}
+LIGHT_ADJECTIVES = {"ない", "よい", "いい", "ほしい"}
+
+# 名詞句として連結する品詞細分類
+_NOUN_JOINABLE = {"一般", "サ変接続", "形容動詞語幹", "固有名詞", "接尾", "副詞可能"}
+_NOUN_HEAD_EXCLUDED = {"非自立", "代名詞", "数", "接尾"}
+
+_tokenizer: Tokenizer | None = None
+
+
+def _get_tokenizer() -> Tokenizer:
+    # 辞書の読み込みに 1 秒前後かかるため、初回利用時に 1 度だけ生成する
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = Tokenizer()
+    return _tokenizer
+
+
+def extract_candidates(text: str, stopwords: set[str] = frozenset()) -> set[str]:
+    """1 件の口コミからキーワード候補（形容詞・評価動詞・名詞句）を抽出する。"""
+    tokens = list(_get_tokenizer().tokenize(text))
+    found: set[str] = set()
+    phrase: list[tuple[str, str]] = []
+
+    def flush_phrase():
+        # 「雰囲気抜群」「待ち時間」のような連続名詞は連結形と構成語の両方を候補にする
+        if 1 < len(phrase) <= 4:
+            found.add("".join(surface for surface, _ in phrase))
+        found.update(surface for surface, minor in phrase if minor != "接尾")
+        phrase.clear()
+
+    for i, tok in enumerate(tokens):
+        pos = tok.part_of_speech.split(",")
+        major, minor = pos[0], pos[1]
+
+        if major == "名詞" and minor in _NOUN_JOINABLE and (phrase or minor not in _NOUN_HEAD_EXCLUDED):
+            phrase.append((tok.surface, minor))
+            continue
+        flush_phrase()
+
+        if major == "形容詞" and minor == "自立" and tok.base_form not in LIGHT_ADJECTIVES:
+            found.add(tok.base_form)
+        elif major == "動詞" and minor == "自立" and tok.base_form not in LIGHT_VERBS:
+            found.add(tok.base_form)
+            # 「また来たい」「行きたい」など願望表現は表層形で残す
+            nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+            if nxt is not None and nxt.base_form == "たい":
+                found.add(tok.surface + "たい")
+    flush_phrase()
+
+    return {w for w in found if len(w) >= 2 and w not in stopwords and not w.isascii()}
+
+
+def rank_candidates(texts: list[str], stopwords: set[str] = frozenset(), store_name: str | None = None,
+                    top_n: int = 150, min_df: int = 2) -> list[dict]:
+    """候補を店舗内 DF と店舗横断 IDF で順位付けする。
+
+    返り値は {"word", "df", "tfidf"} のリスト（tfidf 降順）。
+    store_name を渡すと、この店舗の DF を keyword_df.json に保存して次回以降の IDF に反映する。
+    """
+    df: Counter[str] = Counter()
+    for t in texts:
+        df.update(extract_candidates(t, stopwords))
+
+    if store_name:
+        # 他の店舗の分析が同時に保存しても消えないよう、最新のファイルにこの店舗の分だけを書き込む
+        entry = {"n": len(texts), "df": dict(df)}
+        stores = json_store.update(DF_STORE_PATH, lambda latest: {**latest, store_name: entry})
+    else:
+        stores = json_store.read(DF_STORE_PATH)
+    others = {name: s for name, s in stores.items() if name != store_name}
+    n_stores = len(others) + 1
+
+    n = len(texts) or 1
+    ranked = []
+    for word, c in df.items():
+        if c < min_df:
+            continue
+        # 他店舗でも頻出する語（「美味しい」など）は IDF で割り引く
+        stores_with = 1 + sum(1 for s in others.values() if word in s.get("df", {}))
+        idf = math.log((n_stores + 1) / stores_with) + 1
+        ranked.append({"word": word, "df": c, "tfidf": round(c / n * idf, 4)})
+
+    ranked.sort(key=lambda x: (-x["tfidf"], -x["df"]))
+    return ranked[:top_n]
+
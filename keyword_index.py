@@ -0,0 +1,164 @@
+"""キーワード → 口コミのビットマップ索引モジュール。
+
+口コミ n 件に対し、キーワードごとに「そのキーワードを含む口コミ」を
+n ビットの整数で保持する。サイト・評点・時期などの属性（ファセット）も
+同じ形式で持つため、任意の条件での出現率はビット AND と popcount だけで求まる。
+
+例: 「直近3ヶ月の食べログ ★3以下 で "残念" を含む口コミ数」
+    index.count("残念", source="tabelog", rating=["1", "2", "3"], period="recent")
+"""
+
+from typing import Iterable
+
+
+class KeywordIndex:
+    """キーワードとファセットのビットマップ集合。ビット i は口コミ i に対応する。"""
+
+    def __init__(self, size: int, keywords: dict[str, int] | None = None,
+                 facets: dict[str, dict[str, int]] | None = None):
+        self.size = size
+        self.keywords: dict[str, int] = keywords or {}
+        self.facets: dict[str, dict[str, int]] = facets or {}
+
+    # ------------------------------------------------------------------
+    # 構築
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, texts: list[str], words: Iterable[str] = (),
+              facets: dict[str, list[str]] | None = None) -> "KeywordIndex":
+        """本文リストとファセット値（口コミごとのラベル列）から索引を作る。"""
+        index = cls(len(texts))
+        for name, labels in (facets or {}).items():
+            index.add_facet(name, labels)
+        for word in words:
+            index.add_keyword(word, texts)
+        return index
+
+    def add_facet(self, name: str, labels: list[str]) -> None:
+        positions: dict[str, list[int]] = {}
+        for i, label in enumerate(labels):
+            positions.setdefault(label, []).append(i)
+        self.facets[name] = {label: _bits_from_positions(p, self.size) for label, p in positions.items()}
+
+    def add_keyword(self, word: str, texts: list[str], variants: Iterable[str] = ()) -> int:
+        """キーワード（と表記ゆれ）を含む口コミのビットマップを登録して返す。登録済みなら再走査しない。"""
+        if word in self.keywords:
+            return self.keywords[word]
+        forms = [word, *(v for v in variants if v and v != word)]
+        if len(forms) == 1:
+            positions = [i for i, t in enumerate(texts) if word in t]
+        else:
+            positions = [i for i, t in enumerate(texts) if any(f in t for f in forms)]
+        bits = _bits_from_positions(positions, self.size)
+        self.keywords[word] = bits
+        return bits
+
+    def extend(self, texts: list[str], facets: dict[str, list[str]] | None = None,
+               variants: dict[str, list[str]] | None = None) -> None:
+        """口コミを末尾に追加する（増分分析用）。登録済みキーワードは追加分の本文だけを走査する。"""
+        offset = self.size
+        self.size += len(texts)
+        for name, labels in (facets or {}).items():
+            positions: dict[str, list[int]] = {}
+            for i, label in enumerate(labels):
+                positions.setdefault(label, []).append(i)
+            buckets = self.facets.setdefault(name, {})
+            for label, p in positions.items():
+                buckets[label] = buckets.get(label, 0) | _bits_from_positions(p, len(texts)) << offset
+        for word in self.keywords:
+            forms = [word, *(v for v in (variants or {}).get(word, []) if v and v != word)]
+            positions = [i for i, t in enumerate(texts) if any(f in t for f in forms)]
+            self.keywords[word] |= _bits_from_positions(positions, len(texts)) << offset
+
+    def retain(self, words: Iterable[str]) -> None:
+        """指定キーワード以外のビットマップを破棄する（保存サイズ削減用）。"""
+        keep = set(words)
+        self.keywords = {w: b for w, b in self.keywords.items() if w in keep}
+
+    # ------------------------------------------------------------------
+    # 参照
+    # ------------------------------------------------------------------
+
+    def mask(self, **filters: str | Iterable[str]) -> int:
+        """ファセット条件の AND を返す。値にリストを渡すとその中の OR になる。"""
+        bits = (1 << self.size) - 1
+        for name, values in filters.items():
+            if values is None:
+                continue
+            buckets = self.facets.get(name, {})
+            if isinstance(values, str):
+                values = [values]
+            facet_bits = 0
+            for v in values:
+                facet_bits |= buckets.get(v, 0)
+            bits &= facet_bits
+        return bits
+
+    def count(self, word: str | None = None, **filters: str | Iterable[str]) -> int:
+        """条件に合う口コミのうち word を含む件数（word 省略時は条件に合う件数）。"""
+        bits = self.mask(**filters)
+        if word is not None:
+            bits &= self.keywords.get(word, 0)
+        return bits.bit_count()
+
+    def rate(self, word: str, **filters: str | Iterable[str]) -> tuple[int, float]:
+        """(出現件数, 出現率%) を返す。分母は条件に合う口コミ数。"""
+        base = self.mask(**filters)
+        denom = base.bit_count()
+        c = (base & self.keywords.get(word, 0)).bit_count()
+        return c, round(c / denom * 100, 1) if denom else 0.0
+
+    def reviews(self, word: str | None = None, **filters: str | Iterable[str]) -> list[int]:
+        """条件に合う口コミの位置（昇順）を返す。"""
+        bits = self.mask(**filters)
+        if word is not None:
+            bits &= self.keywords.get(word, 0)
+        out = []
+        while bits:
+            low = bits & -bits
+            out.append(low.bit_length() - 1)
+            bits ^= low
+        return out
+
+    # ------------------------------------------------------------------
+    # 保存形式（reviews_analyzed.json に同梱する）
+    # ------------------------------------------------------------------
+
+    def to_dict(self) -> dict:
+        return {
+            "size": self.size,
+            "keywords": {w: format(b, "x") for w, b in self.keywords.items()},
+            "facets": {
+                name: {label: format(b, "x") for label, b in buckets.items()}
+                for name, buckets in self.facets.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KeywordIndex":
+        return cls(
+            data.get("size", 0),
+            {w: int(h, 16) for w, h in data.get("keywords", {}).items()},
+            {
+                name: {label: int(h, 16) for label, h in buckets.items()}
+                for name, buckets in data.get("facets", {}).items()
+            },
+        )
+
+
+def _bits_from_positions(positions: list[int], size: int) -> int:
+    """位置リストからビットマップを作る（大きな int への逐次 OR を避ける）。"""
+    buf = bytearray((size + 7) // 8)
+    for i in positions:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+def rating_bucket(rating) -> str:
+    """評点を★の整数部で分類する。未取得（0 / None）は "0"。"""
+    try:
+        value = float(rating)
+    except (TypeError, ValueError):
+        return "0"
+    return str(max(0, min(5, int(value)))) if value > 0 else "0"
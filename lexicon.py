@@ -0,0 +1,108 @@
+"""店舗横断のキーワード辞書（表記ゆれ・ポジネガ判定のキャッシュ）モジュール。
+
+Gemini に毎回判定させていた「表記統一（美味しい / おいしい）」と「ポジネガ」を
+keyword_lexicon.json に蓄積し、次回以降は既知の表記をローカルで解決する。
+LLM に送るのは辞書にない表記だけになる。
+
+辞書は店舗・プロセスをまたいで共有されるため、save() は読み込み後に行った更新（判定 1 票・除外）だけを
+ファイルの最新版に適用し直して保存する（json_store.update）。同時に走った分析の票も消えずに合算される。
+
+保存形式:
+{
+  "entries": {"美味しい": {"variants": ["おいしい", "美味しかった"], "votes": {"positive": 12}}},
+  "rejected": ["店内", "京都"]
+}
+"""
+
+from datetime import datetime
+
+import json_store
+
+LEXICON_PATH = "keyword_lexicon.json"
+SENTIMENTS = ("positive", "negative", "neutral")
+
+
+class KeywordLexicon:
+    def __init__(self, entries: dict[str, dict] | None = None, rejected: list[str] | None = None,
+                 path: str = LEXICON_PATH):
+        self.path = path
+        self.entries: dict[str, dict] = entries or {}
+        self.rejected: set[str] = set(rejected or [])
+        self._surface: dict[str, str] = {}
+        for canonical, entry in self.entries.items():
+            self._surface[canonical] = canonical
+            for v in entry.get("variants", []):
+                self._surface[v] = canonical
+        self._pending: list[tuple] = []  # 読み込み後の更新（save() でファイルの最新版に適用し直す）
+
+    @classmethod
+    def load(cls, path: str = LEXICON_PATH) -> "KeywordLexicon":
+        return cls._from_data(json_store.read(path), path)
+
+    @classmethod
+    def _from_data(cls, data: dict, path: str) -> "KeywordLexicon":
+        return cls(data.get("entries", {}), data.get("rejected", []), path=path)
+
+    def save(self) -> None:
+        """読み込み後の更新をファイルの最新版に適用して保存し、この辞書も保存した内容に揃える。"""
+        merged: KeywordLexicon | None = None
+
+        def change(data: dict) -> dict:
+            nonlocal merged
+            merged = self._from_data(data, self.path)
+            for op, *args in self._pending:
+                getattr(merged, f"_{op}")(*args)
+            return {"entries": merged.entries, "rejected": sorted(merged.rejected)}
+
+        json_store.update(self.path, change, indent=2)
+        self.entries, self.rejected, self._surface = merged.entries, merged.rejected, merged._surface
+        self._pending = []
+
+    # ------------------------------------------------------------------
+    # 参照
+    # ------------------------------------------------------------------
+
+    def resolve(self, surface: str) -> str | None:
+        """表記を代表表記に解決する。未登録・除外語は None。"""
+        return self._surface.get(surface)
+
+    def variants(self, canonical: str) -> list[str]:
+        return self.entries.get(canonical, {}).get("variants", [])
+
+    def sentiment(self, canonical: str) -> str:
+        """蓄積された判定履歴の多数決。同数・未判定は neutral。"""
+        votes = self.entries.get(canonical, {}).get("votes", {})
+        pos, neg = votes.get("positive", 0), votes.get("negative", 0)
+        return "positive" if pos > neg else "negative" if neg > pos else "neutral"
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def record(self, surface: str, canonical: str, sentiment: str) -> None:
+        """LLM の判定結果を 1 票として登録する。canonical が既存なら表記ゆれとして統合する。"""
+        op = ("record", surface, canonical, sentiment, datetime.now().strftime("%Y-%m-%d"))
+        self._pending.append(op)
+        self._record(*op[1:])
+
+    def _record(self, surface: str, canonical: str, sentiment: str, updated_at: str) -> None:
+        canonical = self._surface.get(canonical, canonical)
+        entry = self.entries.setdefault(canonical, {"variants": [], "votes": {}})
+        if surface != canonical and surface not in entry["variants"]:
+            entry["variants"].append(surface)
+        if sentiment not in SENTIMENTS:
+            sentiment = "neutral"
+        entry["votes"][sentiment] = entry["votes"].get(sentiment, 0) + 1
+        entry["updated_at"] = updated_at
+        self._surface[surface] = canonical
+        self._surface[canonical] = canonical
+        self.rejected.discard(surface)
+
+    def reject(self, surface: str) -> None:
+        """キーワードではないと判定された表記を記録し、次回以降 LLM に送らない。"""
+        self._pending.append(("reject", surface))
+        self._reject(surface)
+
+    def _reject(self, surface: str) -> None:
+        if surface not in self._surface:
+            self.rejected.add(surface)
@@ -3,7 +3,17 @@ from google import genai
 from dotenv import load_dotenv
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY", ""))
-for m in client.models.list():
-    if "generateContent" in (m.supported_actions or []):
-        print(m.name)
+
+def available_models(client=None) -> list[str]:
+    """generateContent に対応したモデル名（"models/" を除いた形）を返す。"""
+    client = client or genai.Client(api_key=os.getenv("GEMINI_API_KEY", ""))
+    return [
+        m.name.removeprefix("models/")
+        for m in client.models.list()
+        if "generateContent" in (m.supported_actions or [])
+    ]
+
+
+if __name__ == "__main__":
+    for name in available_models():
+        print(f"models/{name}")
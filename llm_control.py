@@ -0,0 +1,246 @@
+"""Gemini 呼び出しのリトライと同時実行数制御モジュール。
+
+- エラーを分類し（レート制限 / 一時的 / 致命的）、レート制限と一時的エラーは
+  指数バックオフ + ジッターで再試行する（レート制限で retryDelay が返ればそれを優先）。
+- 同時実行数は AIMD で調整する。成功するたびに加算的に増やし、
+  レート制限を受けたら半分に、応答が遅い（latency_target 超）ときは少し減らす。
+- 実行ごとに、収束した同時実行数とスループットを report() で返す。統計は begin_run() から
+  contextvars で実行（店舗の分析）ごとに分けるので、並行に走る分析どうしで消し合わない。
+- AIMD に使う応答時間は fn() の実行時間だけで、枠やクォータの待ち時間は含めない。
+
+固定の time.sleep(2) による間引きはこの制御に置き換えた。
+
+呼び出しはコルーチンで、待機は asyncio 上で行う。同時実行数の状態はスレッドロックで守り、
+待機中の呼び出しは自分のイベントループの Event で起こすため、複数のイベントループ
+（スレッドごとに asyncio.run した場合など）から共有しても枠の数は全体で守られる。
+
+call() に admit を渡すと、各試行で枠を待つ前に admit() を待ち（クォータスケジューラの割り当て）、
+その戻り値（並び順のキー）の小さい順に空いた枠を引き渡す。キーのない呼び出しは到着順。
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+
+from profiler import profiler
+
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+_RETRY_DELAY = re.compile(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+class RunStats:
+    """1 回の実行（店舗の分析）の呼び出し統計。"""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.latency_total = 0.0
+        self.errors: dict[str, int] = {}
+        self.samples: list[float] = []  # 呼び出しの完了・失敗ごとの同時実行数
+        self.first_start: float | None = None
+        self.last_end: float | None = None
+
+
+# 実行中の統計（begin_run() の中の呼び出しが対象。外で呼ばれた分はコントローラ共通の統計に入る）
+_run_stats: contextvars.ContextVar[RunStats | None] = contextvars.ContextVar("llm_run_stats", default=None)
+
+
+def classify_error(e: Exception) -> str:
+    """例外をレート制限 / 一時的 / 致命的に分類する。"""
+    code = getattr(e, "code", None)
+    status = str(getattr(e, "status", "") or "")
+    text = str(e)
+    if code == 429 or "RESOURCE_EXHAUSTED" in status or "RESOURCE_EXHAUSTED" in text or "429" in text[:10]:
+        return RATE_LIMIT
+    if code in (408, 500, 502, 503, 504) or status in ("UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL"):
+        return TRANSIENT
+    if isinstance(e, (TimeoutError, ConnectionError)) or "timeout" in type(e).__name__.lower():
+        return TRANSIENT
+    if type(e).__module__.startswith(("httpx", "httpcore")):
+        return TRANSIENT
+    return FATAL
+
+
+def _retry_after(e: Exception) -> float | None:
+    m = _RETRY_DELAY.search(str(e))
+    return float(m.group(1)) if m else None
+
+
+class LLMController:
+    """イベントループ・スレッドをまたいで共有される呼び出し制御。call() で 1 回の API 呼び出しを包む。"""
+
+    def __init__(self, initial: float = 2.0, min_concurrency: float = 1.0, max_concurrency: int = 16,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 latency_target: float = 30.0):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latency_target = latency_target
+        self.concurrency = float(initial)
+        self._initial = float(initial)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        # (並び順のキー, 到着順, イベントループ, Event) のヒープ
+        self._waiters: list[tuple[tuple, int, asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self._arrivals = itertools.count()
+        self._shared_stats = RunStats()
+
+    # ------------------------------------------------------------------
+    # 呼び出し
+    # ------------------------------------------------------------------
+
+    async def call(self, fn, label: str = "", admit=None, name: str = "llm"):
+        """await fn() を同時実行枠の中で実行し、分類に応じて再試行する。致命的エラーはそのまま送出する。
+
+        admit は各試行の前に待つコルーチン関数（クォータの割り当て）。戻り値は枠を待つ順番のキー。
+        クォータと枠の待ち時間は name.quota / name.slot の待ち区間（profiler の "queue"）として記録する。
+        """
+        for attempt in range(self.max_retries + 1):
+            order = ()
+            if admit:
+                with profiler.span(f"{name}.quota", "queue"):
+                    order = await admit()
+            with profiler.span(f"{name}.slot", "queue"):
+                await self._acquire(order)
+            start = time.perf_counter()
+            try:
+                result = await fn()
+            except Exception as e:
+                self._release()
+                kind = classify_error(e)
+                self._on_error(kind)
+                if kind == FATAL or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e if kind == RATE_LIMIT else None)
+                print(f"    ⏳ {'レート制限' if kind == RATE_LIMIT else '一時エラー'}{label}: "
+                      f"{delay:.1f}秒後に再試行（{attempt + 1}/{self.max_retries}、同時実行数 {self.concurrency:.1f}）")
+                await profiler.sleep(delay, "retry_backoff")
+                continue
+            except BaseException:
+                self._release()
+                raise
+            latency = time.perf_counter() - start
+            self._release()
+            self._on_success(latency)
+            return result
+
+    async def map(self, fn, items: list) -> list:
+        """items の各要素にコルーチン関数 fn を並行適用し、入力順の結果リストを返す（同時実行数は call() 側で制御）。"""
+        return list(await asyncio.gather(*(fn(item) for item in items)))
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.concurrency))
+
+    # ------------------------------------------------------------------
+    # AIMD
+    # ------------------------------------------------------------------
+
+    async def _acquire(self, order: tuple = ()) -> None:
+        with self._lock:
+            stats = self._stats()
+            if stats.first_start is None:
+                stats.first_start = time.perf_counter()
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                return
+            waiter = (order, next(self._arrivals), asyncio.get_running_loop(), asyncio.Event())
+            heapq.heappush(self._waiters, waiter)
+        try:
+            # 枠は _wake() が in_flight を加算したうえで引き渡す
+            await waiter[3].wait()
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                else:
+                    self._in_flight -= 1
+                    self._wake()
+            raise
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._wake()
+
+    def _wake(self) -> None:
+        """空いた枠を並び順のキーの小さい順（同じなら到着順）に引き渡す（ロック保持中に呼ぶ）。"""
+        while self._waiters and self._in_flight < self.limit:
+            _, _, loop, event = heapq.heappop(self._waiters)
+            self._in_flight += 1
+            loop.call_soon_threadsafe(event.set)
+
+    def _on_success(self, latency: float) -> None:
+        with self._lock:
+            stats = self._stats()
+            stats.calls += 1
+            stats.latency_total += latency
+            stats.last_end = time.perf_counter()
+            if latency > self.latency_target:
+                self.concurrency = max(self.min_concurrency, self.concurrency * 0.8)
+            else:
+                # 1 往復（同時実行数ぶんの成功）ごとに +1
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            stats.samples.append(self.concurrency)
+            self._wake()
+
+    def _on_error(self, kind: str) -> None:
+        with self._lock:
+            stats = self._stats()
+            stats.errors[kind] = stats.errors.get(kind, 0) + 1
+            if kind == RATE_LIMIT:
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+            elif kind == TRANSIENT:
+                self.concurrency = max(self.min_concurrency, self.concurrency * 0.8)
+            if kind != FATAL:
+                stats.retries += 1
+            stats.samples.append(self.concurrency)
+
+    def _backoff(self, attempt: int, rate_limit_error: Exception | None) -> float:
+        hinted = _retry_after(rate_limit_error) if rate_limit_error else None
+        if hinted is not None:
+            return hinted + random.uniform(0, self.base_delay)
+        # full jitter: [0, min(max_delay, base * 2^attempt)]（attempt は 0 始まり。初回の再試行は base まで）
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    # ------------------------------------------------------------------
+    # レポート
+    # ------------------------------------------------------------------
+
+    def begin_run(self) -> RunStats:
+        """現在のコンテキスト（以降に起動するタスクを含む）の呼び出し統計を新しく始める。"""
+        stats = RunStats()
+        _run_stats.set(stats)
+        return stats
+
+    def _stats(self) -> RunStats:
+        return _run_stats.get() or self._shared_stats
+
+    def report(self) -> dict:
+        """現在の実行の呼び出し統計。settled_concurrency は直近の調整値の平均。"""
+        with self._lock:
+            stats = self._stats()
+            calls = stats.calls
+            elapsed = (stats.last_end - stats.first_start) if stats.first_start and stats.last_end else 0.0
+            tail = stats.samples[-max(1, len(stats.samples) // 4):] if stats.samples else [self.concurrency]
+            return {
+                "calls": calls,
+                "retries": stats.retries,
+                "errors": dict(stats.errors),
+                "avg_latency_sec": round(stats.latency_total / calls, 2) if calls else 0.0,
+                "elapsed_sec": round(elapsed, 1),
+                "throughput_per_min": round(calls / elapsed * 60, 1) if elapsed else 0.0,
+                "initial_concurrency": self._initial,
+                "settled_concurrency": round(sum(tail) / len(tail), 2),
+            }
@@ -0,0 +1,63 @@
+"""LLM 応答からの JSON 取り出しモジュール（壊れた要素があっても残りを拾う）。
+
+従来は re.search(r"\\[.*\\]", ...) で配列全体を切り出して json.loads していたため、
+1 要素でも壊れているとバッチ全体が失われていた。ここでは配列の要素を先頭から
+1 つずつ読み進め、読めない要素だけを飛ばして次の要素から再開する。
+途中で打ち切られた応答（出力上限到達など）でも、それまでの完全な要素は返る。
+"""
+
+import json
+import re
+from typing import Iterator
+
+_decoder = json.JSONDecoder()
+_NEXT_OBJECT = re.compile(r"\}\s*,\s*(?=\{)")
+_NEXT_ITEM = re.compile(r",\s*")
+
+
+def iter_json_items(text: str) -> Iterator:
+    """応答テキスト中の最初の JSON 配列の要素を順に返す。壊れた要素は読み飛ばす。"""
+    if not text:
+        return
+    start = text.find("[")
+    if start < 0:
+        return
+    i, n = start + 1, len(text)
+    while i < n:
+        while i < n and text[i] in " \t\r\n,":
+            i += 1
+        if i >= n or text[i] == "]":
+            return
+        try:
+            item, i = _decoder.raw_decode(text, i)
+            yield item
+        except json.JSONDecodeError:
+            # オブジェクトなら次の兄弟オブジェクトの先頭まで、それ以外は次のカンマまで進める
+            pattern = _NEXT_OBJECT if text[i] == "{" else _NEXT_ITEM
+            m = pattern.search(text, i + 1)
+            if not m:
+                return
+            i = m.end()
+
+
+def parse_json_object(text: str) -> dict | None:
+    """応答テキスト中の最初の JSON オブジェクトを返す。読めなければ None。"""
+    if not text:
+        return None
+    start = text.find("{")
+    if start < 0:
+        return None
+    try:
+        obj, _ = _decoder.raw_decode(text, start)
+        return obj if isinstance(obj, dict) else None
+    except json.JSONDecodeError:
+        pass
+    # 前置き中の "{" に引っかかった場合に備え、最後の "}" までで再試行する
+    m = re.search(r"\{.*\}", text, re.DOTALL)
+    if m:
+        try:
+            obj = json.loads(m.group())
+            return obj if isinstance(obj, dict) else None
+        except json.JSONDecodeError:
+            pass
+    return None
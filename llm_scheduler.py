@@ -0,0 +1,194 @@
+"""プロセス内で共有する Gemini クォータスケジューラ。
+
+複数店舗の analyze_reviews を同じプロセスで並行に走らせると、各呼び出しが同じ API キーの
+クォータを奪い合い、口コミの多い店舗が少ない店舗を待たせ続けてしまう。
+ここでは全ての _generate 呼び出しを 1 つのスケジューラに通し、
+
+- モデルごとに RPM（リクエスト/分）と TPM（トークン/分）のトークンバケットで流量を制限する
+- 優先度クラス（interactive: 単店舗の対話実行 / batch: 夜間一括）の高い順に割り当てる
+- 同じ優先度の中では店舗ごとに消費トークンを仮想時刻として記録し、最も消費の少ない店舗から
+  割り当てる（開始時刻公平キューイング）
+
+割り当ては LLMController の同時実行枠を待つ前に受ける（枠を持ったままクォータを待たない）。
+acquire() は割り当ての並び順のキー（優先度, 開始仮想時刻, 到着順）を返し、LLMController は
+このキーの順に枠を引き渡すので、枠の待ち行列でも後から来た対話実行がバッチを追い越す。
+
+呼び出し元の店舗と優先度は contextvars で受け渡す（scheduling() の中で実行された呼び出しが対象）。
+待機は asyncio 上で行い、順番が来た呼び出しは自分のイベントループの Event で起こす
+（スレッドごとに別のイベントループで分析していても同じスケジューラを共有できる）。
+"""
+
+import asyncio
+import contextvars
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# モデルごとの上限（環境変数 GEMINI_RPM / GEMINI_TPM で全モデル共通に上書きできる）
+MODEL_LIMITS = {
+    "gemini-2.5-flash": {"rpm": 1000, "tpm": 1_000_000},
+    "gemini-2.5-flash-lite": {"rpm": 4000, "tpm": 4_000_000},
+    "gemini-2.5-pro": {"rpm": 150, "tpm": 2_000_000},
+}
+DEFAULT_LIMITS = {"rpm": 60, "tpm": 250_000}
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+_store: contextvars.ContextVar[str] = contextvars.ContextVar("llm_store", default="default")
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+@contextmanager
+def scheduling(store: str, priority: str = "interactive"):
+    """この中で行う LLM 呼び出しを store / priority のものとしてスケジューラに申告する。"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知の優先度: {priority}（{' / '.join(PRIORITIES)}）")
+    store_token = _store.set(store)
+    priority_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _store.reset(store_token)
+        _priority.reset(priority_token)
+
+
+def model_limits(model: str) -> dict:
+    limits = dict(MODEL_LIMITS.get(model, DEFAULT_LIMITS))
+    if os.getenv("GEMINI_RPM"):
+        limits["rpm"] = int(os.environ["GEMINI_RPM"])
+    if os.getenv("GEMINI_TPM"):
+        limits["tpm"] = int(os.environ["GEMINI_TPM"])
+    return limits
+
+
+class _Bucket:
+    """1 分あたり rate の速度で補充されるトークンバケット（容量も rate）。"""
+
+    def __init__(self, rate: float):
+        self.rate = float(rate)
+        self.level = float(rate)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.rate, self.level + (now - self.updated) * self.rate / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount を取り出せるようになるまでの秒数（0 なら今すぐ取り出せる）。"""
+        short = min(amount, self.rate) - self.level
+        return max(0.0, short * 60 / self.rate)
+
+
+class _Ticket:
+    __slots__ = ("model", "tokens", "store", "rank", "start", "seq", "loop", "event")
+
+    def __init__(self, model: str, tokens: int, store: str, rank: int, start: float, seq: int):
+        self.model = model
+        self.tokens = tokens
+        self.store = store
+        self.rank = rank
+        self.start = start
+        self.seq = seq
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def wake(self) -> None:
+        self.loop.call_soon_threadsafe(self.event.set)
+
+
+class QuotaScheduler:
+    """RPM / TPM の予算と優先度・店舗間の公平性に従って API 呼び出しを割り当てる。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[_Bucket, _Bucket]] = {}
+        self._waiting: list[_Ticket] = []
+        self._served: dict[str, float] = {}  # 店舗ごとの仮想時刻（割り当て済みトークン数）
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self.stats: dict[str, dict] = {}
+
+    async def acquire(self, model: str, tokens: int) -> tuple[int, float, int]:
+        """呼び出し 1 回ぶん（推定 tokens トークン）の枠が割り当てられるまで待ち、並び順のキーを返す。"""
+        store, priority = _store.get(), _priority.get()
+        with self._lock:
+            # バックログのなかった店舗は現在の仮想時刻から始める（過去の空き時間を貯金させない）
+            backlog = any(t.store == store for t in self._waiting)
+            finish = self._served.get(store, 0.0)
+            start = finish if backlog else max(finish, self._vtime)
+            ticket = _Ticket(model, tokens, store, PRIORITIES[priority], start, next(self._seq))
+            self._served[store] = start + tokens
+            self._waiting.append(ticket)
+        queued_at = time.monotonic()
+        granted = False
+        try:
+            while True:
+                with self._lock:
+                    timeout = None
+                    if self._head(model) is ticket:
+                        rpm, tpm = self._model_buckets(model)
+                        now = time.monotonic()
+                        rpm.refill(now)
+                        tpm.refill(now)
+                        timeout = max(rpm.wait_time(1), tpm.wait_time(tokens))
+                        if timeout == 0:
+                            rpm.level -= 1
+                            tpm.level -= min(tokens, tpm.rate)
+                            self._waiting.remove(ticket)
+                            self._vtime = max(self._vtime, ticket.start)
+                            self._record(store, priority, tokens, time.monotonic() - queued_at)
+                            granted = True
+                            self._wake_heads()
+                            return ticket.rank, ticket.start, ticket.seq
+                    ticket.event.clear()
+                try:
+                    # 先頭でなければ起こされるまで、先頭なら予算が補充されるまで待つ
+                    await asyncio.wait_for(ticket.event.wait(), timeout)
+                except TimeoutError:
+                    pass
+        finally:
+            if not granted:
+                with self._lock:
+                    self._waiting.remove(ticket)
+                    self._wake_heads()
+
+    def settle(self, model: str, estimated: int, actual: int) -> None:
+        """応答後に実トークン数との差を TPM バケットへ反映する。"""
+        with self._lock:
+            _, tpm = self._model_buckets(model)
+            tpm.level = min(tpm.rate, tpm.level - (actual - estimated))
+            store = _store.get()
+            if store in self._served:
+                self._served[store] += actual - estimated
+            self._wake_heads()
+
+    def report(self) -> dict:
+        with self._lock:
+            return {store: dict(s) for store, s in self.stats.items()}
+
+    def _head(self, model: str) -> _Ticket | None:
+        candidates = [t for t in self._waiting if t.model == model]
+        return min(candidates, key=lambda t: (t.rank, t.start, t.seq)) if candidates else None
+
+    def _wake_heads(self) -> None:
+        """モデルごとの待ち行列の先頭を起こす（ロック保持中に呼ぶ）。"""
+        for model in {t.model for t in self._waiting}:
+            self._head(model).wake()
+
+    def _model_buckets(self, model: str) -> tuple[_Bucket, _Bucket]:
+        if model not in self._buckets:
+            limits = model_limits(model)
+            self._buckets[model] = (_Bucket(limits["rpm"]), _Bucket(limits["tpm"]))
+        return self._buckets[model]
+
+    def _record(self, store: str, priority: str, tokens: int, waited: float) -> None:
+        s = self.stats.setdefault(store, {"priority": priority, "calls": 0, "tokens": 0, "wait_sec": 0.0})
+        s["calls"] += 1
+        s["tokens"] += tokens
+        s["wait_sec"] = round(s["wait_sec"] + waited, 3)
+
+
+# プロセス全体で共有するスケジューラ
+scheduler = QuotaScheduler()
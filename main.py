@@ -7,10 +7,7 @@ import json
 import os
 import subprocess
 import sys
-
-import nest_asyncio
-
-nest_asyncio.apply()
+from datetime import datetime
 
 
 def parse_args() -> argparse.Namespace:
@@ -22,6 +19,10 @@ def parse_args() -> argparse.Namespace:
   python main.py --name "テスト食堂" --google-maps "https://www.google.com/maps/..." --tabelog "https://tabelog.com/..."
   python main.py --name "テスト食堂" --skip-scrape   # 既存JSONから分析のみ再実行
   python main.py --name "テスト食堂" --google-maps "..." --max-reviews 200  # 全サイト200件上限
+  python main.py --name "テスト食堂" --tabelog "..." --incremental   # 新しい口コミだけを追加分析
+  python main.py --name "テスト食堂" --skip-scrape --dry-run   # 再計算が必要なステージだけを表示
+  python main.py --name "テスト食堂" --skip-scrape --force-stage experience   # 体験価値だけ計算し直す
+  python main.py --name "テスト食堂" --skip-scrape --plan   # 呼び出し回数・トークン数・費用・所要時間を見積もる
 """,
     )
     parser.add_argument("--name", default="店舗", help="店舗名（レポートのタイトルに使用）")
@@ -42,6 +43,75 @@ def parse_args() -> argparse.Namespace:
         metavar="N",
         help="各サイトの取得上限件数（省略時は起動時に対話確認）",
     )
+    parser.add_argument(
+        "--keyword-engine",
+        dest="keyword_engine",
+        choices=["llm", "janome", "hybrid"],
+        default="llm",
+        help="キーワード抽出エンジン（llm: Gemini / janome: 形態素解析のみ / hybrid: Janome 候補を Gemini で選別）",
+    )
+    parser.add_argument(
+        "--discovery",
+        choices=["full", "adaptive"],
+        default="full",
+        help="キーワード発見モード（adaptive: 新規キーワードの発見が飽和したら LLM 呼び出しを打ち切る）",
+    )
+    parser.add_argument(
+        "--discovery-threshold",
+        dest="discovery_threshold",
+        type=float,
+        default=1.0,
+        metavar="X",
+        help="adaptive 時の停止閾値（直近3バッチの平均新規キーワード数、デフォルト: 1.0）",
+    )
+    parser.add_argument(
+        "--kando-margin",
+        dest="kando_margin",
+        type=float,
+        default=None,
+        metavar="E",
+        help="感動分析を層化抽出で行う場合の誤差目標（例: 0.05 = ±5pt）。省略時は全件採点",
+    )
+    parser.add_argument(
+        "--trend",
+        choices=["month", "week"],
+        default="month",
+        help="トレンド（キーワード出現率・評点・感動スコアの推移）の集計単位",
+    )
+    parser.add_argument(
+        "--no-compress",
+        action="store_true",
+        help="LLM に渡す口コミ本文の圧縮（定型文・絵文字・繰り返し・共通文の除去）を行わない",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="前回の reviews_analyzed.json に未分析の口コミだけを足し込む（文章の分析結果は前回のまま）",
+    )
+    parser.add_argument(
+        "--force-stage",
+        dest="force_stage",
+        default="",
+        metavar="STAGES",
+        help="キャッシュがあっても計算し直すステージ（カンマ区切り: keywords,experience,kando,gap）",
+    )
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="reviews_raw.json の分析で各ステージが実行されるかキャッシュを使うかを表示して終了（LLM は呼ばない）",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="reviews_raw.json を分析した場合の LLM 呼び出し回数・トークン数・費用・所要時間をステージごとに見積もって終了（LLM は呼ばない）",
+    )
+    parser.add_argument(
+        "--priority",
+        choices=["interactive", "batch"],
+        default="interactive",
+        help="Gemini クォータの優先度（batch: 夜間一括など、対話実行より後回しにしてよい実行）",
+    )
     return parser.parse_args()
 
 
@@ -61,47 +131,208 @@ def _ask_max_reviews(site_name: str, cli_value: int | None) -> int | None:
         print("  ⚠️ 正の整数を入力するか、Enterを押してください。")
 
 
-async def run_scrapers(args: argparse.Namespace, limits: dict[str, int | None]) -> list[dict]:
-    """指定された URL からスクレイピングを実行し、全口コミを返す。"""
+async def run_scrapers(args: argparse.Namespace, limits: dict[str, int | None], on_reviews=None) -> list[dict]:
+    """指定された URL からスクレイピングを実行し、全口コミを返す。on_reviews は各スクレイパーに渡す。
+
+    各口コミには取得時刻 scraped_at を付け（「3 か月前」などの相対日付の基準になる）、
+    本文をその場で正規化する（normalizer.normalize_review。保存後の再分析では正規化を飛ばせる）。
+    """
+    from normalizer import normalize_review
+    from profiler import profiler
     from scrapers import scrape_google_maps, scrape_tabelog, scrape_tripadvisor
 
     all_reviews: list[dict] = []
+    scraped_at = datetime.now().astimezone().isoformat(timespec="seconds")
+
+    def stamp(reviews: list[dict]) -> list[dict]:
+        for r in reviews:
+            r.setdefault("scraped_at", scraped_at)
+            normalize_review(r)
+        return reviews
+
+    if on_reviews is not None:
+        forward = on_reviews
+
+        async def on_reviews(reviews: list[dict]) -> None:
+            await forward(stamp(reviews))
 
     if args.google_maps:
         try:
-            reviews = await scrape_google_maps(args.google_maps, max_reviews=limits["google_maps"])
-            all_reviews.extend(reviews)
+            with profiler.span("google_maps", "site"):
+                reviews = await scrape_google_maps(args.google_maps, max_reviews=limits["google_maps"],
+                                                   on_reviews=on_reviews)
+            all_reviews.extend(stamp(reviews))
         except Exception as e:
             print(f"⚠️ Google マップ スクレイピングエラー: {e}")
 
     if args.tabelog:
         try:
-            reviews = await scrape_tabelog(args.tabelog, max_reviews=limits["tabelog"])
-            all_reviews.extend(reviews)
+            with profiler.span("tabelog", "site"):
+                reviews = await scrape_tabelog(args.tabelog, max_reviews=limits["tabelog"],
+                                               on_reviews=on_reviews)
+            all_reviews.extend(stamp(reviews))
         except Exception as e:
             print(f"⚠️ 食べログ スクレイピングエラー: {e}")
 
     if args.tripadvisor:
         try:
-            reviews = await scrape_tripadvisor(args.tripadvisor, max_reviews=limits["tripadvisor"])
-            all_reviews.extend(reviews)
+            with profiler.span("tripadvisor", "site"):
+                reviews = await scrape_tripadvisor(args.tripadvisor, max_reviews=limits["tripadvisor"],
+                                                   on_reviews=on_reviews)
+            all_reviews.extend(stamp(reviews))
         except Exception as e:
             print(f"⚠️ TripAdvisor スクレイピングエラー: {e}")
 
     return all_reviews
 
 
+def load_raw_reviews(path: str) -> list[dict]:
+    """保存済みの口コミを読み込む。取得時刻のない口コミ（旧形式）はファイルの更新時刻を取得時刻とみなす。"""
+    with open(path, encoding="utf-8") as f:
+        reviews = json.load(f)
+    saved_at = datetime.fromtimestamp(os.path.getmtime(path)).astimezone().isoformat(timespec="seconds")
+    for r in reviews:
+        r.setdefault("scraped_at", saved_at)
+    return reviews
+
+
+def _force_stages(raw: str) -> list[str]:
+    from analyzer import ANALYSIS_STAGES
+
+    stages = [s.strip() for s in raw.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in ANALYSIS_STAGES]
+    if unknown:
+        print(f"❌ エラー: 未知のステージ: {', '.join(unknown)}（{' / '.join(ANALYSIS_STAGES)}）")
+        sys.exit(1)
+    return stages
+
+
+def print_stage_plan(args: argparse.Namespace, raw_json_path: str) -> None:
+    """保存済みの口コミを分析した場合のステージごとの実行予定を表示する（--dry-run）。"""
+    from analyzer import plan_analysis
+
+    reviews = load_raw_reviews(raw_json_path)
+    plan = plan_analysis(reviews, keyword_engine=args.keyword_engine, store_name=args.name,
+                         discovery=args.discovery, discovery_threshold=args.discovery_threshold,
+                         kando_margin=args.kando_margin, compress=not args.no_compress,
+                         force_stages=_force_stages(args.force_stage))
+    labels = {"cached": "♻️ キャッシュを使用", "run": "▶️ 実行", "forced": "🔁 実行（--force-stage）"}
+    print(f"\n📋 実行予定（{raw_json_path}: {len(reviews)}件）")
+    for row in plan:
+        key = row["key"] or "上流の結果で決まる"
+        print(f"  {row['stage']:<12} {labels[row['status']]:<24} {key}")
+
+
+def print_cost_plan(args: argparse.Namespace, raw_json_path: str, analyzed_json_path: str) -> None:
+    """保存済みの口コミを分析した場合の呼び出し回数・トークン数・費用・所要時間を表示する（--plan）。
+
+    前回の分析結果があれば、その token_usage で出力トークンの見込みを較正する。
+    """
+    from planner import plan_run, print_plan
+
+    history = None
+    if os.path.exists(analyzed_json_path):
+        with open(analyzed_json_path, encoding="utf-8") as f:
+            history = json.load(f)
+    plan = plan_run(load_raw_reviews(raw_json_path), keyword_engine=args.keyword_engine, store_name=args.name,
+                    discovery=args.discovery, discovery_threshold=args.discovery_threshold,
+                    kando_margin=args.kando_margin, compress=not args.no_compress,
+                    force_stages=_force_stages(args.force_stage), history=history)
+    print_plan(plan)
+
+
+async def collect_and_analyze(args: argparse.Namespace, limits: dict[str, int | None], raw_json_path: str,
+                              previous: dict | None = None) -> dict:
+    """口コミを収集（または保存済み JSON から読み込み）し、同じイベントループ上で分析する。
+
+    スクレイピング時は取得した口コミをその場で分析パイプラインに流し、バッチ単位の分析を収集と並行に進める。
+    previous（前回の分析結果）を渡すと、未分析の口コミだけを足し込む増分分析を行う。
+    """
+    if previous is not None:
+        from analyzer import analyze_increment_async
+
+        if args.skip_scrape:
+            all_reviews = load_raw_reviews(raw_json_path)
+        else:
+            print(f"\n🚀 口コミ収集を開始します（店舗名: {args.name}）\n")
+            all_reviews = await run_scrapers(args, limits)
+            with open(raw_json_path, "w", encoding="utf-8") as f:
+                json.dump(all_reviews, f, ensure_ascii=False, indent=2)
+        return await analyze_increment_async(previous, all_reviews, store_name=args.name, priority=args.priority,
+                                             trend_granularity=args.trend, compress=not args.no_compress)
+
+    options = {
+        "keyword_engine": args.keyword_engine,
+        "store_name": args.name,
+        "discovery": args.discovery,
+        "discovery_threshold": args.discovery_threshold,
+        "kando_margin": args.kando_margin,
+        "priority": args.priority,
+        "trend_granularity": args.trend,
+        "compress": not args.no_compress,
+        "force_stages": _force_stages(args.force_stage),
+    }
+    if args.skip_scrape:
+        print(f"⏭️  スクレイピングをスキップ。{raw_json_path} を読み込みます...")
+        all_reviews = load_raw_reviews(raw_json_path)
+        print(f"  📂 {len(all_reviews)}件の口コミを読み込みました。")
+
+        from analyzer import analyze_reviews_async
+
+        return await analyze_reviews_async(all_reviews, **options)
+
+    from pipeline import ReviewStream
+
+    print(f"\n🚀 口コミ収集を開始します（店舗名: {args.name}）\n")
+    stream = ReviewStream(**options)
+    consumer = asyncio.create_task(stream.run())
+    # 途中でエラーになったサイトの分も含め、分析に流した口コミをそのまま保存する
+    all_reviews: list[dict] = []
+
+    async def feed(reviews: list[dict]) -> None:
+        all_reviews.extend(reviews)
+        await stream.put(reviews)
+
+    try:
+        await run_scrapers(args, limits, on_reviews=feed)
+    finally:
+        await stream.close()
+
+    if not all_reviews:
+        consumer.cancel()
+        print("⚠️ 口コミが1件も取得できませんでした。URL を確認してください。")
+        sys.exit(1)
+
+    with open(raw_json_path, "w", encoding="utf-8") as f:
+        json.dump(all_reviews, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 {len(all_reviews)}件の口コミを {raw_json_path} に保存しました。")
+
+    return await consumer
+
+
 def main() -> None:
     args = parse_args()
 
     # URL もスキップフラグも指定なし
-    if not args.skip_scrape and not any([args.google_maps, args.tabelog, args.tripadvisor]):
+    if not (args.skip_scrape or args.dry_run or args.plan) and not any([args.google_maps, args.tabelog, args.tripadvisor]):
         print("❌ エラー: --google-maps / --tabelog / --tripadvisor のいずれかを指定してください。")
         print("   既存 JSON から再分析する場合は --skip-scrape を指定してください。")
         sys.exit(1)
 
     raw_json_path = "reviews_raw.json"
     analyzed_json_path = "reviews_analyzed.json"
+    trace_json_path = "reviews_analyzed_trace.json"
+
+    # ---- 実行予定・見積もりの表示のみ（--dry-run / --plan）----
+    if args.dry_run or args.plan:
+        if not os.path.exists(raw_json_path):
+            print(f"❌ エラー: {raw_json_path} が見つかりません。先にスクレイピングを実行してください。")
+            sys.exit(1)
+        if args.dry_run:
+            print_stage_plan(args, raw_json_path)
+        if args.plan:
+            print_cost_plan(args, raw_json_path, analyzed_json_path)
+        return
 
     # ---- 取得上限の確認（スクレイピング実行時のみ）----
     limits: dict[str, int | None] = {"google_maps": None, "tabelog": None, "tripadvisor": None}
@@ -114,37 +345,37 @@ def main() -> None:
         if args.tripadvisor:
             limits["tripadvisor"] = _ask_max_reviews("TripAdvisor", args.max_reviews)
 
-    # ---- スクレイピング ----
-    if args.skip_scrape:
-        if not os.path.exists(raw_json_path):
-            print(f"❌ エラー: {raw_json_path} が見つかりません。先にスクレイピングを実行してください。")
+    # ---- スクレイピング + Gemini 分析（同じイベントループで実行）----
+    if args.skip_scrape and not os.path.exists(raw_json_path):
+        print(f"❌ エラー: {raw_json_path} が見つかりません。先にスクレイピングを実行してください。")
+        sys.exit(1)
+    previous = None
+    if args.incremental:
+        # 増分分析ではキーワード発見と感動の全件採点のやり直しを行わないため、これらの指定は使えない
+        unsupported = [flag for flag, given in (("--keyword-engine", args.keyword_engine != "llm"),
+                                                ("--discovery", args.discovery != "full"),
+                                                ("--kando-margin", args.kando_margin is not None),
+                                                ("--force-stage", bool(args.force_stage))) if given]
+        if unsupported:
+            print(f"❌ エラー: --incremental では {' / '.join(unsupported)} を指定できません。")
             sys.exit(1)
-        print(f"⏭️  スクレイピングをスキップ。{raw_json_path} を読み込みます...")
-        with open(raw_json_path, encoding="utf-8") as f:
-            all_reviews = json.load(f)
-        print(f"  📂 {len(all_reviews)}件の口コミを読み込みました。")
-    else:
-        print(f"\n🚀 口コミ収集を開始します（店舗名: {args.name}）\n")
-        all_reviews = asyncio.run(run_scrapers(args, limits))
-
-        if not all_reviews:
-            print("⚠️ 口コミが1件も取得できませんでした。URL を確認してください。")
+        if not os.path.exists(analyzed_json_path):
+            print(f"❌ エラー: {analyzed_json_path} が見つかりません。先に全件分析を実行してください。")
             sys.exit(1)
-
-        with open(raw_json_path, "w", encoding="utf-8") as f:
-            json.dump(all_reviews, f, ensure_ascii=False, indent=2)
-        print(f"\n💾 {len(all_reviews)}件の口コミを {raw_json_path} に保存しました。")
-
-    # ---- Gemini 分析 ----
-    from analyzer import analyze_reviews
-
-    analysis = analyze_reviews(all_reviews)
+        with open(analyzed_json_path, encoding="utf-8") as f:
+            previous = json.load(f)
+        from incremental import STATS_VERSION
+        if (previous.get("stats") or {}).get("version") != STATS_VERSION or "matrix" not in previous.get("kando", {}):
+            print(f"❌ エラー: {analyzed_json_path} に現在の形式の増分分析用統計量がありません。全件分析をやり直してください。")
+            sys.exit(1)
+    analysis = asyncio.run(collect_and_analyze(args, limits, raw_json_path, previous))
 
     with open(analyzed_json_path, "w", encoding="utf-8") as f:
         json.dump(analysis, f, ensure_ascii=False, indent=2)
     print(f"💾 分析結果を {analyzed_json_path} に保存しました。")
 
     # ---- HTML レポート生成 ----
+    from profiler import profiler
     from reporter import generate_report
 
     generate_report(args.name, analysis, output_path=args.output)
@@ -152,10 +383,16 @@ def main() -> None:
     # ---- Netlify へ自動デプロイ ----
     print("\n📤 Netlify へ自動デプロイ中...")
     share_sh = os.path.join(os.path.dirname(os.path.abspath(__file__)), "share.sh")
-    result = subprocess.run(["bash", share_sh, args.name], capture_output=False)
+    with profiler.span("share.sh", "deploy"):
+        result = subprocess.run(["bash", share_sh, args.name], capture_output=False)
     if result.returncode != 0:
         print("⚠️ デプロイに失敗しました。手動で bash share.sh を実行してください。")
 
+    # ---- 実行プロファイル ----
+    profiler.write_trace(trace_json_path)
+    profiler.print_summary()
+    print(f"💾 トレースを {trace_json_path} に保存しました（chrome://tracing / ui.perfetto.dev で表示）。")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,216 @@
+"""Gemini の代わりに決定的な応答を返すモックと、合成の口コミコーパス（テストと bench_scale.py で共有）。
+
+MockBackend は analyzer._client と差し替えて使う。応答スキーマ（analyzer の *_SCHEMA）でステージを
+見分け、プロンプトの口コミから決まる応答を返すので、同じ入力なら何度分析しても同じ結果になる。
+応答までの待ち時間と、一時エラー / レート制限の割合を指定できる（プロンプトと試行回数から決まる）。
+
+synthetic_reviews は日本語の合成口コミ（評点・サイト・日付付き、一部は別サイトへの転載）を作る。
+"""
+
+import asyncio
+import json
+import random
+import re
+import zlib
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+SCRAPED_AT = "2026-01-15T12:00:00+09:00"
+REPOST_RATE = 0.02  # 別サイトにも投稿された（近似重複の）口コミの割合
+UNLIMITED_QUOTA = str(10 ** 12)  # GEMINI_RPM / GEMINI_TPM に設定するとクォータ待ちがなくなる
+
+# ---------------------------------------------------------------------------
+# 合成コーパス
+# ---------------------------------------------------------------------------
+
+DISHES = ["ラーメン", "餃子", "天ぷら", "お寿司", "ハンバーグ", "パスタ", "カレー", "焼き鳥", "抹茶パフェ",
+          "だし巻き卵", "唐揚げ", "海鮮丼", "ピザ", "ステーキ", "そば", "チーズケーキ", "親子丼", "オムライス",
+          "たこ焼き", "牛タン", "担々麺", "ローストビーフ", "もつ鍋", "あんみつ"]
+SCENES = ["友人と", "家族で", "一人で", "出張のついでに", "記念日に", "子連れで", "仕事帰りに", "観光の途中で",
+          "彼女と", "同僚と", "両親を連れて", "雨の日に"]
+# 語 → ポジネガ（モックのキーワード抽出・表記判定もこの語彙を使う）
+VOCAB = {
+    "美味しい": "positive", "最高": "positive", "感動": "positive", "雰囲気": "positive", "コスパ": "positive",
+    "映え": "positive", "また来たい": "positive", "丁寧": "positive", "居心地": "positive", "絶品": "positive",
+    "ボリューム": "positive", "非日常": "positive", "懐かしい": "positive", "新鮮": "positive",
+    "残念": "negative", "待ちすぎ": "negative", "高い": "negative", "狭い": "negative", "しょっぱい": "negative",
+    "冷めて": "negative", "うるさい": "negative", "普通": "neutral",
+}
+# {dish} {dish2} {scene} {price} {minutes} {count} を口コミごとに埋める
+POSITIVE_SENTENCES = [
+    "{dish}が本当に美味しいです。", "{dish}は絶品で、また来たいと思いました。", "店内の雰囲気が最高でした。",
+    "スタッフの対応が丁寧で居心地が良かったです。", "{price}円でこのボリュームはコスパが良いと思います。",
+    "{dish}の盛り付けが映えるので写真を撮る人が多かったです。", "非日常を味わえて感動しました。",
+    "素材が新鮮で、{dish}の味が濃かったです。", "どこか懐かしい味の{dish2}で落ち着きます。",
+    "{scene}来ても満足できる{dish}でした。", "{count}回目の訪問ですが毎回最高です。",
+]
+NEGATIVE_SENTENCES = [
+    "週末は待ちすぎで、入店まで{minutes}分かかりました。", "{dish}が少ししょっぱかったのが残念です。",
+    "{dish2}が冷めて出てきたのが残念でした。", "{price}円は高いわりに量が少なめです。", "席が狭いので落ち着きません。",
+    "隣の団体客がうるさくて{dish}の話もしにくかったです。", "{dish}の提供まで{minutes}分待たされたのは残念です。",
+]
+NEUTRAL_SENTENCES = [
+    "{scene}訪問しました。", "{dish}と{dish2}を注文しました。", "駅から歩いて{minutes}分ほどです。",
+    "{count}人でランチの時間帯に伺いました。", "{dish2}の味は普通だと思います。", "予約なしで{count}人で入れました。",
+    "お会計は{count}人で{price}円くらいでした。",
+]
+# 口コミごとの固有の文（名詞 × 名詞 × 述語の組み合わせ）。テンプレート文だけだと、件数が増えるほど
+# 偶然の近似重複と、近似重複検出（LSH）の候補の衝突が実際の口コミより多くなる
+NOUNS = ["店主", "女将さん", "店員さん", "常連さん", "カウンター", "テラス", "個室", "窓際", "厨房", "看板",
+         "暖簾", "器", "箸置き", "おしぼり", "お冷", "BGM", "照明", "内装", "外観", "入口", "階段", "駐車場",
+         "券売機", "メニュー表", "黒板", "生け花", "提灯", "坪庭", "のれん", "ソファ", "座布団", "屋号",
+         "商店街", "路地", "バス停", "交差点", "川沿い", "公園", "神社", "美術館", "映画館", "本屋",
+         "土曜日", "平日", "夕方", "開店前", "閉店間際", "梅雨", "年末", "連休"]
+PREDICATES = ["が印象的でした", "が気になりました", "が素朴でした", "が新しくなっていました", "がよく見えました",
+              "の話で盛り上がりました", "を覚えていてくれました", "が少し分かりにくかったです", "が近くにあります",
+              "も含めて楽しめました", "の写真を撮りました", "が混み合っていました", "が静かでした",
+              "がおしゃれでした", "に人が並んでいました", "を通って行きました", "の向かいにあります",
+              "が昔のままでした", "が工事中でした", "もきれいに整っていました"]
+SOURCES = ("google_maps", "tabelog", "tripadvisor")
+
+
+def synthetic_reviews(n: int, seed: int = 42) -> list[dict]:
+    """n 件の合成口コミ。評点が高いほど好意的な文が多い。REPOST_RATE の割合で他サイトへの転載を混ぜる。"""
+    rng = random.Random(seed)
+    today = date.fromisoformat(SCRAPED_AT[:10])
+    reviews = []
+    for i in range(n):
+        if reviews and rng.random() < REPOST_RATE:
+            original = rng.choice(reviews)
+            source = rng.choice([s for s in SOURCES if s != original["source"]])
+            reviews.append(dict(original, source=source, text=original["text"] + rng.choice(["", "。", "！"]),
+                                date=_date_label(source, today - timedelta(days=rng.randrange(1, 900)), today),
+                                reviewer_name=f"ユーザー{i}"))
+            continue
+        rating = rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 4, 6, 5])[0]
+        sentences = [rng.choice(NEUTRAL_SENTENCES)]
+        for _ in range(rng.randint(1, 3)):
+            positive = rng.random() < (rating - 0.5) / 5
+            sentences.append(rng.choice(POSITIVE_SENTENCES if positive else NEGATIVE_SENTENCES))
+        for _ in range(rng.randint(3, 4)):
+            sentences.append(f"{rng.choice(NOUNS)}の{rng.choice(NOUNS)}{rng.choice(PREDICATES)}。")
+        rng.shuffle(sentences)
+        dish, dish2 = rng.sample(DISHES, 2)
+        text = "".join(sentences).format(dish=dish, dish2=dish2, scene=rng.choice(SCENES),
+                                         price=rng.randrange(800, 12000, 100), minutes=rng.randint(5, 90),
+                                         count=rng.randint(2, 6))
+        source = rng.choice(SOURCES)
+        visited = today - timedelta(days=rng.randrange(1, 900))
+        reviews.append({
+            "source": source,
+            "reviewer_name": f"ユーザー{i}",
+            "rating": float(rating),
+            "date": _date_label(source, visited, today),
+            "text": text,
+            "scraped_at": SCRAPED_AT,
+        })
+    return reviews
+
+
+def _date_label(source: str, visited: date, today: date) -> str:
+    """サイトごとの日付表記（Google マップは相対表記、食べログは年月日、TripAdvisor は年月）。"""
+    if source == "google_maps":
+        days = (today - visited).days
+        if days < 30:
+            return f"{max(1, days // 7)} 週間前"
+        if days < 365:
+            return f"{days // 30} か月前"
+        return f"{days // 365} 年前"
+    if source == "tabelog":
+        return f"{visited.year}/{visited.month:02d}/{visited.day:02d} 訪問"
+    return f"{visited.year}年{visited.month}月"
+
+
+# ---------------------------------------------------------------------------
+# モックの LLM バックエンド
+# ---------------------------------------------------------------------------
+
+_ROW = re.compile(r"^\[(\d+)\] (.*)$", re.M)
+
+
+def _unit(*parts) -> float:
+    """parts から決まる [0, 1) の値。"""
+    return zlib.crc32(":".join(map(str, parts)).encode("utf-8")) / 2 ** 32
+
+
+class MockBackend:
+    """analyzer._client の代わり。応答スキーマでステージを見分け、プロンプトから決定的な応答を返す。"""
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, rate_limit_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.attempts: dict[int, int] = {}
+        self.aio = SimpleNamespace(models=self)
+        self.models = SimpleNamespace(list=lambda: [])
+
+    async def generate_content(self, model: str, contents: str, config=None):
+        from google.genai import errors
+
+        key = zlib.crc32(contents.encode("utf-8"))
+        attempt = self.attempts.get(key, 0)
+        self.attempts[key] = attempt + 1
+        await asyncio.sleep(self.latency * (0.5 + _unit(key, "latency")))
+        u = _unit(key, attempt)
+        if u < self.rate_limit_rate:
+            raise errors.ClientError(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                                     "message": "mock quota exceeded"}})
+        if u < self.rate_limit_rate + self.error_rate:
+            raise errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE", "message": "mock"}})
+        return SimpleNamespace(text=self._respond(contents, self._schema_of(config)), usage_metadata=None)
+
+    @staticmethod
+    def _schema_of(config):
+        """応答スキーマ（analyzer の *_SCHEMA）。GenerateContentConfig は dict を Schema に変換するので比べて探す。"""
+        import analyzer
+        from google.genai import types
+
+        if config is None or config.response_schema is None:
+            return None
+        for schema in (analyzer.KEYWORDS_SCHEMA, analyzer.NORMALIZE_SCHEMA, analyzer.KANDO_SCHEMA,
+                       analyzer.EXPERIENCE_SCHEMA, analyzer.GAP_SCHEMA, analyzer.GAP_MAP_SCHEMA,
+                       analyzer.GAP_REDUCE_SCHEMA):
+            if types.GenerateContentConfig(response_schema=schema).response_schema == config.response_schema:
+                return schema
+        return None
+
+    def _respond(self, prompt: str, schema) -> str:
+        import analyzer
+
+        rows = [(int(i), text) for i, text in _ROW.findall(prompt)]
+        ids = [i for i, _ in rows] or [0]
+        if schema is analyzer.KEYWORDS_SCHEMA:
+            items = [{"id": i, "words": [w for w in VOCAB if w in text]} for i, text in rows]
+        elif schema is analyzer.NORMALIZE_SCHEMA:
+            items = [{"id": i, "word": w if w in VOCAB else "", "sentiment": VOCAB.get(w, "neutral"),
+                      "confidence": 0.9} for i, w in rows]
+        elif schema is analyzer.KANDO_SCHEMA:
+            items = [{"id": i, **{t: int(_unit(text, t) * 4) for t in analyzer.KANDO_TYPES}} for i, text in rows]
+        elif schema is analyzer.EXPERIENCE_SCHEMA:
+            return json.dumps({"headline": "合成データの体験価値", "summary": "モックの要約",
+                               "strengths": [{"title": "味", "description": "料理の評価が高い"}],
+                               "weaknesses": [{"title": "待ち時間", "description": "週末は混雑する"}]},
+                              ensure_ascii=False)
+        elif schema is analyzer.GAP_SCHEMA:
+            return json.dumps({"motivations": [
+                {"title": f"来店動機{k}", "description": "合成データの動機",
+                 "evidence": [{"index": ids[(k + j) % len(ids)], "quote": "引用"} for j in range(2)],
+                 "satisfaction": ("satisfied", "partial", "gap")[k % 3], "satisfaction_score": 60 + k * 10,
+                 "satisfaction_desc": "充足状況", "satisfaction_evidence": [{"index": ids[k % len(ids)], "quote": "引用"}]}
+                for k in range(3)], "overall_comment": "総合コメント"}, ensure_ascii=False)
+        elif schema is analyzer.GAP_MAP_SCHEMA:
+            return json.dumps({"motivations": [
+                {"title": f"来店動機{k}", "description": "合成データの動機",
+                 "evidence": [{"index": ids[(k + j) % len(ids)], "quote": "引用"} for j in range(2)],
+                 "mention_count": len(ids) // (k + 2) + 1, "satisfied_count": len(ids) // (k + 3),
+                 "partial_count": 1, "gap_count": k,
+                 "satisfaction_evidence": [{"index": ids[k % len(ids)], "quote": "引用"}]}
+                for k in range(3)]}, ensure_ascii=False)
+        elif schema is analyzer.GAP_REDUCE_SCHEMA:
+            return json.dumps({"motivations": [
+                {"title": f"統合動機{k}", "description": "合成データの動機", "members": ids[k::3],
+                 "satisfaction_desc": "充足状況"} for k in range(3)], "overall_comment": "総合コメント"},
+                ensure_ascii=False)
+        else:
+            return "モックのコメントです。"
+        return json.dumps(items, ensure_ascii=False)
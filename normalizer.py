@@ -0,0 +1,61 @@
+"""口コミ本文の取り込み時正規化モジュール。
+
+スクレイピング直後に 1 回だけ、次の処理をまとめて行う。
+- サイトが付加するメタデータ（Google マップの「食事の種類」「1 人あたりの料金」「食事: 5」など）以降を除去
+- NFKC 正規化（全角英数字・半角カナ・全角記号の幅をそろえる）と空白・改行の整理
+- 正規化後の本文のハッシュ（content_hash）
+
+処理済みの口コミには normalized = NORMALIZER_VERSION を付けるので、reviews_raw.json を読み込んで
+再分析するときは処理を丸ごと飛ばす。正規化の内容を変えたら NORMALIZER_VERSION を上げる。
+"""
+
+import hashlib
+import re
+import unicodedata
+
+NORMALIZER_VERSION = 1
+
+# NFKC の後に照合するので、全角のコロン・数字は半角になっている
+_METADATA = re.compile(
+    r"食事の種類"
+    r"|1\s*人あたりの料金"
+    r"|食事:\s*\d"
+    r"|サービス:\s*\d"
+    r"|雰囲気:\s*\d"
+    r"|予約\n"
+    r"|グループの人数"
+)
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_SPACE_AROUND_NEWLINE = re.compile(r" ?\n ?")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_text(text: str) -> str:
+    """本文を正規化する（NFKC → メタデータ除去 → 空白の整理）。"""
+    text = unicodedata.normalize("NFKC", text or "")
+    m = _METADATA.search(text)
+    if m:
+        text = text[:m.start()]
+    text = _SPACES.sub(" ", text)
+    text = _SPACE_AROUND_NEWLINE.sub("\n", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def content_hash(text: str) -> str:
+    """正規化済み本文のハッシュ（16 桁）。"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def mark_normalized(review: dict) -> dict:
+    """本文が正規化済みの口コミに content_hash と処理済みの印を付ける（その場で更新して返す）。"""
+    review["content_hash"] = content_hash(review.get("text", ""))
+    review["normalized"] = NORMALIZER_VERSION
+    return review
+
+
+def normalize_review(review: dict) -> dict:
+    """口コミ 1 件を正規化する（その場で更新して返す）。処理済みなら何もしない。"""
+    if review.get("normalized") == NORMALIZER_VERSION:
+        return review
+    review["text"] = normalize_text(review.get("text", ""))
+    return mark_normalized(review)
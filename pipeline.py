@@ -0,0 +1,182 @@
+"""スクレイピングと分析を重ねて実行するストリーミングパイプライン。
+
+スクレイパーが取得した口コミを上限付きキューに積み（producer）、分析側（consumer）は
+口コミが 1 バッチ分たまるたびに、口コミ単位で完結する処理をすぐに投げる。
+
+- キーワード発見（--keyword-engine llm のとき）
+- 感動の7類型の採点（全件採点のとき）
+
+出現件数の集計・体験価値・ギャップ分析・感動コメントなど口コミ全体を見る処理だけが
+スクレイピングの終了を待つ。層化抽出の感動分析と janome / hybrid のキーワード抽出は
+全件がそろわないと対象が決まらないため、従来どおり終了後にまとめて行う。
+近似重複（dedupe.py）は到着順に照合し、先に届いた代表だけをバッチに入れる。
+バッチには到着順に圧縮した本文（compression.py）を入れる。
+
+使用例:
+    stream = ReviewStream(store_name="テスト食堂")
+    consumer = asyncio.create_task(stream.run())
+    try:
+        await scrape_tabelog(url, on_reviews=stream.put)
+    finally:
+        await stream.close()
+    analysis = await consumer
+"""
+
+import asyncio
+
+from analyzer import (
+    DISCOVERY_MODES,
+    KeywordDiscovery,
+    _controller,
+    analyze_prepared,
+    begin_run,
+    prepare_review,
+    print_duplicates,
+    score_kando_batch,
+)
+from batching import BatchPacker, batch_tokens
+from compression import PromptCompressor
+from dedupe import NearDuplicateIndex
+from lexicon import KeywordLexicon
+from llm_scheduler import scheduling
+
+QUEUE_SIZE = 200
+
+
+class ReviewStream:
+    """口コミを put() で受け取りながら分析を進め、close() 後に run() が分析結果を返す。
+
+    キューが満杯のあいだ put() は待つので、分析が詰まればスクレイピングも自然に減速する。
+    分析側が失敗した場合、以後の put() はその例外を送出する（スクレイパーを待たせ続けない）。
+    分析オプションは analyze_reviews_async と同じ。
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, include_gap: bool = False, keyword_engine: str = "llm",
+                 store_name: str | None = None, discovery: str = "full", discovery_threshold: float = 1.0,
+                 kando_margin: float | None = None, priority: str = "interactive", gap_mode: str = "single",
+                 trend_granularity: str = "month", compress: bool = True, force_stages=()):
+        if discovery not in DISCOVERY_MODES:
+            raise ValueError(f"未知の発見モード: {discovery}（{' / '.join(DISCOVERY_MODES)}）")
+        self.options = {
+            "include_gap": include_gap,
+            "keyword_engine": keyword_engine,
+            "store_name": store_name,
+            "discovery": discovery,
+            "discovery_threshold": discovery_threshold,
+            "kando_margin": kando_margin,
+            "gap_mode": gap_mode,
+            "trend_granularity": trend_granularity,
+            "force_stages": force_stages,
+        }
+        self.priority = priority
+        self.reviews: list[dict] = []
+        self.duplicates: list[dict] = []
+        self._dedupe = NearDuplicateIndex()
+        self._compressor = PromptCompressor(enabled=compress)
+        self._queue: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=queue_size)
+        self._error: BaseException | None = None
+
+    async def put(self, reviews: list[dict]) -> None:
+        for review in reviews:
+            if self._error is not None:
+                raise RuntimeError("分析パイプラインが停止しています") from self._error
+            await self._queue.put(review)
+
+    async def close(self) -> None:
+        """口コミの供給を終える（run() は残りを処理して分析結果を返す）。"""
+        await self._queue.put(None)
+
+    async def run(self) -> dict:
+        with scheduling(self.options["store_name"] or "default", self.priority):
+            try:
+                await begin_run()
+                return await self._consume()
+            except BaseException as e:
+                # 満杯のキューで待っている put() を解放する
+                self._error = e
+                while not self._queue.empty():
+                    self._queue.get_nowait()
+                raise
+
+    async def _consume(self) -> dict:
+        opts = self.options
+        discovered = None
+        keyword_packer = kando_packer = None
+        if opts["keyword_engine"] == "llm":
+            discovered = KeywordDiscovery(KeywordLexicon.load(), threshold=opts["discovery_threshold"])
+            keyword_packer = BatchPacker("keywords")
+        kando_scored: dict[int, list[int]] | None = None
+        if not opts["kando_margin"]:
+            kando_scored = {}
+            kando_packer = BatchPacker("kando")
+        # adaptive では同時実行数ぶんずつ処理し、枠が空くたびに停止判定する（到着順に処理）
+        gate = asyncio.Semaphore(_controller.limit) if opts["discovery"] == "adaptive" else None
+        tasks: list[asyncio.Task] = []
+
+        async def discover(batch, batch_num):
+            if gate is None:
+                await discover_batch(batch, batch_num)
+                return
+            async with gate:
+                if discovered.should_stop():
+                    discovered.stopped = True
+                    return
+                await discover_batch(batch, batch_num)
+
+        async def discover_batch(batch, batch_num):
+            print(f"    📦 キーワードバッチ {batch_num}（{len(batch)}件・約{batch_tokens(batch):,} tokens）...")
+            discovered.add(await discovered.fetch(batch, label=f"（バッチ {batch_num}）"))
+
+        async def score(batch, batch_num):
+            print(f"    📦 感動分析バッチ {batch_num}（{len(batch)}件・約{batch_tokens(batch):,} tokens）...")
+            kando_scored.update(await score_kando_batch(batch, label=f"（バッチ {batch_num}）"))
+
+        def track(task: asyncio.Task) -> None:
+            # バッチが失敗したら収集の終了を待たずにスクレイパー側へ伝える
+            tasks.append(task)
+            task.add_done_callback(self._check_batch)
+
+        def dispatch_keywords(batch):
+            if batch:
+                discovered.batches_total += 1
+                track(asyncio.create_task(discover(batch, discovered.batches_total)))
+
+        kando_batches = 0
+
+        def dispatch_kando(batch):
+            nonlocal kando_batches
+            if batch:
+                kando_batches += 1
+                track(asyncio.create_task(score(batch, kando_batches)))
+
+        try:
+            while (review := await self._queue.get()) is not None:
+                review = prepare_review(review)
+                if self._dedupe.mark(review):  # 近似重複はバッチに入れない
+                    self.duplicates.append(review)
+                    continue
+                pos = len(self.reviews)
+                self.reviews.append(review)
+                text = self._compressor.add(review.get("text", ""))
+                if keyword_packer:
+                    dispatch_keywords(keyword_packer.add(pos, text))
+                if kando_packer:
+                    dispatch_kando(kando_packer.add(pos, text))
+            print(f"\n🤖 Gemini 分析（{len(self.reviews)}件・収集中に {len(tasks)} バッチ投入済み）...")
+            print_duplicates(self.duplicates)
+            if keyword_packer:
+                dispatch_keywords(keyword_packer.flush())
+            if kando_packer:
+                dispatch_kando(kando_packer.flush())
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        return await analyze_prepared(self.reviews, discovered=discovered, kando_scored=kando_scored,
+                                     duplicates=self.duplicates, compressor=self._compressor, **opts)
+
+    def _check_batch(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None and self._error is None:
+            self._error = task.exception()
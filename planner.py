@@ -0,0 +1,222 @@
+"""分析前の呼び出し回数・トークン数・費用・所要時間の見積もりモジュール（main.py --plan）。
+
+保存済みの口コミに分析と同じ前処理（正規化・近似重複の除外・プロンプト圧縮）をかけ、
+実際のバッチ詰め（batching.py）とプロンプトのテンプレートから、ステージごとの見込みを出す。
+API は呼ばない。
+
+- 入力トークン: バッチを使うステージ（keywords / kando / gap_map）は実際のプロンプトを組み立てて数える。
+  要約ステージ（experience / kando_comment / gap / gap_reduce）は予算内の口コミ + テンプレート分。
+- 出力トークン: OUTPUT_PER_ITEM（1 件あたり）/ OUTPUT_PER_CALL（1 回あたり）の見込み。
+  前回の分析結果（token_usage）を渡すと、そのステージの実績の比率で置き換える。
+- 費用: PRICES（モデルごとの 100 万トークンあたりの USD）。
+- 所要時間: 1 回の応答時間を LATENCY_BASE_SEC + 出力トークン / 出力速度 とし、LLMController の
+  初期同時実行数から AIMD で増やしながら処理した時間と、llm_scheduler の RPM / TPM の下限の長い方。
+  全体は、全ステージの呼び出しを同じ同時実行枠で処理した時間と、依存の連鎖
+  （keywords → experience など）の長い方。
+- キャッシュ済みのステージ（stage_cache.py）は 0 件とする。
+- adaptive 発見は全バッチ分（上限）、欠落要素の再リクエストと再判定（エスカレーション）は含めない。
+  LLM エンジンの表記判定は、新しい表記の件数が事前に分からないため NEW_SURFACES_PER_REVIEW で見込む。
+"""
+
+import math
+
+import analyzer
+from batching import MAX_ITEMS, PER_REVIEW_CAPS, TOKEN_BUDGETS, estimate_tokens, pack_batches
+from compression import PromptCompressor
+from dedupe import split_duplicates
+from lexicon import KeywordLexicon
+from llm_scheduler import model_limits
+from profiler import _pad
+from sampling import required_sample_size, stratified_sample
+
+# 100 万トークンあたりの USD（入力, 出力）
+PRICES = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+DEFAULT_PRICE = (0.30, 2.50)
+# 出力トークンの見込み（バッチのステージは 1 件あたり、要約ステージは 1 回あたり）
+OUTPUT_PER_ITEM = {"keywords": 15, "kando": 45, "keyword_normalize": 30}
+OUTPUT_PER_CALL = {"experience": 600, "kando_comment": 500, "gap": 1500, "gap_map": 800, "gap_reduce": 900}
+# 要約ステージのプロンプトの口コミ以外の部分（テンプレート・集計値）
+PROMPT_OVERHEAD = {"experience": 900, "kando_comment": 500, "gap": 900, "gap_reduce": 600}
+GAP_CANDIDATES_PER_CHUNK = 5
+GAP_CANDIDATE_TOKENS = 60
+# LLM エンジンで表記判定に回る新しい表記の見込み（口コミ 1 件あたり・上限）
+NEW_SURFACES_PER_REVIEW = 0.3
+NEW_SURFACES_MAX = 600
+# 応答時間 = LATENCY_BASE_SEC + 出力トークン / 出力速度（トークン/秒）
+LATENCY_BASE_SEC = 1.5
+OUTPUT_TOKENS_PER_SEC = {"gemini-2.5-flash": 180, "gemini-2.5-flash-lite": 350, "gemini-2.5-pro": 80}
+DEFAULT_TOKENS_PER_SEC = 150
+# 依存の連鎖（前のステージが終わってから次が始まる）
+STAGE_CHAINS = [("keywords", "keyword_normalize", "experience"), ("kando", "kando_comment"), ("gap",),
+                ("gap_map", "gap_reduce")]
+
+
+def plan_run(reviews: list[dict], include_gap: bool = False, keyword_engine: str = "llm",
+             store_name: str | None = None, discovery: str = "full", discovery_threshold: float = 1.0,
+             kando_margin: float | None = None, gap_mode: str = "single", compress: bool = True, force_stages=(),
+             history: dict | None = None) -> dict:
+    """analyze_reviews_async を同じ引数で実行した場合の見積もり。history は前回の分析結果（出力トークンの較正用）。"""
+    cache_plan = {row["stage"]: row["status"] for row in analyzer.plan_analysis(
+        reviews, include_gap=include_gap, keyword_engine=keyword_engine, store_name=store_name,
+        discovery=discovery, discovery_threshold=discovery_threshold, kando_margin=kando_margin,
+        gap_mode=gap_mode, compress=compress, force_stages=force_stages)}
+    canonical, duplicates = split_duplicates([analyzer.prepare_review(r) for r in reviews])
+    compressor = PromptCompressor(enabled=compress)
+    for r in canonical:
+        compressor.add(r.get("text", ""))
+    texts = compressor.texts
+    usage = (history or {}).get("token_usage", {})
+
+    calls: dict[str, list[tuple[int, int]]] = {}  # LLM ステージ → [(入力, 出力)]
+    if cache_plan["keywords"] != "cached":
+        _plan_keywords(calls, canonical, texts, keyword_engine, usage)
+    if cache_plan["experience"] != "cached":
+        calls["experience"] = [_summary_call("experience", texts, usage)]
+    if cache_plan["kando"] != "cached":
+        targets = list(range(len(texts)))
+        if kando_margin:
+            n = required_sample_size(len(texts), kando_margin)
+            if n < len(texts):
+                targets = stratified_sample(analyzer._kando_strata(analyzer._review_facets(canonical)), n,
+                                            seed=analyzer.KANDO_SAMPLE_SEED)
+        calls["kando"] = _batch_calls("kando", [texts[i] for i in targets], analyzer._kando_prompt, usage)
+        calls["kando_comment"] = [_summary_call("kando_comment", texts, usage)]
+    if include_gap and cache_plan.get("gap") != "cached":
+        if gap_mode == "single":
+            calls["gap"] = [_summary_call("gap", texts, usage)]
+        else:
+            batches = pack_batches(texts, "gap_map")
+            calls["gap_map"] = [_with_output("gap_map", estimate_tokens(analyzer._gap_map_prompt(b)), 0, usage)
+                                for b in batches]
+            reduce_input = PROMPT_OVERHEAD["gap_reduce"] + len(batches) * GAP_CANDIDATES_PER_CHUNK * GAP_CANDIDATE_TOKENS
+            calls["gap_reduce"] = [_with_output("gap_reduce", reduce_input, 0, usage)]
+
+    controller = analyzer._controller
+    stages = []
+    for stage, stage_calls in calls.items():
+        model = analyzer.stage_model(stage)
+        input_tokens = sum(i for i, _ in stage_calls)
+        output_tokens = sum(o for _, o in stage_calls)
+        price_in, price_out = PRICES.get(model, DEFAULT_PRICE)
+        stages.append({
+            "stage": stage,
+            "model": model,
+            "calls": len(stage_calls),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": (input_tokens * price_in + output_tokens * price_out) / 1_000_000,
+            "seconds": _stage_seconds(model, stage_calls, controller),
+        })
+    by_stage = {s["stage"]: s for s in stages}
+    all_latencies = [_latency(analyzer.stage_model(st), o) for st, cs in calls.items() for _, o in cs]
+    chains = [sum(by_stage[st]["seconds"] for st in chain if st in by_stage) for chain in STAGE_CHAINS]
+    return {
+        "reviews": len(canonical),
+        "duplicates": len(duplicates),
+        "compression": compressor.report(),
+        "cache": cache_plan,
+        "concurrency": {"initial": controller.concurrency, "max": controller.max_concurrency},
+        "stages": stages,
+        "total": {
+            "calls": sum(s["calls"] for s in stages),
+            "input_tokens": sum(s["input_tokens"] for s in stages),
+            "output_tokens": sum(s["output_tokens"] for s in stages),
+            "cost_usd": sum(s["cost_usd"] for s in stages),
+            "seconds": max([_aimd_seconds(all_latencies, controller), *chains], default=0.0),
+        },
+    }
+
+
+def _plan_keywords(calls: dict, reviews: list[dict], texts: list[str], engine: str, usage: dict) -> None:
+    lexicon = KeywordLexicon.load()
+    if engine == "llm":
+        calls["keywords"] = _batch_calls("keywords", texts, analyzer._keyword_prompt, usage)
+        surfaces = min(NEW_SURFACES_MAX, math.ceil(len(texts) * NEW_SURFACES_PER_REVIEW))
+    elif engine == "hybrid":
+        # 候補の抽出と辞書の照合は API を使わないので、表記判定に回る件数をそのまま数える。
+        # store_name は渡さない（渡すと店舗の DF が keyword_df.json に保存される）
+        from keyword_engine import rank_candidates
+
+        candidates = rank_candidates([r.get("text", "") for r in reviews], analyzer.GENERIC_WORDS)
+        surfaces = sum(1 for c in candidates
+                       if not lexicon.resolve(c["word"]) and c["word"] not in lexicon.rejected)
+    else:
+        return
+    placeholder = ["表現"] * analyzer.NORMALIZE_BATCH
+    for start in range(0, surfaces, analyzer.NORMALIZE_BATCH):
+        n = min(analyzer.NORMALIZE_BATCH, surfaces - start)
+        prompt_tokens = estimate_tokens(analyzer._normalize_prompt(placeholder[:n]))
+        calls.setdefault("keyword_normalize", []).append(_with_output("keyword_normalize", prompt_tokens, n, usage))
+
+
+def _batch_calls(stage: str, texts: list[str], build_prompt, usage: dict) -> list[tuple[int, int]]:
+    return [_with_output(stage, estimate_tokens(build_prompt([t for _, t, _ in batch])), len(batch), usage)
+            for batch in pack_batches(texts, stage)]
+
+
+def _summary_call(stage: str, texts: list[str], usage: dict) -> tuple[int, int]:
+    """代表口コミを予算まで詰める要約ステージの 1 回分。"""
+    cap, budget = PER_REVIEW_CAPS[stage], TOKEN_BUDGETS[stage]
+    used = 0
+    for text in texts[:MAX_ITEMS[stage]]:
+        used = min(budget, used + min(estimate_tokens(text), cap))
+    return _with_output(stage, PROMPT_OVERHEAD[stage] + used, 0, usage)
+
+
+def _with_output(stage: str, input_tokens: int, items: int, usage: dict) -> tuple[int, int]:
+    """入力トークンに出力トークンの見込みを添える。前回の実績があればその比率を使う。"""
+    past = usage.get(stage)
+    if past and past.get("calls") and past.get("input_tokens"):
+        if stage in OUTPUT_PER_ITEM or stage == "gap_map":
+            return input_tokens, round(input_tokens * past["output_tokens"] / past["input_tokens"])
+        return input_tokens, round(past["output_tokens"] / past["calls"])
+    if stage in OUTPUT_PER_ITEM:
+        return input_tokens, items * OUTPUT_PER_ITEM[stage]
+    return input_tokens, OUTPUT_PER_CALL[stage]
+
+
+def _latency(model: str, output_tokens: int) -> float:
+    return LATENCY_BASE_SEC + output_tokens / OUTPUT_TOKENS_PER_SEC.get(model, DEFAULT_TOKENS_PER_SEC)
+
+
+def _aimd_seconds(latencies: list[float], controller) -> float:
+    """同時実行数 c で floor(c) 件ずつ並行に処理し、1 巡ごとに成功数 / c だけ増やした場合の所要時間。"""
+    concurrency, seconds, i = controller.concurrency, 0.0, 0
+    while i < len(latencies):
+        wave = latencies[i:i + max(1, int(concurrency))]
+        seconds += max(wave)
+        i += len(wave)
+        concurrency = min(controller.max_concurrency, concurrency + len(wave) / concurrency)
+    return seconds
+
+
+def _stage_seconds(model: str, calls: list[tuple[int, int]], controller) -> float:
+    limits = model_limits(model)
+    quota = max(len(calls) / limits["rpm"], sum(i + o for i, o in calls) / limits["tpm"]) * 60
+    return max(_aimd_seconds([_latency(model, o) for _, o in calls], controller), quota)
+
+
+def print_plan(plan: dict) -> None:
+    c = plan["compression"]
+    print(f"\n📋 分析の見積もり（{plan['reviews']}件・近似重複 {plan['duplicates']}件を除外・"
+          f"プロンプト圧縮 -{c['reduction']}%・同時実行数 {plan['concurrency']['initial']:.0f}"
+          f"→最大 {plan['concurrency']['max']}）")
+    cached = [stage for stage, status in plan["cache"].items() if status == "cached"]
+    if cached:
+        print(f"  ♻️ キャッシュを使うステージ（0 件として計上）: {', '.join(cached)}")
+    columns = [_pad(c, w, right=True) for c, w in (("回数", 6), ("入力tokens", 12), ("出力tokens", 12),
+                                                     ("費用(USD)", 10), ("時間", 10))]
+    print(f"  {_pad('ステージ', 18)} {_pad('モデル', 22)} {' '.join(columns)}")
+    for s in plan["stages"] + [dict(plan["total"], stage="合計", model="")]:
+        print(f"  {_pad(s['stage'], 18)} {_pad(s['model'], 22)} {s['calls']:>6,} {s['input_tokens']:>12,} "
+              f"{s['output_tokens']:>12,} {s['cost_usd']:>10.4f} {_pad(_duration(s['seconds']), 10, right=True)}")
+
+
+def _duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}秒"
+    return f"{seconds // 60:.0f}分{seconds % 60:02.0f}秒"
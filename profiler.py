@@ -0,0 +1,151 @@
+"""実行プロファイル（区間の計測）モジュール。
+
+スクレイピング（ページ遷移・スクロール・HTML 解析・待機）、LLM 呼び出し、分析ステージ、
+レポート生成などの区間を span() で記録し、Chrome トレース形式の JSON（chrome://tracing や
+https://ui.perfetto.dev で開ける）と、区分・名前ごとの集計表を出力する。
+
+- 区間は category（区分）と name で分類する。集計表は (category, name) ごとの件数・合計・平均・最大。
+- LLM 呼び出し（llm）は API の応答を待つ区間だけで、クォータと同時実行枠の待ちは LLM 待ち（queue）に分ける。
+- 並行に走る区間（LLM 呼び出しなど）は、トレース上で重ならないよう区分ごとに表示レーンを分ける。
+- 記録はプロセス共有の profiler に溜まる。記録の負荷は区間あたり数マイクロ秒なので常に有効にしている。
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+# 集計表の区分の表示名（並び順もこの順）
+CATEGORY_LABELS = {
+    "site": "サイト",
+    "scrape": "ブラウザ操作",
+    "sleep": "待機",
+    "parse": "HTML 解析",
+    "analysis": "分析処理",
+    "stage": "分析ステージ",
+    "queue": "LLM 待ち",
+    "llm": "LLM 呼び出し",
+    "report": "レポート",
+    "deploy": "デプロイ",
+}
+# 集計表で合計する区間の引数（LLM 呼び出しのトークン数・失敗した試行の数）
+SUMMED_ARGS = ("input_tokens", "output_tokens", "failed")
+
+
+class Profiler:
+    """区間の記録。span() で囲んだ区間を完了時に 1 件ずつ記録する。"""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.events: list[dict] = []
+
+    def reset(self) -> None:
+        with self._lock:
+            self._origin = time.perf_counter()
+            self.events = []
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        """区間を計測する。yield した dict に書き込んだ値は区間の引数として記録される。"""
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.record(name, category, start, time.perf_counter(), args)
+
+    def record(self, name: str, category: str, start: float, end: float, args: dict | None = None) -> None:
+        event = {"name": name, "cat": category, "start": start - self._origin, "dur": end - start,
+                 "thread": threading.get_ident(), "args": dict(args or {})}
+        with self._lock:
+            self.events.append(event)
+
+    async def sleep(self, seconds: float, name: str = "sleep") -> None:
+        """asyncio.sleep を待機区間として記録する（スクレイパーの固定待ち）。"""
+        with self.span(name, "sleep", seconds=round(seconds, 2)):
+            await asyncio.sleep(seconds)
+
+    # ------------------------------------------------------------------
+    # 出力
+    # ------------------------------------------------------------------
+
+    def trace(self) -> dict:
+        """Chrome トレース形式（Complete イベント "X"）。時刻はマイクロ秒。"""
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e["start"])
+        lanes: dict[str, list[float]] = {}  # 区分 → レーンごとの最後の区間の終了時刻
+        lane_ids: dict[tuple[str, int], int] = {}
+        trace_events = []
+        for e in events:
+            ends = lanes.setdefault(e["cat"], [])
+            lane = next((i for i, end in enumerate(ends) if end <= e["start"]), len(ends))
+            if lane == len(ends):
+                ends.append(0.0)
+            ends[lane] = e["start"] + e["dur"]
+            tid = lane_ids.setdefault((e["cat"], lane), len(lane_ids) + 1)
+            trace_events.append({"name": e["name"], "cat": e["cat"], "ph": "X", "pid": os.getpid(), "tid": tid,
+                                 "ts": round(e["start"] * 1e6, 1), "dur": round(e["dur"] * 1e6, 1),
+                                 "args": e["args"]})
+        for (category, lane), tid in lane_ids.items():
+            label = CATEGORY_LABELS.get(category, category)
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                                 "args": {"name": f"{label} #{lane + 1}" if lane else label}})
+            trace_events.append({"name": "thread_sort_index", "ph": "M", "pid": os.getpid(), "tid": tid,
+                                 "args": {"sort_index": tid}})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f, ensure_ascii=False)
+
+    def summary(self) -> list[dict]:
+        """(区分, 名前) ごとの集計。区分は CATEGORY_LABELS の順、同じ区分内は合計時間の降順。"""
+        with self._lock:
+            events = list(self.events)
+        groups: dict[tuple[str, str], dict] = {}
+        for e in events:
+            g = groups.setdefault((e["cat"], e["name"]), {"category": e["cat"], "name": e["name"], "count": 0,
+                                                          "total_sec": 0.0, "max_sec": 0.0})
+            g["count"] += 1
+            g["total_sec"] += e["dur"]
+            g["max_sec"] = max(g["max_sec"], e["dur"])
+            for arg in SUMMED_ARGS:
+                if isinstance(e["args"].get(arg), int):
+                    g[arg] = g.get(arg, 0) + e["args"][arg]
+        order = list(CATEGORY_LABELS)
+        rows = sorted(groups.values(), key=lambda g: (order.index(g["category"]) if g["category"] in order
+                                                      else len(order), -g["total_sec"]))
+        for g in rows:
+            g["mean_sec"] = g["total_sec"] / g["count"]
+        return rows
+
+    def print_summary(self) -> None:
+        rows = self.summary()
+        if not rows:
+            return
+        with self._lock:
+            wall = max(e["start"] + e["dur"] for e in self.events) - min(e["start"] for e in self.events)
+        print(f"\n⏱️ 実行プロファイル（計測区間 {wall:.1f}秒）")
+        columns = [_pad(c, 9, right=True) for c in ("合計(秒)", "平均(秒)", "最大(秒)")]
+        print(f"  {_pad('区分', 14)} {_pad('名前', 22)} {_pad('件数', 6, right=True)} {' '.join(columns)}  備考")
+        for g in rows:
+            note = ""
+            if "input_tokens" in g:
+                note = f"入力 {g['input_tokens']:,} / 出力 {g.get('output_tokens', 0):,} tokens"
+            if g.get("failed"):
+                note += f"{'、' if note else ''}失敗 {g['failed']}回"
+            label = CATEGORY_LABELS.get(g["category"], g["category"])
+            print(f"  {_pad(label, 14)} {_pad(g['name'], 22)} {g['count']:>6} {g['total_sec']:>9.2f} "
+                  f"{g['mean_sec']:>9.3f} {g['max_sec']:>9.2f}  {note}")
+
+
+def _pad(text: str, width: int, right: bool = False) -> str:
+    """全角文字を幅 2 として width 桁にそろえる（right=True で右寄せ）。"""
+    fill = " " * max(0, width - sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text))
+    return fill + text if right else text + fill
+
+
+profiler = Profiler()
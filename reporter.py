@@ -6,6 +6,8 @@ import subprocess
 from collections import defaultdict
 from datetime import datetime
 
+from profiler import profiler
+
 
 KANDO_TYPES = ["threshold", "surprise", "resonance", "rescue", "awe", "participation", "growth"]
 KANDO_LABELS = {
@@ -19,22 +21,30 @@ KANDO_LABELS = {
 }
 
 
-def generate_report(store_name: str, analysis: dict, output_path: str = "report.html") -> str:
+def generate_report(store_name: str, analysis: dict, output_path: str = "report.html",
+                    open_browser: bool = True) -> str:
     reviews              = analysis.get("reviews", [])
     keywords             = analysis.get("keywords", [])
     experience           = analysis.get("experience", {})
     timeseries_keywords  = analysis.get("timeseries_keywords", {})
     kando                = analysis.get("kando", {})
     gap                  = analysis.get("gap", None)
+    trends               = analysis.get("trends", None)
 
-    site_stats = _calc_site_stats(reviews)
-    html = _build_html(store_name, reviews, keywords, experience, timeseries_keywords, kando, site_stats, gap=gap)
+    with profiler.span("build_html", "report", reviews=len(reviews)) as span:
+        site_stats = _calc_site_stats(reviews)
+        html = _build_html(store_name, reviews, keywords, experience, timeseries_keywords, kando, site_stats, gap=gap, trends=trends,
+                           duplicates=analysis.get("duplicates"))
+        span["bytes"] = len(html.encode("utf-8"))
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(html)
+    with profiler.span("write_html", "report"):
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(html)
 
     abs_path = os.path.abspath(output_path)
     print(f"\n✅ レポート生成完了: {abs_path}")
+    if not open_browser:
+        return abs_path
     try:
         subprocess.run(["garcon-url-handler", f"file://{abs_path}"])
     except Exception:
@@ -64,11 +74,14 @@ def _site_color(src):
 # HTML 全体構築
 # ---------------------------------------------------------------------------
 
-def _build_html(store_name, reviews, keywords, experience, timeseries_keywords, kando, site_stats, gap=None):
+def _build_html(store_name, reviews, keywords, experience, timeseries_keywords, kando, site_stats, gap=None, trends=None,
+                duplicates=None):
     today = datetime.now().strftime("%Y年%m月%d日")
     total = len(reviews)
     recent_n = timeseries_keywords.get("recent_count", 0)
     older_n  = timeseries_keywords.get("older_count", 0)
+    dup_n    = (duplicates or {}).get("count", 0)
+    dup_note = f" ／ 近似重複 {dup_n}件を除外" if dup_n else ""
 
     site_cards_html      = _build_site_cards(site_stats)
     experience_html      = _build_experience_section(experience)
@@ -76,8 +89,10 @@ def _build_html(store_name, reviews, keywords, experience, timeseries_keywords,
     timeseries_html      = _build_timeseries_section(timeseries_keywords)
     kando_html           = _build_kando_section(kando)
     gap_html             = _build_gap_section(gap) if gap else ""
+    trend_html           = _build_trend_section(trends)
     reviews_json         = json.dumps(reviews, ensure_ascii=False)
     kando_radar_json     = _build_kando_radar_json(kando)
+    trend_json           = _build_trend_json(trends)
 
     return f"""<!DOCTYPE html>
 <html lang="ja">
@@ -226,7 +241,7 @@ def _build_html(store_name, reviews, keywords, experience, timeseries_keywords,
   <!-- ヘッダー -->
   <div class="section">
     <h1>📊 {store_name}</h1>
-    <p class="meta">口コミ分析レポート ／ 収集日: {today} ／ 総口コミ数: {total}件（直近3ヶ月: {recent_n}件 ／ それ以前: {older_n}件）</p>
+    <p class="meta">口コミ分析レポート ／ 収集日: {today} ／ 総口コミ数: {total}件（直近3ヶ月: {recent_n}件 ／ それ以前: {older_n}件）{dup_note}</p>
     <div class="site-cards">{site_cards_html}</div>
   </div>
 
@@ -257,6 +272,9 @@ def _build_html(store_name, reviews, keywords, experience, timeseries_keywords,
     {timeseries_html}
   </div>
 
+  <!-- トレンド -->
+  {f'<div class="section"><h2>{_GRANULARITY_TITLES.get(trends["granularity"], "")}トレンドと変化点</h2>{trend_html}</div>' if trend_html else ''}
+
   <!-- 口コミ一覧 -->
   <div class="section">
     <h2>口コミ一覧</h2>
@@ -277,6 +295,7 @@ def _build_html(store_name, reviews, keywords, experience, timeseries_keywords,
 <script>
 const REVIEWS = {reviews_json};
 const KANDO_DATA = {kando_radar_json};
+const TREND_DATA = {trend_json};
 const SITE_LABELS = {{google_maps:"Google マップ",tabelog:"食べログ",tripadvisor:"TripAdvisor"}};
 
 // 感動レーダーチャート
@@ -312,6 +331,36 @@ const SITE_LABELS = {{google_maps:"Google マップ",tabelog:"食べログ",trip
   }});
 }})();
 
+// トレンド折れ線グラフ（評点は左軸、キーワード出現率は右軸）
+(function(){{
+  const el = document.getElementById('trendChart');
+  if(!el || !TREND_DATA) return;
+  const palette = ['#e23b2a','#f59e0b','#10b981','#8b5cf6','#ec4899','#0ea5e9','#84cc16','#64748b','#f97316','#14b8a6'];
+  const datasets = [{{
+    label: '平均評点', data: TREND_DATA.rating, yAxisID: 'y',
+    borderColor: '#1a73e8', backgroundColor: '#1a73e8', borderWidth: 3, spanGaps: true,
+  }}];
+  Object.entries(TREND_DATA.keywords).forEach(([word, rates], i) => datasets.push({{
+    label: word, data: rates, yAxisID: 'y1', hidden: i >= 5,
+    borderColor: palette[i % palette.length], backgroundColor: palette[i % palette.length],
+    borderWidth: 1.5, borderDash: [4, 3], spanGaps: true, pointRadius: 2,
+  }}));
+  new Chart(el, {{
+    type: 'line',
+    data: {{ labels: TREND_DATA.buckets, datasets }},
+    options: {{
+      responsive: true,
+      maintainAspectRatio: false,
+      interaction: {{ mode: 'index', intersect: false }},
+      plugins: {{ legend: {{ position: 'bottom', labels: {{ boxWidth: 12, font: {{ size: 11 }} }} }} }},
+      scales: {{
+        y: {{ min: 1, max: 5, position: 'left', title: {{ display: true, text: '平均評点' }} }},
+        y1: {{ min: 0, position: 'right', grid: {{ drawOnChartArea: false }}, title: {{ display: true, text: '出現率 (%)' }} }},
+      }}
+    }}
+  }});
+}})();
+
 // 口コミ一覧
 function filterReviews(){{
   const fSource = document.getElementById('f-source').value;
@@ -485,6 +534,61 @@ def _build_timeseries_section(ts: dict) -> str:
 </div>"""
 
 
+_GRANULARITY_TITLES = {"month": "月別", "week": "週別"}
+
+
+def _trend_series_label(series: str) -> str:
+    if series == "rating":
+        return "平均評点"
+    kind, _, name = series.partition(":")
+    if kind == "keyword":
+        return f"「{name}」出現率"
+    return KANDO_LABELS.get(name, name)
+
+
+def _build_trend_section(trends: dict | None) -> str:
+    if not trends or len(trends.get("buckets", [])) < 2:
+        return ""
+    unit = "月" if trends["granularity"] == "month" else "週"
+    placed = sum(trends.get("reviews", []))
+    unplaced = trends.get("unplaced", 0)
+    note = f"（日付の幅が1{unit}を超える {unplaced}件は除外）" if unplaced else ""
+
+    rows = []
+    for c in trends.get("changes", []):
+        arrow, cls = ("▲", "change-up") if c["direction"] == "up" else ("▼", "change-down")
+        suffix = "%" if c["series"].startswith("keyword:") else ""
+        rows.append(f"""
+      <tr>
+        <td>{c['bucket']}</td>
+        <td class="kw-word">{_trend_series_label(c['series'])}</td>
+        <td class="ts-count-cell">{c['before']}{suffix}</td>
+        <td class="ts-count-cell">{c['after']}{suffix}</td>
+        <td class="ts-count-cell"><span class="{cls}">{arrow}</span></td>
+      </tr>""")
+    changes_html = f"""
+<h3 style="margin-top:20px;margin-bottom:10px;">検出された変化点</h3>
+<table class="ts-change-table">
+  <thead><tr><th>時期</th><th>系列</th><th>変化前</th><th>変化後</th><th></th></tr></thead>
+  <tbody>{"".join(rows)}</tbody>
+</table>""" if rows else '<p style="color:var(--muted);font-size:0.88em;margin-top:12px;">持続的な変化は検出されませんでした。</p>'
+
+    return f"""
+<p style="color:var(--muted);font-size:0.88em;margin-bottom:12px;">
+  {len(trends['buckets'])}{unit}分・<strong>{placed}件</strong>{note}　キーワードは凡例クリックで表示切替
+</p>
+<div style="position:relative;height:340px;">
+  <canvas id="trendChart"></canvas>
+</div>
+{changes_html}"""
+
+
+def _build_trend_json(trends: dict | None) -> str:
+    if not trends or len(trends.get("buckets", [])) < 2:
+        return "null"
+    return json.dumps({k: trends[k] for k in ("buckets", "rating", "keywords")}, ensure_ascii=False)
+
+
 def _build_kando_section(kando: dict) -> str:
     if not kando or not kando.get("aggregated"):
         return "<p>感動分析データなし</p>"
@@ -494,6 +598,7 @@ def _build_kando_section(kando: dict) -> str:
     weaknesses = kando.get("weaknesses", [])
     ai_comment = kando.get("ai_comment", "")
     total      = kando.get("total_analyzed", 0)
+    sampling   = kando.get("sampling")
 
     max_score = max((aggregated[t]["score"] for t in KANDO_TYPES), default=5) or 5
     rows = []
@@ -502,7 +607,11 @@ def _build_kando_section(kando: dict) -> str:
         pct = round(d["score"] / 5 * 100)
         extra_cls = "strength" if t in strengths else "weakness" if t in weaknesses else ""
         badge = " 💪" if t in strengths else " ⚠️" if t in weaknesses else ""
-        reliable = "" if d["is_reliable"] else ' <span class="kando-dot" title="口コミ数3件未満">●</span>'
+        if sampling:
+            lo, hi = d.get("detection_rate_ci", [0, 0])
+            reliable = "" if d["is_reliable"] else f' <span class="kando-dot" title="95%信頼区間 {lo}〜{hi}%">●</span>'
+        else:
+            reliable = "" if d["is_reliable"] else ' <span class="kando-dot" title="口コミ数3件未満">●</span>'
         rows.append(f"""
   <div class="kando-row {extra_cls}">
     <span class="kando-label">{d['label']}{badge}</span>
@@ -511,10 +620,17 @@ def _build_kando_section(kando: dict) -> str:
     <span class="kando-rate">{d['detection_rate']}%{reliable}</span>
   </div>""")
 
+    if sampling:
+        count_note = f"分析口コミ数: {total}件（うち{sampling.get('scored', 0)}件を層化抽出して採点・95%信頼区間付きで推定）"
+        reliability_note = "● 信頼度低（信頼区間が0を含む、または幅が広い）"
+    else:
+        count_note = f"分析口コミ数: {total}件"
+        reliability_note = "● 信頼度低（件数3件未満）"
+
     return f"""
 <p style="color:var(--muted);font-size:0.85em;margin-bottom:16px;">
-  分析口コミ数: {total}件 ／ スコア: 0〜5点 ／ 出現率: 各類型に言及のある口コミの割合<br>
-  <span style="color:#1a73e8">💪 強み上位2類型</span>　<span style="color:#dc2626">⚠️ 弱み下位2類型</span>　<span style="color:var(--muted)">● 信頼度低（件数3件未満）</span>
+  {count_note} ／ スコア: 0〜5点 ／ 出現率: 各類型に言及のある口コミの割合<br>
+  <span style="color:#1a73e8">💪 強み上位2類型</span>　<span style="color:#dc2626">⚠️ 弱み下位2類型</span>　<span style="color:var(--muted)">{reliability_note}</span>
 </p>
 <div class="kando-layout">
   <div class="kando-chart-wrap">
@@ -522,6 +638,7 @@ def _build_kando_section(kando: dict) -> str:
   </div>
   <div class="kando-detail">{"".join(rows)}</div>
 </div>
+{_build_kando_breakdowns(kando.get("breakdowns"), sampling)}
 <div class="kando-note">
   <p class="kando-note-intro">テーマパークは感動を提供する場。感動には７種類あり、テーマパークではこれらを組み合わせて感動を生み出している。</p>
   <details class="kando-expand">
@@ -564,6 +681,52 @@ def _build_kando_section(kando: dict) -> str:
 {ai_comment}</div>"""
 
 
+_BREAKDOWN_TITLES = {"source": "サイト別", "rating": "評点別", "period": "時期別"}
+_PERIOD_LABELS = {"recent": "直近3ヶ月", "older": "それ以前", "unknown": "時期不明"}
+
+
+def _breakdown_label(name: str, label: str) -> str:
+    if name == "source":
+        return _site_label(label)
+    if name == "rating":
+        return "評点なし" if label == "0" else f"★{label}"
+    return _PERIOD_LABELS.get(label, label)
+
+
+def _build_kando_breakdowns(breakdowns: dict | None, sampling: dict | None) -> str:
+    """口コミ別スコアから集計した、サイト・評点・時期ごとの類型スコア表。"""
+    if not breakdowns:
+        return ""
+    head = "".join(f"<th>{KANDO_LABELS[t]}</th>" for t in KANDO_TYPES)
+    tables = []
+    for name, title in _BREAKDOWN_TITLES.items():
+        groups = breakdowns.get(name) or {}
+        if len(groups) < 2:
+            continue
+        body = []
+        for label, g in sorted(groups.items(), key=lambda x: -x[1]["reviews"]):
+            n = f"{g['scored']}/{g['reviews']}件" if sampling else f"{g['reviews']}件"
+            cells = "".join(
+                f'<td class="ts-count-cell" title="検出率 {g["detection_rate"][t]}%">{g["score"][t]:.1f}</td>'
+                for t in KANDO_TYPES
+            )
+            body.append(f"<tr><td>{_breakdown_label(name, label)}</td><td class=\"ts-count-cell\">{n}</td>{cells}</tr>")
+        tables.append(f"""
+    <h4 style="margin:14px 0 6px;font-size:0.9em;">{title}</h4>
+    <table class="ts-change-table">
+      <thead><tr><th></th><th>口コミ</th>{head}</tr></thead>
+      <tbody>{"".join(body)}</tbody>
+    </table>""")
+    if not tables:
+        return ""
+    note = "採点済み口コミの平均" if sampling else "平均スコア（0〜5点）"
+    return f"""
+<details class="kando-expand" style="margin-top:16px;">
+  <summary><span class="expand-icon">▶</span> サイト別・評点別・時期別の内訳（{note}、セルにカーソルで検出率）</summary>
+  {"".join(tables)}
+</details>"""
+
+
 def _build_gap_section(gap: dict) -> str:
     if not gap:
         return "<p>データなし</p>"
@@ -577,6 +740,12 @@ def _build_gap_section(gap: dict) -> str:
     }
     SCORE_COLOR = {1: "#f87171", 2: "#fb923c", 3: "#facc15", 4: "#34d399", 5: "#10b981"}
 
+    coverage = gap.get("coverage")
+    coverage_note = (
+        f"<br>全{coverage['reviews']}件の口コミを{coverage['chunks']}チャンクに分けて動機を抽出し、統合しています。"
+        if coverage else ""
+    )
+
     cards = []
     for m in motivations:
         title = m.get("title", "")
@@ -586,6 +755,7 @@ def _build_gap_section(gap: dict) -> str:
         score = m.get("satisfaction_score", 3)
         sat_desc = m.get("satisfaction_desc", "")
         sat_evidence = m.get("satisfaction_evidence", [])
+        review_count = m.get("review_count")
 
         sat_label, sat_cls = SATISFACTION_LABEL.get(satisfaction, ("不明", "partial"))
         bar_color = SCORE_COLOR.get(score, "#94a3b8")
@@ -606,7 +776,7 @@ def _build_gap_section(gap: dict) -> str:
     <span class="gap-title">🎯 {title}</span>
     <span class="gap-badge {sat_cls}">{sat_label}</span>
   </div>
-  <p class="gap-desc">{description}</p>
+  <p class="gap-desc">{description}{f'（言及 {review_count}件）' if review_count else ''}</p>
   <p class="gap-section-label">来店前動機の根拠</p>
   <ul class="gap-evidence">{evidence_html}</ul>
   <div class="gap-score-bar" style="margin-top:12px;">
@@ -624,7 +794,7 @@ def _build_gap_section(gap: dict) -> str:
   口コミの文脈から来店前の動機を推測し、実際の体験と照らして期待充足度を分析しました。
   <span style="color:#065f46;font-weight:700;">■充足</span>
   <span style="color:#92400e;font-weight:700;margin-left:8px;">■部分充足</span>
-  <span style="color:#991b1b;font-weight:700;margin-left:8px;">■ギャップあり</span>
+  <span style="color:#991b1b;font-weight:700;margin-left:8px;">■ギャップあり</span>{coverage_note}
 </p>
 <div class="gap-grid">{"".join(cards)}</div>
 <div class="gap-overall">📊 総合インサイト
@@ -0,0 +1,209 @@
+"""標本抽出と区間推定のユーティリティ。
+
+感動の7類型スコアリングのように全件を LLM に通すと高コストな処理で、
+層化無作為抽出した一部だけを採点し、母集団全体の平均・割合を信頼区間付きで推定する。
+
+要約プロンプト（体験価値・感動コメント・ギャップ分析）に載せる代表的な口コミは
+representative_sample で選ぶ。取得順の先頭ではなく、本文の文字 2-gram TF-IDF とサイト・評点・時期で
+口コミをクラスタに分け、大きいクラスタから順に中心に最も近い口コミをトークン予算まで採る。
+"""
+
+import math
+import random
+from collections import defaultdict
+
+import numpy as np
+
+from batching import estimate_tokens, truncate_to_tokens
+
+Z_95 = 1.96
+FEATURE_DIM = 256         # 文字 2-gram をハッシュで畳み込む次元数
+FACET_WEIGHT = 0.5        # サイト・評点・時期の一致が本文の類似度に対して持つ重み
+KMEANS_ITERATIONS = 8
+
+
+def required_sample_size(population: int, margin: float, z: float = Z_95, p: float = 0.5) -> int:
+    """割合を誤差 ±margin で推定するのに必要な標本数（有限母集団修正あり）。"""
+    if population <= 0:
+        return 0
+    n0 = z * z * p * (1 - p) / (margin * margin)
+    n = n0 / (1 + (n0 - 1) / population)
+    return min(population, math.ceil(n))
+
+
+def stratified_sample(strata: list[str], n: int, seed: int = 42) -> list[int]:
+    """層ラベル列から比例配分で n 件を無作為抽出し、位置（昇順）を返す。
+
+    端数は最大剰余法で配分し、各層から最低 1 件は抽出する。最低 1 件の配分で n を超えた分は
+    配分の多い層から戻し、層の数が n より多い場合は小さい層から抽出しない（常にちょうど n 件を返す）。
+    """
+    groups: dict[str, list[int]] = defaultdict(list)
+    for i, label in enumerate(strata):
+        groups[label].append(i)
+    total = len(strata)
+    if n >= total:
+        return list(range(total))
+
+    quotas = {h: n * len(members) / total for h, members in groups.items()}
+    alloc = {h: max(1, min(len(groups[h]), int(q))) for h, q in quotas.items()}
+    remaining = n - sum(alloc.values())
+    while remaining < 0 and max(alloc.values()) > 1:
+        h = max(alloc, key=lambda h: (alloc[h], alloc[h] - quotas[h], h))
+        alloc[h] -= 1
+        remaining += 1
+    if remaining < 0:
+        for h in sorted(alloc, key=lambda h: (len(groups[h]), h))[:-remaining]:
+            alloc[h] = 0
+        remaining = 0
+    for h in sorted(quotas, key=lambda h: quotas[h] - int(quotas[h]), reverse=True):
+        if remaining <= 0:
+            break
+        if alloc[h] < len(groups[h]):
+            alloc[h] += 1
+            remaining -= 1
+
+    rng = random.Random(seed)
+    picked: list[int] = []
+    for h in sorted(groups):
+        picked.extend(rng.sample(groups[h], alloc[h]))
+    return sorted(picked)
+
+
+def stratified_estimate(values: dict[str, list[float]], sizes: dict[str, int],
+                        z: float = Z_95) -> tuple[float, float, float]:
+    """層別標本値から母平均を推定し (推定値, 下限, 上限) を返す。
+
+    values: 層ラベル → 採点済み標本の値
+    sizes:  層ラベル → 母集団での件数
+    標本が 1 件しかない層の分散は、全標本の分散で代用する。
+    """
+    moments = {h: (len(vs), float(sum(vs)), float(sum(v * v for v in vs))) for h, vs in values.items()}
+    return stratified_estimate_from_moments(moments, sizes, z)
+
+
+def stratified_estimate_from_moments(moments: dict[str, tuple[int, float, float]], sizes: dict[str, int],
+                                     z: float = Z_95) -> tuple[float, float, float]:
+    """層ごとの (標本数, 合計, 二乗和) から stratified_estimate と同じ推定を行う。
+
+    標本値そのものを保存せずに済むので、増分分析で層ごとの統計量に足し込んでいける。
+    """
+    population = sum(sizes.values())
+    total_n = sum(n for n, _, _ in moments.values())
+    if not population or not total_n:
+        return 0.0, 0.0, 0.0
+    pooled_var = _variance_from_moments(total_n, sum(s for _, s, _ in moments.values()),
+                                        sum(q for _, _, q in moments.values()))
+
+    # 標本のない層は推定から外し、残りの層で重みを正規化する
+    covered = {h: sizes[h] for h, (n, _, _) in moments.items() if n}
+    covered_total = sum(covered.values())
+    estimate, var = 0.0, 0.0
+    for h, n_pop in covered.items():
+        n, total, squares = moments[h]
+        w = n_pop / covered_total
+        s2 = _variance_from_moments(n, total, squares) if n > 1 else pooled_var
+        fpc = 1 - n / n_pop if n_pop else 0.0
+        estimate += w * total / n
+        var += w * w * fpc * s2 / n
+    half = z * math.sqrt(max(var, 0.0))
+    return estimate, estimate - half, estimate + half
+
+
+def _variance_from_moments(n: int, total: float, squares: float) -> float:
+    if n < 2:
+        return 0.0
+    return max(0.0, (squares - total * total / n) / (n - 1))
+
+
+def representative_sample(texts: list[str], budget: int, cap: int, facets: dict[str, list[str]] | None = None,
+                          max_items: int | None = None, seed: int = 42) -> list[int]:
+    """多様で代表的な口コミを選び、位置を返す（代表する口コミの多いクラスタ順）。
+
+    budget: 選んだ口コミ（1 件あたり cap トークンに切り詰めた後）の推定トークン合計の上限
+    facets: 名前 → 口コミごとのラベル列（サイト・評点・時期など）。同じラベルの口コミほど近いとみなす
+    クラスタ数は max_items と予算に収まる見込みの件数の小さい方。計算量は口コミ数に対して線形。
+    """
+    candidates = [i for i, t in enumerate(texts) if t]
+    if not candidates or budget <= 0:
+        return []
+    tokens = {i: min(estimate_tokens(texts[i]), cap) for i in candidates}
+    if sum(tokens.values()) <= budget and len(candidates) <= (max_items or len(candidates)):
+        return candidates  # 全件が予算に収まる
+    mean_tokens = sum(tokens.values()) / len(candidates)
+    k = min(len(candidates), max(1, int(budget / mean_tokens)), max_items or len(candidates))
+
+    features = _review_features([texts[i] for i in candidates],
+                                {name: [labels[i] for i in candidates] for name, labels in (facets or {}).items()})
+    assign, centers = _kmeans(features, k, seed)
+
+    sizes = np.bincount(assign, minlength=k)
+    distances = ((features - centers[assign]) ** 2).sum(axis=1)
+    picked, used = [], 0
+    for c in np.argsort(-sizes, kind="stable"):
+        members = np.flatnonzero(assign == c)
+        if not len(members):
+            continue
+        pos = candidates[int(members[np.argmin(distances[members])])]
+        if used + tokens[pos] > budget:
+            continue
+        picked.append(pos)
+        used += tokens[pos]
+    return picked
+
+
+def sample_texts(texts: list[str], positions: list[int], cap: int) -> list[str]:
+    """representative_sample で選んだ口コミを cap トークンに切り詰めて返す。"""
+    return [truncate_to_tokens(texts[i], cap) for i in positions]
+
+
+def _review_features(texts: list[str], facets: dict[str, list[str]]) -> np.ndarray:
+    """文字 2-gram の TF-IDF（L2 正規化）にファセットの one-hot を連結した特徴行列。"""
+    tf = np.zeros((len(texts), FEATURE_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if len(codes) < 2:
+            continue
+        grams = codes[:-1] * np.uint64(0x110000) + codes[1:]
+        slots = (grams * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(64 - int(math.log2(FEATURE_DIM)))
+        tf[row] = np.log1p(np.bincount(slots.astype(np.int64), minlength=FEATURE_DIM))
+    df = (tf > 0).sum(axis=0)
+    tfidf = tf * (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+    norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+    tfidf /= np.where(norms > 0, norms, 1)
+
+    blocks = [tfidf]
+    weight = FACET_WEIGHT / math.sqrt(len(facets)) if facets else 0.0
+    for labels in facets.values():
+        keys, inverse = np.unique(np.asarray(labels), return_inverse=True)
+        onehot = np.zeros((len(texts), len(keys)), dtype=np.float32)
+        onehot[np.arange(len(texts)), inverse] = weight
+        blocks.append(onehot)
+    return np.hstack(blocks)
+
+
+def _kmeans(x: np.ndarray, k: int, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """k-means++ で初期化した k-means。(クラスタ番号, 中心) を返す。"""
+    rng = np.random.default_rng(seed)
+    centers = np.empty((k, x.shape[1]), dtype=x.dtype)
+    centers[0] = x[rng.integers(len(x))]
+    nearest = ((x - centers[0]) ** 2).sum(axis=1)
+    for c in range(1, k):
+        total = nearest.sum()
+        pick = rng.choice(len(x), p=nearest / total) if total > 0 else rng.integers(len(x))
+        centers[c] = x[pick]
+        nearest = np.minimum(nearest, ((x - centers[c]) ** 2).sum(axis=1))
+
+    sq = (x ** 2).sum(axis=1)
+    for _ in range(KMEANS_ITERATIONS):
+        dist = sq[:, None] - 2 * x @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+        assign = dist.argmin(axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assign, x)
+        moved = counts > 0
+        updated = centers.copy()
+        updated[moved] = sums[moved] / counts[moved, None]
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return assign, centers
@@ -1,10 +1,13 @@
-import asyncio
 import random
 import re
+from collections.abc import Awaitable, Callable
 from urllib.parse import urlparse, unquote
 from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
 
+from normalizer import mark_normalized, normalize_text
+from profiler import profiler
+
 
 def _extract_place_name(url: str) -> str:
     """Google マップ URL から場所名を抽出する。"""
@@ -21,8 +24,13 @@ def _extract_place_name(url: str) -> str:
     return ""
 
 
-async def scrape_google_maps(url: str, max_reviews: int | None = None) -> list[dict]:
-    """Google マップから口コミを取得する。max_reviews 指定時はその件数で打ち切る。"""
+async def scrape_google_maps(url: str, max_reviews: int | None = None,
+                             on_reviews: Callable[[list[dict]], Awaitable[None]] | None = None) -> list[dict]:
+    """Google マップから口コミを取得する。max_reviews 指定時はその件数で打ち切る。
+
+    on_reviews を渡すと、スクロールで新しく読み込まれた口コミをその都度渡して待つ（分析パイプラインへの供給用）。
+    この場合の戻り値は渡した口コミそのもの（後から展開された本文では置き換えない）。
+    """
     limit_msg = f"（上限 {max_reviews} 件）" if max_reviews else "（全件）"
     print(f"🗺️  Google マップ スクレイピング開始... {limit_msg}")
 
@@ -58,21 +66,24 @@ async def scrape_google_maps(url: str, max_reviews: int | None = None) -> list[d
         place_name = _extract_place_name(url)
         if place_name:
             print(f"  🔍 検索ワード: {place_name}")
-            await page.goto("https://www.google.com/maps", wait_until="domcontentloaded", timeout=60000)
-            await asyncio.sleep(3)
+            with profiler.span("google_maps.goto", "scrape", url="https://www.google.com/maps"):
+                await page.goto("https://www.google.com/maps", wait_until="domcontentloaded", timeout=60000)
+            await profiler.sleep(3, "google_maps")
             search_box = await page.query_selector('input[name="q"]')
             if search_box:
                 await search_box.fill(place_name)
-                await asyncio.sleep(1)
+                await profiler.sleep(1, "google_maps")
                 await search_box.press("Enter")
-                await asyncio.sleep(5)
+                await profiler.sleep(5, "google_maps")
             else:
                 # フォールバック: 直接 URL
-                await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                await asyncio.sleep(3)
+                with profiler.span("google_maps.goto", "scrape", url=url):
+                    await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+                await profiler.sleep(3, "google_maps")
         else:
-            await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            await asyncio.sleep(3)
+            with profiler.span("google_maps.goto", "scrape", url=url):
+                await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+            await profiler.sleep(3, "google_maps")
 
         # Cookie 同意ダイアログを閉じる
         for selector in ['button[aria-label*="同意"]', 'button[aria-label*="Accept"]']:
@@ -80,7 +91,7 @@ async def scrape_google_maps(url: str, max_reviews: int | None = None) -> list[d
                 btn = await page.query_selector(selector)
                 if btn:
                     await btn.click()
-                    await asyncio.sleep(1)
+                    await profiler.sleep(1, "google_maps")
                     break
             except Exception:
                 pass
@@ -103,11 +114,12 @@ async def scrape_google_maps(url: str, max_reviews: int | None = None) -> list[d
         # 口コミ要素が出現するまで待つ（最大20秒）
         print("  ⏳ 口コミの読み込みを待機中...")
         try:
-            await page.wait_for_selector('[data-review-id]', timeout=20000)
+            with profiler.span("google_maps.wait_reviews", "scrape"):
+                await page.wait_for_selector('[data-review-id]', timeout=20000)
             print("  ✅ 口コミ要素を検出しました")
         except Exception:
             print("  ⚠️ 口コミ要素の待機タイムアウト。そのまま続行します。")
-        await asyncio.sleep(2)
+        await profiler.sleep(2, "google_maps")
 
         # スクロール可能なコンテナを JS で特定
         scroll_js = """
@@ -136,45 +148,51 @@ async def scrape_google_maps(url: str, max_reviews: int | None = None) -> list[d
         print("  ⏳ 口コミをスクロール取得中...")
         last_count = 0
         stuck = 0
+        emitted: list[dict] = []  # on_reviews に渡し済みの口コミ
 
         for i in range(150):
             # スクロール（特定できたクラス優先、fallback は mouse.wheel）
-            try:
-                scrolled = await page.evaluate(f"""
-                    () => {{
-                        const el = document.querySelector('[data-review-id]');
-                        if (!el) return false;
-                        let c = el.parentElement;
-                        for (let i = 0; i < 10; i++) {{
-                            if (!c) break;
-                            const ov = window.getComputedStyle(c).overflowY;
-                            if ((ov === 'auto' || ov === 'scroll') && c.scrollHeight > c.clientHeight + 50) {{
-                                c.scrollTop += 3000;
-                                return true;
+            with profiler.span("google_maps.scroll", "scrape", step=i + 1):
+                try:
+                    scrolled = await page.evaluate(f"""
+                        () => {{
+                            const el = document.querySelector('[data-review-id]');
+                            if (!el) return false;
+                            let c = el.parentElement;
+                            for (let i = 0; i < 10; i++) {{
+                                if (!c) break;
+                                const ov = window.getComputedStyle(c).overflowY;
+                                if ((ov === 'auto' || ov === 'scroll') && c.scrollHeight > c.clientHeight + 50) {{
+                                    c.scrollTop += 3000;
+                                    return true;
+                                }}
+                                c = c.parentElement;
                             }}
-                            c = c.parentElement;
+                            return false;
                         }}
-                        return false;
-                    }}
-                """)
-                if not scrolled:
+                    """)
+                    if not scrolled:
+                        await page.mouse.wheel(0, 3000)
+                except Exception:
                     await page.mouse.wheel(0, 3000)
-            except Exception:
-                await page.mouse.wheel(0, 3000)
 
-            await asyncio.sleep(random.uniform(0.8, 1.5))
+            await profiler.sleep(random.uniform(0.8, 1.5), "google_maps")
 
             # 「もっと見る」ボタンを展開
-            try:
-                await page.evaluate("""
-                    document.querySelectorAll('button.w8nwRe, button[jsaction*="expandReview"]').forEach(b => b.click());
-                """)
-            except Exception:
-                pass
+            with profiler.span("google_maps.expand", "scrape", step=i + 1):
+                try:
+                    await page.evaluate("""
+                        document.querySelectorAll('button.w8nwRe, button[jsaction*="expandReview"]').forEach(b => b.click());
+                    """)
+                except Exception:
+                    pass
 
-            soup = BeautifulSoup(await page.content(), "html.parser")
-            reviews_now = _parse_google_reviews(soup)
+            html = await page.content()
+            with profiler.span("google_maps.parse", "parse", step=i + 1):
+                reviews_now = _parse_google_reviews(BeautifulSoup(html, "html.parser"))
             count = len(reviews_now)
+            if on_reviews:
+                emitted.extend(await _emit_new(reviews_now, len(emitted), max_reviews, on_reviews))
 
             if (i + 1) % 10 == 0 or count != last_count:
                 print(f"    📥 取得件数: {count}件（試行 {i+1}）")
@@ -192,32 +210,27 @@ async def scrape_google_maps(url: str, max_reviews: int | None = None) -> list[d
                 stuck = 0
             last_count = count
 
-        soup = BeautifulSoup(await page.content(), "html.parser")
-        reviews = _parse_google_reviews(soup)
+        html = await page.content()
+        with profiler.span("google_maps.parse", "parse"):
+            reviews = _parse_google_reviews(BeautifulSoup(html, "html.parser"))
         if max_reviews:
             reviews = reviews[:max_reviews]
+        if on_reviews:
+            emitted.extend(await _emit_new(reviews, len(emitted), max_reviews, on_reviews))
+            reviews = emitted
         await browser.close()
 
     print(f"  ✅ Google マップ: {len(reviews)}件取得")
     return reviews
 
 
-def _clean_review_text(text: str) -> str:
-    """Google マップが付加するメタデータ（食事の種類・料金・評点など）を除去する。"""
-    metadata_markers = [
-        r'食事の種類',
-        r'1\s*人あたりの料金',
-        r'食事[:：]\s*\d',
-        r'サービス[:：]\s*\d',
-        r'雰囲気[:：]\s*\d',
-        r'予約\n',
-        r'グループの人数',
-    ]
-    pattern = '|'.join(f'(?:{m})' for m in metadata_markers)
-    m = re.search(pattern, text)
-    if m:
-        text = text[:m.start()].strip()
-    return text
+async def _emit_new(reviews_now: list[dict], done: int, max_reviews: int | None,
+                    on_reviews: Callable[[list[dict]], Awaitable[None]]) -> list[dict]:
+    """まだ渡していない口コミ（done 件目以降、上限まで）を on_reviews に渡し、渡した分を返す。"""
+    new = reviews_now[done:max_reviews] if max_reviews else reviews_now[done:]
+    if new:
+        await on_reviews(new)
+    return new
 
 
 def _parse_google_reviews(soup: BeautifulSoup) -> list[dict]:
@@ -238,7 +251,7 @@ def _parse_google_reviews(soup: BeautifulSoup) -> list[dict]:
                 candidates = block.find_all(["span", "p"], string=True)
                 text_el = max(candidates, key=lambda x: len(x.get_text()), default=None)
             raw_text = text_el.get_text(strip=True) if text_el else ""
-            text = _clean_review_text(raw_text)
+            text = normalize_text(raw_text)
             if len(text) < 5 or text in seen:
                 continue
             seen.add(text)
@@ -262,14 +275,14 @@ def _parse_google_reviews(soup: BeautifulSoup) -> list[dict]:
             name_el = block.find(class_=re.compile(r"d4r55|reviewer|al6Kxe"))
             reviewer_name = name_el.get_text(strip=True) if name_el else ""
 
-            reviews.append({
+            reviews.append(mark_normalized({
                 "source": "google_maps",
                 "reviewer_name": reviewer_name,
                 "rating": rating,
                 "date": date_str,
                 "text": text,
                 "location": "",
-            })
+            }))
         except Exception:
             continue
     return reviews
@@ -1,12 +1,18 @@
-import asyncio
 import random
 import re
+from collections.abc import Awaitable, Callable
 from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
 
+from profiler import profiler
 
-async def scrape_tabelog(url: str, max_reviews: int | None = None) -> list[dict]:
-    """食べログから口コミを取得する。max_reviews 指定時はその件数で打ち切る。"""
+
+async def scrape_tabelog(url: str, max_reviews: int | None = None,
+                        on_reviews: Callable[[list[dict]], Awaitable[None]] | None = None) -> list[dict]:
+    """食べログから口コミを取得する。max_reviews 指定時はその件数で打ち切る。
+
+    on_reviews を渡すと、ページを取得するたびに新しい口コミを渡して待つ（分析パイプラインへの供給用）。
+    """
     limit_msg = f"（上限 {max_reviews} 件）" if max_reviews else "（全件）"
     print(f"🍽️  食べログ スクレイピング開始... {limit_msg}")
     reviews = []
@@ -31,14 +37,16 @@ async def scrape_tabelog(url: str, max_reviews: int | None = None) -> list[dict]
             print(f"  📄 ページ {page_num} を取得中: {page_url}")
 
             try:
-                await page.goto(page_url, wait_until="networkidle", timeout=30000)
-                await asyncio.sleep(random.uniform(0.5, 1.5))
+                with profiler.span("tabelog.goto", "scrape", page=page_num):
+                    await page.goto(page_url, wait_until="networkidle", timeout=30000)
+                await profiler.sleep(random.uniform(0.5, 1.5), "tabelog")
             except Exception as e:
                 print(f"  ⚠️ ページ取得失敗: {e}")
                 break
 
-            soup = BeautifulSoup(await page.content(), "html.parser")
-            new_reviews = _parse_tabelog_reviews(soup)
+            html = await page.content()
+            with profiler.span("tabelog.parse", "parse", page=page_num):
+                new_reviews = _parse_tabelog_reviews(BeautifulSoup(html, "html.parser"))
 
             if not new_reviews:
                 print(f"  ✅ 終端ページに到達（ページ {page_num}）")
@@ -46,6 +54,11 @@ async def scrape_tabelog(url: str, max_reviews: int | None = None) -> list[dict]
 
             reviews.extend(new_reviews)
             print(f"    📥 ページ {page_num}: {len(new_reviews)}件 / 累計 {len(reviews)}件")
+            if max_reviews and len(reviews) > max_reviews:
+                # 上限を超えた分は渡さない
+                new_reviews = new_reviews[:len(new_reviews) - (len(reviews) - max_reviews)]
+            if on_reviews:
+                await on_reviews(new_reviews)
 
             if max_reviews and len(reviews) >= max_reviews:
                 reviews = reviews[:max_reviews]
@@ -66,7 +79,7 @@ async def scrape_tabelog(url: str, max_reviews: int | None = None) -> list[dict]
                     break
 
             page_num += 1
-            await asyncio.sleep(random.uniform(1.0, 2.0))
+            await profiler.sleep(random.uniform(1.0, 2.0), "tabelog")
 
         await browser.close()
 
@@ -1,12 +1,18 @@
-import asyncio
 import random
 import re
+from collections.abc import Awaitable, Callable
 from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
 
+from profiler import profiler
 
-async def scrape_tripadvisor(url: str, max_reviews: int | None = None) -> list[dict]:
-    """TripAdvisor から口コミを取得する。max_reviews 指定時はその件数で打ち切る。"""
+
+async def scrape_tripadvisor(url: str, max_reviews: int | None = None,
+                            on_reviews: Callable[[list[dict]], Awaitable[None]] | None = None) -> list[dict]:
+    """TripAdvisor から口コミを取得する。max_reviews 指定時はその件数で打ち切る。
+
+    on_reviews を渡すと、ページを取得するたびに新しい口コミを渡して待つ（分析パイプラインへの供給用）。
+    """
     limit_msg = f"（上限 {max_reviews} 件）" if max_reviews else "（全件）"
     print(f"✈️  TripAdvisor スクレイピング開始... {limit_msg}")
     reviews = []
@@ -40,28 +46,31 @@ async def scrape_tripadvisor(url: str, max_reviews: int | None = None) -> list[d
 
             print(f"  📄 ページ {page_num} を取得中 (offset={offset})")
             try:
-                await page.goto(current_url, wait_until="networkidle", timeout=30000)
-                await asyncio.sleep(random.uniform(0.5, 1.5))
+                with profiler.span("tripadvisor.goto", "scrape", page=page_num):
+                    await page.goto(current_url, wait_until="networkidle", timeout=30000)
+                await profiler.sleep(random.uniform(0.5, 1.5), "tripadvisor")
             except Exception as e:
                 print(f"  ⚠️ ページ取得失敗: {e}")
                 break
 
             # 「続きを読む」ボタンをクリックして全文展開
-            try:
-                more_btns = await page.query_selector_all(
-                    'button[data-test-target="expand-review"], button.taLnk.ulBlueLinks, span.taLnk'
-                )
-                for btn in more_btns[:20]:
-                    try:
-                        await btn.click()
-                        await asyncio.sleep(0.3)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-
-            soup = BeautifulSoup(await page.content(), "html.parser")
-            new_reviews = _parse_tripadvisor_reviews(soup)
+            with profiler.span("tripadvisor.expand", "scrape", page=page_num):
+                try:
+                    more_btns = await page.query_selector_all(
+                        'button[data-test-target="expand-review"], button.taLnk.ulBlueLinks, span.taLnk'
+                    )
+                    for btn in more_btns[:20]:
+                        try:
+                            await btn.click()
+                            await profiler.sleep(0.3, "tripadvisor")
+                        except Exception:
+                            pass
+                except Exception:
+                    pass
+
+            html = await page.content()
+            with profiler.span("tripadvisor.parse", "parse", page=page_num):
+                new_reviews = _parse_tripadvisor_reviews(BeautifulSoup(html, "html.parser"))
 
             if not new_reviews:
                 print(f"  ✅ 終端ページに到達（ページ {page_num}）")
@@ -69,6 +78,11 @@ async def scrape_tripadvisor(url: str, max_reviews: int | None = None) -> list[d
 
             reviews.extend(new_reviews)
             print(f"    📥 ページ {page_num}: {len(new_reviews)}件 / 累計 {len(reviews)}件")
+            if max_reviews and len(reviews) > max_reviews:
+                # 上限を超えた分は渡さない
+                new_reviews = new_reviews[:len(new_reviews) - (len(reviews) - max_reviews)]
+            if on_reviews:
+                await on_reviews(new_reviews)
 
             if max_reviews and len(reviews) >= max_reviews:
                 reviews = reviews[:max_reviews]
@@ -85,7 +99,7 @@ async def scrape_tripadvisor(url: str, max_reviews: int | None = None) -> list[d
 
             offset += 15
             page_num += 1
-            await asyncio.sleep(random.uniform(1.0, 2.0))
+            await profiler.sleep(random.uniform(1.0, 2.0), "tripadvisor")
 
         await browser.close()
 
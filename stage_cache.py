@@ -0,0 +1,82 @@
+"""分析ステージの出力キャッシュモジュール。
+
+分析はステージ（キーワード → 体験価値 / 感動分析 / ギャップ分析）の DAG で、各ステージの出力を
+入力のハッシュ（キー）ごとに CACHE_DIR に保存する。キーには口コミ集合・分析オプション・
+プロンプトの版（analyzer.PROMPT_VERSIONS）・使用モデルと、上流ステージの出力のハッシュを含めるので、
+再実行時はキーが変わったステージとその下流だけを計算し直す。
+
+- force に挙げたステージはキャッシュがあっても計算し直す（結果で上書きする）。
+- status() は計算せずに実行予定（"cached" / "run" / "forced"）を返す（main.py の --dry-run）。
+- 古いキーのファイルは消さない。不要になったら CACHE_DIR ごと削除してよい。
+"""
+
+import hashlib
+import json
+import os
+
+from profiler import profiler
+
+CACHE_DIR = ".stage_cache"
+
+
+def digest(value) -> str:
+    """JSON にできる値のハッシュ（16 桁）。dict はキー順に依存しない。"""
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class StageCache:
+    """ステージ出力の保存先と、1 回の分析でのステージごとの実行記録（report()）。"""
+
+    def __init__(self, directory: str = CACHE_DIR, force=(), enabled: bool = True):
+        self.directory = directory
+        self.force = set(force)
+        self.enabled = enabled
+        self.records: list[dict] = []
+
+    def key(self, stage: str, inputs: dict) -> str:
+        return digest({"stage": stage, **inputs})
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.directory, f"{stage}_{key}.json")
+
+    def status(self, stage: str, key: str) -> str:
+        if stage in self.force:
+            return "forced"
+        if self.enabled and os.path.exists(self._path(stage, key)):
+            return "cached"
+        return "run"
+
+    def load(self, stage: str, key: str):
+        """保存済みの出力（なければ None）。"""
+        try:
+            with open(self._path(stage, key), encoding="utf-8") as f:
+                return json.load(f)["output"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, stage: str, key: str, output) -> None:
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(stage, key)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"stage": stage, "key": key, "output": output}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    async def run(self, stage: str, key: str, compute, refresh: bool = False):
+        """キャッシュがあれば読み込み、なければ（または refresh / force なら）compute() を実行して保存する。"""
+        status = "run" if refresh else self.status(stage, key)
+        with profiler.span(stage, "stage") as span:
+            output = self.load(stage, key) if status == "cached" else None
+            if output is None:
+                status = "run" if status == "cached" else status
+                output = await compute()
+                self.save(stage, key, output)
+            span["status"] = status
+        self.records.append({"stage": stage, "key": key, "status": status})
+        return output
+
+    def report(self) -> list[dict]:
+        return list(self.records)
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import re
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import analyzer  # noqa: E402
+import batching  # noqa: E402
+
+REVIEWS = [{"text": f"口コミ{i}の本文です。"} for i in range(6)]
+
+
+def test_gap_defaults_to_single_call(monkeypatch):
+    """mode を指定しない呼び出し（generate_v2.py など）は従来どおり 1 回の分析になる。"""
+    stages = []
+
+    async def generate(prompt, stage="other", schema=None, model=None):
+        stages.append(stage)
+        return json.dumps({"motivations": [], "overall_comment": "総合"}, ensure_ascii=False)
+
+    monkeypatch.setattr(analyzer, "_generate", generate)
+    result = asyncio.run(analyzer._analyze_gap(REVIEWS))
+    assert stages == ["gap"]
+    assert result["overall_comment"] == "総合"
+
+
+def test_gap_mapreduce_merges_candidates_by_member(monkeypatch):
+    """reduce が返した members で候補をまとめ、件数の合計から充足度を計算し直す。"""
+    monkeypatch.setitem(batching.TOKEN_BUDGETS, "gap_map", 45)  # 3 件ずつ 2 チャンク
+    prompts = {"gap_map": [], "gap_reduce": []}
+
+    async def generate(prompt, stage="other", schema=None, model=None):
+        prompts[stage].append(prompt)
+        if stage == "gap_map":
+            rows = [int(i) for i in re.findall(r"^\[(\d+)\]", prompt, re.M)]
+            return json.dumps({"motivations": [
+                {"title": "料理", "description": "料理目当て",
+                 "evidence": [{"index": rows[0], "quote": "美味しい"}, {"index": 99, "quote": "範囲外"}],
+                 "mention_count": 3, "satisfied_count": 2, "partial_count": 1, "gap_count": 0,
+                 "satisfaction_evidence": [{"index": rows[1], "quote": "満足"}]},
+                {"title": "待ち時間", "description": "すぐ入れる",
+                 "evidence": [{"index": rows[2], "quote": "並んだ"}],
+                 "mention_count": 2, "satisfied_count": 0, "partial_count": 0, "gap_count": 2,
+                 "satisfaction_evidence": []},
+            ]}, ensure_ascii=False)
+        return json.dumps({"motivations": [
+            {"title": "料理を楽しむ", "description": "d", "members": [0, 2, 99], "satisfaction_desc": "充足"},
+            {"title": "待たずに入る", "description": "d", "members": [3, 1], "satisfaction_desc": "不足"},
+            {"title": "該当なし", "description": "d", "members": [], "satisfaction_desc": ""},
+        ], "overall_comment": "総合"}, ensure_ascii=False)
+
+    monkeypatch.setattr(analyzer, "_generate", generate)
+    result = asyncio.run(analyzer._analyze_gap(REVIEWS, mode="mapreduce"))
+
+    assert len(prompts["gap_map"]) == 2
+    assert prompts["gap_reduce"][0].count("料理: 料理目当て") == 2
+    assert result["coverage"] == {"reviews": 6, "chunks": 2, "candidates": 4}
+    assert result["overall_comment"] == "総合"
+    food, wait = result["motivations"]
+    assert food["title"] == "料理を楽しむ"
+    assert food["review_count"] == 6
+    assert food["satisfaction_counts"] == {"satisfied": 4, "partial": 2, "gap": 0}
+    assert (food["satisfaction"], food["satisfaction_score"]) == ("satisfied", 4)
+    # チャンク外の index は捨て、チャンクをまたいで交互に並べる
+    assert food["evidence"] == [{"index": 0, "quote": "美味しい"}, {"index": 3, "quote": "美味しい"}]
+    assert [e["index"] for e in food["satisfaction_evidence"]] == [1, 4]
+    assert wait["review_count"] == 4
+    assert (wait["satisfaction"], wait["satisfaction_score"]) == ("gap", 1)
+
+
+def test_gap_satisfaction_thresholds():
+    def judge(satisfied, partial, gap):
+        return analyzer._gap_satisfaction({"satisfied_count": satisfied, "partial_count": partial, "gap_count": gap})
+
+    assert judge(0, 0, 0) == ("partial", 3)
+    assert judge(7, 0, 3) == ("satisfied", 4)
+    assert judge(2, 4, 4) == ("partial", 3)
+    assert judge(3, 1, 6) == ("gap", 2)
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from batching import (MAX_ITEMS, PER_REVIEW_CAPS, TOKEN_BUDGETS, BatchPacker, estimate_tokens, pack_batches,
+                      truncate_to_tokens)
+
+
+def _texts(n: int, seed: int = 5) -> list[str]:
+    rng = random.Random(seed)
+    return ["出汁が美味しい。" * rng.randint(1, 40) + "good" * rng.randint(0, 20) for _ in range(n)]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("美味しい") == 4
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("味abc") == 2
+
+
+def test_truncate_to_tokens():
+    text = "あ" * 10 + "b" * 40
+    assert truncate_to_tokens(text, 100) == text
+    assert truncate_to_tokens(text, 5) == "あ" * 5
+    cut = truncate_to_tokens(text, 14)
+    assert estimate_tokens(cut) <= 14
+    assert cut == "あ" * 10 + "b" * 16
+
+
+@pytest.mark.parametrize("stage", ["keywords", "kando", "gap"])
+def test_batches_respect_budget_cap_and_max_items(stage):
+    texts = _texts(500)
+    batches = pack_batches(texts, stage)
+    assert [pos for batch in batches for pos, _, _ in batch] == list(range(len(texts)))
+    for batch in batches:
+        assert sum(tokens for _, _, tokens in batch) <= TOKEN_BUDGETS[stage]
+        assert len(batch) <= MAX_ITEMS[stage]
+        for pos, text, tokens in batch:
+            assert estimate_tokens(text) <= PER_REVIEW_CAPS[stage]
+            assert texts[pos].startswith(text)
+    # 予算いっぱいまで詰める（次の 1 件が入らないときだけバッチを区切る）
+    for batch, following in zip(batches, batches[1:]):
+        used = sum(tokens for _, _, tokens in batch)
+        assert len(batch) == MAX_ITEMS[stage] or used + following[0][2] > TOKEN_BUDGETS[stage]
+
+
+def test_oversized_review_is_truncated_not_dropped():
+    huge = "長" * 100_000
+    batches = pack_batches(["短い", huge, "短い"], "kando")
+    assert [[pos for pos, _, _ in batch] for batch in batches] == [[0, 1, 2]]
+    assert batches[0][1][1] == "長" * PER_REVIEW_CAPS["kando"]
+
+
+def test_positions_and_budget_override():
+    batches = pack_batches(["あ" * 10] * 4, "keywords", positions=[3, 8, 9, 20], budget=30)
+    assert [[pos for pos, _, _ in batch] for batch in batches] == [[3, 8], [9, 20]]
+    assert pack_batches([], "keywords") == []
+
+
+def test_streaming_packer_matches_pack_batches():
+    texts = _texts(300, seed=9)
+    packer = BatchPacker("keywords")
+    streamed = [b for pos, text in enumerate(texts) if (b := packer.add(pos, text))]
+    streamed.append(packer.flush())
+    assert streamed == pack_batches(texts, "keywords")
+    assert packer.flush() is None
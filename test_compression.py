@@ -0,0 +1,58 @@
+from batching import estimate_tokens
+from compression import PromptCompressor, compress_text
+
+SHARED = "駅から近くて便利なお店です。"
+TEXTS = [
+    "出汁が美味しい！！！😋😋 ★5です。もっと見る https://example.com/x",
+    SHARED + "雰囲気も良い。雰囲気も良い。",
+    SHARED + "味は普通でした。",
+    SHARED + "待ちすぎでした笑笑笑",
+    SHARED,
+]
+
+
+def test_compress_text_keeps_rating_and_words():
+    assert compress_text("最高ーーーーー！！(Google による翻訳)\n\n★★★★☆ 😋") == "最高ーーー！ ★★★★☆"
+    assert compress_text("Read more  www") == "w"
+
+
+def test_compressor_removes_repeated_and_shared_sentences():
+    compressor = PromptCompressor()
+    out = [compressor.add(t) for t in TEXTS]
+    assert out == [
+        "出汁が美味しい！ ★5です。",
+        SHARED + "雰囲気も良い。",
+        SHARED + "味は普通でした。",
+        "待ちすぎでした笑",  # 先行する 2 件に出ている共通文は削る
+        SHARED,  # 全文が共通文なら残す
+    ]
+    assert compressor.texts == out
+    # 感動・キーワードの判定に使う語は残る
+    for word in ("出汁", "美味しい", "★5", "雰囲気", "普通", "待ちすぎ"):
+        assert any(word in t for t in out)
+
+    report = compressor.report()
+    assert report["reviews"] == 5
+    assert report["raw_tokens"] == sum(estimate_tokens(t) for t in TEXTS)
+    assert report["tokens"] == sum(estimate_tokens(t) for t in out)
+    assert report["removed"] == {"duplicate_sentences": 1, "shared_sentences": 2}
+    assert report["reduction"] == round((1 - report["tokens"] / report["raw_tokens"]) * 100, 1)
+
+
+def test_disabled_compressor_is_passthrough():
+    compressor = PromptCompressor(enabled=False)
+    out = [compressor.add(t) for t in TEXTS + [None]]
+    assert out == TEXTS + [""]
+    report = compressor.report()
+    assert report["enabled"] is False
+    assert report["reduction"] == 0.0
+    assert report["removed"] == {"duplicate_sentences": 0, "shared_sentences": 0}
+
+
+def test_same_order_gives_same_texts():
+    """到着順で決まるので、一括分析とストリーミングで同じ本文になる。"""
+    a, b = PromptCompressor(), PromptCompressor()
+    for t in TEXTS:
+        a.add(t)
+    assert [b.add(t) for t in TEXTS] == a.texts
+    assert PromptCompressor().report()["reduction"] == 0.0
@@ -0,0 +1,53 @@
+from datetime import date
+
+from dates import add_months, period_of, recent_cutoff, reference_day, resolve_date_range, review_date_range
+
+ANCHOR = date(2025, 6, 15)
+A = ANCHOR.toordinal()
+
+
+def _day(y: int, m: int, d: int) -> int:
+    return date(y, m, d).toordinal()
+
+
+def test_add_months_clamps_to_month_end():
+    assert add_months(date(2025, 3, 31), -1) == date(2025, 2, 28)
+    assert add_months(date(2024, 12, 15), 2) == date(2025, 2, 15)
+
+
+def test_relative_dates_have_width():
+    assert resolve_date_range("たった今", ANCHOR) == (A, A)
+    assert resolve_date_range("昨日", ANCHOR) == (A - 1, A - 1)
+    assert resolve_date_range("2 週間前", ANCHOR) == (A - 20, A - 14)
+    assert resolve_date_range("最終編集: 3 か月前", ANCHOR) == (_day(2025, 2, 16), _day(2025, 3, 15))
+    assert resolve_date_range("a month ago", ANCHOR) == (_day(2025, 4, 16), _day(2025, 5, 15))
+    assert resolve_date_range("1年前", ANCHOR) == (_day(2023, 6, 16), _day(2024, 6, 15))
+
+
+def test_absolute_dates():
+    assert resolve_date_range("2024/05/03", ANCHOR) == (_day(2024, 5, 3), _day(2024, 5, 3))
+    assert resolve_date_range("2024年5月訪問", ANCHOR) == (_day(2024, 5, 1), _day(2024, 5, 31))
+    assert resolve_date_range("Visited Feb 2024", ANCHOR) == (_day(2024, 2, 1), _day(2024, 2, 29))
+    # 存在しない日付は年月として扱う
+    assert resolve_date_range("2024/02/30", ANCHOR) == (_day(2024, 2, 1), _day(2024, 2, 29))
+    assert resolve_date_range("", ANCHOR) is None
+    assert resolve_date_range("不明", ANCHOR) is None
+
+
+def test_review_date_range_prefers_normalized_value():
+    review = {"date": "2 週間前", "scraped_at": "2025-06-15T10:00:00"}
+    assert review_date_range(review) == (A - 20, A - 14)
+    assert review_date_range(dict(review, date_range=[1, 2])) == (1, 2)
+    assert review_date_range(dict(review, date_range=None)) is None
+
+
+def test_recent_period():
+    reviews = [{"scraped_at": "2025-05-31T00:00:00"}, {"scraped_at": "2025-06-15T00:00:00"}, {}]
+    reference = reference_day(reviews)
+    assert reference == A
+    cutoff = recent_cutoff(_day(2025, 5, 31))
+    assert cutoff == _day(2025, 2, 28)
+    # 範囲の最遅日が基準日以降なら直近
+    assert period_of((cutoff - 30, cutoff), cutoff) == "recent"
+    assert period_of((cutoff - 30, cutoff - 1), cutoff) == "older"
+    assert period_of(None, cutoff) == "unknown"
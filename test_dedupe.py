@@ -0,0 +1,60 @@
+import numpy as np
+
+import dedupe
+from dedupe import NearDuplicateIndex, jaccard, minhash, shingles, split_duplicates, summarize_duplicates
+
+BASE = "ランチで訪問しました。出汁の効いたうどんがとても美味しく、店員さんの接客も丁寧でした。また来たいです。"
+
+
+def test_shingles_ignore_whitespace_and_are_unique():
+    a = shingles("あいう えおあいう")
+    assert np.array_equal(a, shingles("あいうえおあいう"))
+    assert len(a) == len(set(a.tolist())) == 5
+    assert len(shingles("あい")) == 0
+
+
+def test_minhash_estimates_jaccard():
+    a, b = shingles(BASE), shingles(BASE.replace("うどん", "そば").replace("丁寧", "親切"))
+    estimate = float((minhash(a) == minhash(b)).mean())
+    assert abs(estimate - jaccard(a, b)) < 0.15
+
+
+def _review(text: str, source: str = "tabelog", name: str = "A") -> dict:
+    return {"source": source, "reviewer_name": name, "text": text}
+
+
+def test_split_duplicates_finds_cross_site_repost():
+    reviews = [
+        _review(BASE),
+        _review(BASE.replace("また来たいです。", "また来たいと思います！"), source="google_maps"),
+        _review("駅から遠いですが、焼き鳥の種類が多く、どれも香ばしく焼き上がっていて満足しました。", name="B"),
+        _review("美味しかった"),  # MIN_CHARS 未満は対象外
+        _review("美味しかった", name="C"),
+    ]
+    canonical, duplicates = split_duplicates(reviews)
+    assert [r["source"] for r in duplicates] == ["google_maps"]
+    assert duplicates[0]["dup_of"] == dedupe.review_key(reviews[0])
+    assert len(canonical) == 4
+
+    summary = summarize_duplicates(duplicates)
+    assert summary["count"] == 1
+    assert summary["by_source"] == {"google_maps": 1}
+
+
+def test_existing_index_is_used_for_increments():
+    index = NearDuplicateIndex()
+    assert index.add("old", BASE) is None
+    canonical, duplicates = split_duplicates([_review(BASE + "！")], index)
+    assert not canonical
+    assert duplicates[0]["dup_of"] == "old"
+
+
+def test_full_buckets_still_find_duplicates(monkeypatch):
+    """バケットの上限で登録されなかった帯があっても、他の帯で重複が見つかる。"""
+    monkeypatch.setattr(dedupe, "MAX_BUCKET", 1)
+    index = NearDuplicateIndex()
+    variants = [f"{BASE}{i}番目の訪問です。季節のメニューも試しました。" for i in range(30)]
+    found = [index.add(f"k{i}", text) for i, text in enumerate(variants)]
+    assert found[0] is None
+    assert all(f is not None for f in found[1:])
+    assert all(len(bucket) <= 1 for table in index.tables for bucket in table.values())
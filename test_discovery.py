@@ -0,0 +1,57 @@
+import pytest
+
+from discovery import DiscoveryTracker
+
+
+def _tracker(*batches: set[str], **kwargs) -> DiscoveryTracker:
+    tracker = DiscoveryTracker(**kwargs)
+    for keys in batches:
+        tracker.record(keys)
+    return tracker
+
+
+def test_record_counts_new_keys():
+    tracker = _tracker({"出汁", "接客"}, {"出汁", "残念"})
+    assert tracker.curve == [2, 1]
+    assert tracker.incidence == {"出汁": 2, "接客": 1, "残念": 1}
+
+
+def test_chao2_with_doubletons():
+    # m=4, Q1=2（b, c）, Q2=1（d）: 4 + (3/4)·2²/(2·1) = 5.5
+    tracker = _tracker({"a", "b", "d"}, {"a", "c"}, {"a", "d"}, set())
+    assert tracker.estimated_total() == pytest.approx(5.5)
+    assert tracker.estimated_recall() == round(4 / 5.5, 3)
+
+
+def test_chao2_bias_corrected_without_doubletons():
+    # m=3, Q1=2, Q2=0: 3 + (2/3)·2·1/2 = 3.667
+    tracker = _tracker({"a", "b", "c"}, {"a"}, {"a"})
+    assert tracker.estimated_total() == pytest.approx(3 + 2 / 3)
+    # 1 回しか出ていない語が 1 つだけなら未発見数は 0
+    assert _tracker({"a", "b"}, {"a"}, {"a"}).estimated_total() == pytest.approx(2.0)
+    assert DiscoveryTracker().estimated_total() == 0.0
+    assert DiscoveryTracker().estimated_recall() == 1.0
+
+
+def test_stop_rule():
+    keys = iter(range(1000))
+
+    def batch(new: int) -> set[str]:
+        return {f"k{next(keys)}" for _ in range(new)}
+
+    tracker = DiscoveryTracker(threshold=1.0, window=3, min_batches=5)
+    for new in (5, 3, 0, 1):
+        tracker.record(batch(new))
+        assert not tracker.should_stop()  # min_batches までは止めない
+    tracker.record(batch(1))
+    assert tracker.should_stop()  # 直近 3 バッチの平均 2/3 < 1
+
+    tracker = _tracker(*(batch(n) for n in (5, 3, 1, 1, 1)), threshold=1.0, window=3, min_batches=5)
+    assert not tracker.should_stop()  # 平均がちょうど閾値なら続ける
+
+
+def test_summary():
+    # m=2, Q1=1, Q2=1: 2 + (1/2)·1²/(2·1) = 2.25
+    summary = _tracker({"a", "b"}, {"a"}).summary(total_batches=10, stopped=True)
+    assert summary == {"batches_total": 10, "batches_used": 2, "stopped_early": True, "curve": [2, 0],
+                       "observed": 2, "estimated_total": 2.2, "estimated_recall": 0.889}
@@ -0,0 +1,61 @@
+import analyzer
+from incremental import KandoStats, KeywordStats, review_key
+from mock_backend import synthetic_reviews
+
+
+def test_review_key_ignores_date():
+    a = {"source": "tabelog", "reviewer_name": "A", "text": "美味しかった", "date": "3か月前"}
+    b = dict(a, date="2025/01/01")
+    assert review_key(a) == review_key(b)
+    assert review_key(a) != review_key(dict(a, reviewer_name="B"))
+
+
+def test_kando_stats_merge_by_stratum():
+    stats = KandoStats(2)
+    stats.add("x", [2, 0])
+    stats.add("x", [1, 3])
+    stats.add("x", None)
+    assert stats.population == 3
+    assert stats.scored == 2
+    assert stats.totals(0) == (3, 2)
+    assert stats.moments(1) == {"x": (2, 3.0, 9.0)}
+    restored = KandoStats.from_dict(stats.to_dict(), 2)
+    assert restored.sizes() == {"x": 3}
+
+
+def test_keyword_stats_rate():
+    stats = KeywordStats({"recent": 2, "older": 1}, {"出汁": {"recent": 1, "older": 1}})
+    assert stats.count("出汁") == 2
+    assert stats.rate("出汁", "recent") == (1, 50.0)
+    assert stats.rate("出汁", "unknown") == (0, 0.0)
+
+
+def _later_scrape(reviews: list[dict], months: int) -> list[dict]:
+    """取得日を months か月後にずらした口コミ（相対表記の日付はその取得日から解決される）。"""
+    year, month = int(reviews[0]["scraped_at"][:4]), int(reviews[0]["scraped_at"][5:7]) + months
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return [dict(r, scraped_at=f"{year}-{month:02d}{r['scraped_at'][7:]}") for r in reviews]
+
+
+def test_increment_rebuckets_periods_when_cutoff_moves(mock_llm):
+    """新しい取得で「直近」の基準日が進むと、既存の口コミの時期も付け直される（全件分析と一致する）。"""
+    corpus = synthetic_reviews(90, seed=7)
+    first, later = corpus[:60], _later_scrape(corpus[60:], 6)
+
+    previous = analyzer.analyze_reviews([dict(r) for r in first], compress=False)
+    assert previous["stats"]["keywords"]["buckets"].get("recent", 0) > 0
+    increment = analyzer.analyze_increment(previous, [dict(r) for r in first + later], compress=False,
+                                           trend_granularity="week")
+    full = analyzer.analyze_reviews([dict(r) for r in first + later], compress=False,
+                                    force_stages=list(analyzer.ANALYSIS_STAGES))
+
+    assert len(increment["reviews"]) == len(full["reviews"])
+    assert increment["stats"]["keywords"]["buckets"] == full["stats"]["keywords"]["buckets"]
+    assert increment["stats"]["kando"] == full["stats"]["kando"]
+    assert increment["kando"]["breakdowns"] == full["kando"]["breakdowns"]
+    assert increment["trends"]["granularity"] == "week"
+
+
+def test_keyword_stats_round_trip():
+    stats = KeywordStats({"recent": 2}, {"出汁": {"recent": 1}})
+    assert KeywordStats.from_dict(stats.to_dict()).to_dict() == stats.to_dict()
@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import json_store
+
+
+def test_read_defaults(tmp_path):
+    path = tmp_path / "store.json"
+    assert json_store.read(str(path)) == {}
+    path.write_text("{壊れた", encoding="utf-8")
+    assert json_store.read(str(path), default=[]) == []
+
+
+def _increment(data: dict) -> dict:
+    data["n"] = data.get("n", 0) + 1
+    return data
+
+
+@pytest.mark.parametrize("posix_lock", [True, False])
+def test_concurrent_updates_are_merged(tmp_path, monkeypatch, posix_lock):
+    if not posix_lock:
+        monkeypatch.setattr(json_store, "fcntl", None)  # Windows と同じくプロセス内のロックだけ
+    path = str(tmp_path / "store.json")
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: json_store.update(path, _increment), range(50)))
+    assert json_store.read(path) == {"n": 50}
+    assert not (tmp_path / "store.json.tmp").exists()
@@ -0,0 +1,45 @@
+import numpy as np
+
+from kando_matrix import KandoMatrix
+
+ROWS = [[0, 3, 1, 2, 0, 0, 0], None, [1, 0, 0, 0, 3, 0, 2], [2, 2, 0, 0, 0, 0, 0]]
+
+
+def test_dict_round_trip():
+    matrix = KandoMatrix.from_rows(["a", "b", "c", "d"], ROWS, 7)
+    data = matrix.to_dict()
+    assert data == {"ids": ["a", "b", "c", "d"], "rows": ["0312000", "-", "1000302", "2200000"]}
+    restored = KandoMatrix.from_dict(data, 7)
+    assert restored.scores.dtype == np.int8
+    assert np.array_equal(restored.scores, matrix.scores)
+    assert restored.scored.tolist() == [True, False, True, True]
+
+
+def test_extend():
+    matrix = KandoMatrix.from_rows(["a", "b"], ROWS[:2], 7)
+    matrix.extend(KandoMatrix.from_rows(["c", "d"], ROWS[2:], 7))
+    assert len(matrix) == 4
+    assert matrix.to_dict() == KandoMatrix.from_rows(["a", "b", "c", "d"], ROWS, 7).to_dict()
+
+
+def test_breakdown_excludes_unscored_rows():
+    matrix = KandoMatrix.from_rows(["a", "b", "c", "d"], ROWS, 7)
+    out = matrix.breakdown(["x", "x", "y", "x"])
+    assert out["x"]["reviews"] == 3
+    assert out["x"]["scored"] == 2
+    assert out["x"]["score"][:2] == [1.0, 2.5]
+    assert out["x"]["detection_rate"][:3] == [50.0, 100.0, 50.0]
+    assert out["y"] == {"reviews": 1, "scored": 1, "score": [1.0, 0.0, 0.0, 0.0, 3.0, 0.0, 2.0],
+                        "detection_rate": [100.0, 0.0, 0.0, 0.0, 100.0, 0.0, 100.0]}
+
+
+def test_breakdown_missing_as_zero_and_all_unscored():
+    matrix = KandoMatrix.from_rows(["a", "b", "c", "d"], ROWS, 7)
+    out = matrix.breakdown(["x", "x", "y", "x"], missing_as_zero=True)
+    assert out["x"]["score"][:2] == [0.67, 1.67]
+    assert out["x"]["detection_rate"][1] == 66.7
+
+    unscored = KandoMatrix.from_rows(["a", "b"], [None, None], 7)
+    assert unscored.breakdown(["x", "x"]) == {"x": {"reviews": 2, "scored": 0, "score": [0.0] * 7,
+                                                     "detection_rate": [0.0] * 7}}
+    assert KandoMatrix.from_rows([], [], 7).breakdown([]) == {}
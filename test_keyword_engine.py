@@ -0,0 +1,31 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import keyword_engine
+from keyword_engine import extract_candidates, rank_candidates
+
+
+def test_extract_candidates_finds_adjectives_and_nouns():
+    candidates = extract_candidates("出汁が美味しい。店員の接客が丁寧でした。")
+    assert "美味しい" in candidates
+    assert any("出汁" in c for c in candidates)
+    assert "美味しい" not in extract_candidates("出汁が美味しい。", stopwords={"美味しい"})
+
+
+def test_rank_candidates_without_store_does_not_write(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ranked = rank_candidates(["出汁が美味しい", "出汁が美味しい店", "接客が丁寧"])
+    assert ranked[0]["df"] == 2
+    assert not (tmp_path / keyword_engine.DF_STORE_PATH).exists()
+
+
+def test_concurrent_stores_keep_each_others_df(tmp_path, monkeypatch):
+    """複数店舗の分析が同時に DF を保存しても、全店舗の DF が残る。"""
+    monkeypatch.chdir(tmp_path)
+    texts = ["出汁が美味しい", "出汁が濃い"]
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda name: rank_candidates(texts, store_name=name), [f"店{i}" for i in range(12)]))
+    with open(keyword_engine.DF_STORE_PATH, encoding="utf-8") as f:
+        stores = json.load(f)
+    assert sorted(stores) == sorted(f"店{i}" for i in range(12))
+    assert stores["店0"]["n"] == 2
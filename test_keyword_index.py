@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from keyword_index import KeywordIndex, rating_bucket
+
+WORDS = ["出汁", "残念", "美味しい", "接客"]
+SOURCES = ["tabelog", "google_maps", "tripadvisor"]
+
+
+def _corpus(n: int, seed: int = 3) -> tuple[list[str], dict[str, list[str]]]:
+    rng = random.Random(seed)
+    texts = ["".join(rng.sample(WORDS + ["店内", "ランチ", "駅"], 3)) for _ in range(n)]
+    facets = {
+        "source": [rng.choice(SOURCES) for _ in range(n)],
+        "rating": [rating_bucket(rng.choice([None, 1, 2.5, 3, 4.9, 5])) for _ in range(n)],
+        "period": [rng.choice(["recent", "older", "unknown"]) for _ in range(n)],
+    }
+    return texts, facets
+
+
+def _scan(texts: list[str], facets: dict[str, list[str]], word: str | None, **filters) -> list[int]:
+    """索引を使わずに条件に合う口コミの位置を数える（照合用）。"""
+    out = []
+    for i, text in enumerate(texts):
+        if word is not None and word not in text:
+            continue
+        if all(facets[name][i] in ([v] if isinstance(v, str) else v) for name, v in filters.items()):
+            out.append(i)
+    return out
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"source": "tabelog"},
+    {"rating": ["1", "2", "3"], "period": "recent"},
+    {"source": ["google_maps", "tripadvisor"], "rating": "5"},
+    {"source": "yelp"},
+])
+def test_counts_and_rates_match_scan(filters):
+    texts, facets = _corpus(150)
+    index = KeywordIndex.build(texts, WORDS, facets)
+    base = len(_scan(texts, facets, None, **filters))
+    assert index.count(**filters) == base
+    for word in WORDS:
+        hits = _scan(texts, facets, word, **filters)
+        assert index.count(word, **filters) == len(hits)
+        assert index.reviews(word, **filters) == hits
+        assert index.rate(word, **filters) == (len(hits), round(len(hits) / base * 100, 1) if base else 0.0)
+
+
+def test_round_trip_through_dict():
+    texts, facets = _corpus(70)
+    index = KeywordIndex.build(texts, WORDS, facets)
+    restored = KeywordIndex.from_dict(index.to_dict())
+    assert restored.size == index.size
+    assert restored.keywords == index.keywords
+    assert restored.facets == index.facets
+    assert restored.rate("出汁", source="tabelog", period="recent") == index.rate("出汁", source="tabelog",
+                                                                               period="recent")
+
+
+def test_variants_are_matched():
+    index = KeywordIndex(3)
+    index.add_keyword("美味しい", ["美味しい", "おいしかった", "普通"], variants=["おいし"])
+    assert index.reviews("美味しい") == [0, 1]
+
+
+def test_rating_bucket_edges():
+    assert [rating_bucket(v) for v in (None, "", 0, -1, 0.5, 1, 3.9, "4.5", 5, 6)] == \
+        ["0", "0", "0", "0", "0", "1", "3", "4", "5", "5"]
+
+
+def test_retain_drops_other_keywords():
+    texts, facets = _corpus(20)
+    index = KeywordIndex.build(texts, WORDS, facets)
+    index.retain(["出汁", "未登録"])
+    assert list(index.keywords) == ["出汁"]
+    assert index.count("残念") == 0
+
+
+def test_extend_matches_full_build():
+    """増分で追加した索引は、全件から作り直した索引と同じになる。"""
+    texts, facets = _corpus(90)
+    index = KeywordIndex.build(texts[:60], WORDS, {name: labels[:60] for name, labels in facets.items()})
+    index.retain(WORDS[:3])
+    index.extend(texts[60:], {name: labels[60:] for name, labels in facets.items()})
+    full = KeywordIndex.build(texts, WORDS[:3], facets)
+    assert index.size == full.size
+    assert index.keywords == full.keywords
+    assert index.facets == full.facets
+    assert KeywordIndex.from_dict(index.to_dict()).keywords == full.keywords
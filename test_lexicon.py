@@ -0,0 +1,67 @@
+import json
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from lexicon import KeywordLexicon
+
+
+def test_record_merges_variants_and_votes(tmp_path):
+    lexicon = KeywordLexicon(path=str(tmp_path / "lexicon.json"))
+    lexicon.record("美味しい", "美味しい", "positive")
+    lexicon.record("おいしい", "美味しい", "positive")
+    lexicon.record("美味しかった", "おいしい", "negative")
+    assert lexicon.resolve("美味しかった") == "美味しい"
+    assert lexicon.variants("美味しい") == ["おいしい", "美味しかった"]
+    assert lexicon.sentiment("美味しい") == "positive"
+
+
+def test_reject_does_not_override_known_surface(tmp_path):
+    lexicon = KeywordLexicon(path=str(tmp_path / "lexicon.json"))
+    lexicon.record("出汁", "出汁", "positive")
+    lexicon.reject("出汁")
+    lexicon.reject("店内")
+    assert lexicon.resolve("出汁") == "出汁"
+    assert "店内" in lexicon.rejected
+    assert lexicon.resolve("店内") is None
+
+
+def test_save_keeps_updates_from_other_instances(tmp_path):
+    """同じファイルを読み込んだ 2 つの辞書が別々に保存しても、両方の更新が残る。"""
+    path = str(tmp_path / "lexicon.json")
+    KeywordLexicon(path=path).save()
+    a, b = KeywordLexicon.load(path), KeywordLexicon.load(path)
+    a.record("出汁", "出汁", "positive")
+    b.record("出汁", "出汁", "positive")
+    b.record("店員", "店員", "neutral")
+    b.reject("京都")
+    a.save()
+    b.save()
+
+    saved = KeywordLexicon.load(path)
+    assert saved.entries["出汁"]["votes"] == {"positive": 2}
+    assert saved.resolve("店員") == "店員"
+    assert saved.rejected == {"京都"}
+    # 保存後の辞書は他の分析の更新も反映している
+    assert b.entries["出汁"]["votes"] == {"positive": 2}
+
+
+def _record_many(path: str, word: str) -> None:
+    for _ in range(20):
+        lexicon = KeywordLexicon.load(path)
+        lexicon.record(word, word, "positive")
+        lexicon.save()
+
+
+def test_concurrent_saves_lose_no_votes(tmp_path):
+    path = str(tmp_path / "lexicon.json")
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda w: _record_many(path, w), ["a1", "b2", "c3", "a1"]))
+    processes = [multiprocessing.Process(target=_record_many, args=(path, w)) for w in ("a1", "d4")]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    with open(path, encoding="utf-8") as f:
+        votes = {w: e["votes"]["positive"] for w, e in json.load(f)["entries"].items()}
+    assert votes == {"a1": 60, "b2": 20, "c3": 20, "d4": 20}
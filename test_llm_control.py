@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from llm_control import FATAL, RATE_LIMIT, TRANSIENT, LLMController, classify_error
+
+
+class _ApiError(Exception):
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(message or str(code))
+        self.code = code
+
+
+def test_classify_error():
+    assert classify_error(_ApiError(429)) == RATE_LIMIT
+    assert classify_error(_ApiError(503)) == TRANSIENT
+    assert classify_error(TimeoutError()) == TRANSIENT
+    assert classify_error(_ApiError(400)) == FATAL
+    assert classify_error(ValueError("bad")) == FATAL
+
+
+def test_backoff_bounds():
+    controller = LLMController(base_delay=1.0, max_delay=8.0)
+    assert all(controller._backoff(0, None) <= 1.0 for _ in range(200))
+    assert all(controller._backoff(2, None) <= 4.0 for _ in range(200))
+    assert all(controller._backoff(10, None) <= 8.0 for _ in range(200))
+    # retryDelay の指示があればそれ以上待つ
+    hinted = _ApiError(429, "429 RESOURCE_EXHAUSTED {'retryDelay': '7s'}")
+    assert 7.0 <= controller._backoff(0, hinted) <= 8.0
+
+
+def test_retries_transient_errors_then_succeeds():
+    controller = LLMController(base_delay=0.001)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _ApiError(503)
+        return "ok"
+
+    assert asyncio.run(controller.call(fn)) == "ok"
+    report = controller.report()
+    assert report["retries"] == 2
+    assert report["errors"] == {TRANSIENT: 2}
+
+
+def test_fatal_error_is_not_retried():
+    controller = LLMController(base_delay=0.001)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        raise _ApiError(400)
+
+    with pytest.raises(_ApiError):
+        asyncio.run(controller.call(fn))
+    assert len(attempts) == 1
+
+
+def test_rate_limit_halves_concurrency():
+    controller = LLMController(initial=8)
+    controller._on_error(RATE_LIMIT)
+    assert controller.concurrency == 4
+
+
+def test_concurrent_runs_keep_separate_stats():
+    """並行に走る 2 つの実行は、互いの呼び出し統計を消さない。"""
+    controller = LLMController()
+
+    async def ok():
+        await asyncio.sleep(0.001)
+
+    async def run(n: int, started: asyncio.Event, other: asyncio.Event) -> dict:
+        controller.begin_run()
+        started.set()
+        await other.wait()  # 相手の begin_run() の後に呼び出す
+        await asyncio.gather(*(controller.call(ok) for _ in range(n)))
+        return controller.report()
+
+    async def main():
+        a, b = asyncio.Event(), asyncio.Event()
+        return await asyncio.gather(run(3, a, b), run(5, b, a))
+
+    first, second = asyncio.run(main())
+    assert first["calls"] == 3
+    assert second["calls"] == 5
+
+
+def test_admit_wait_is_not_counted_as_latency():
+    """クォータ待ち（admit）が長くても、API が速ければ同時実行数は下げない。"""
+    controller = LLMController(initial=2, latency_target=0.05)
+
+    async def admit():
+        await asyncio.sleep(0.1)
+        return ()
+
+    async def fn():
+        return "ok"
+
+    async def main():
+        controller.begin_run()
+        await asyncio.gather(*(controller.call(fn, admit=admit) for _ in range(4)))
+        return controller.report()
+
+    report = asyncio.run(main())
+    assert report["avg_latency_sec"] < 0.05
+    assert controller.concurrency > 2
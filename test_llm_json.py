@@ -0,0 +1,21 @@
+from llm_json import iter_json_items, parse_json_object
+
+
+def test_iter_json_items_skips_broken_items():
+    text = '結果です:\n```json\n[{"id": 1}, {"id": 2,, "x"}, {"id": 3}, 4, tru, 5]\n```'
+    assert list(iter_json_items(text)) == [{"id": 1}, {"id": 3}, 4, 5]
+
+
+def test_iter_json_items_keeps_items_before_truncation():
+    assert list(iter_json_items('[{"id": 1}, {"id": 2}, {"id": 3, "text": "途中で')) == [{"id": 1}, {"id": 2}]
+    assert list(iter_json_items("[]")) == []
+    assert list(iter_json_items("配列なし")) == []
+    assert list(iter_json_items("")) == []
+
+
+def test_parse_json_object():
+    assert parse_json_object('以下の通りです。\n```json\n{"summary": "良い", "n": 2}\n```') == {"summary": "良い", "n": 2}
+    assert parse_json_object('{"a": 1} 補足: {"b": 2}') == {"a": 1}
+    assert parse_json_object('{"a": 1,') is None
+    assert parse_json_object("オブジェクトなし") is None
+    assert parse_json_object("") is None
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import analyzer  # noqa: E402
+from llm_control import LLMController  # noqa: E402
+from llm_scheduler import QuotaScheduler, _Bucket, model_limits, scheduling  # noqa: E402
+
+MODEL = "gemini-2.5-flash"
+
+
+def _scheduler(rpm: int, monkeypatch) -> QuotaScheduler:
+    """RPM が rpm のスケジューラ（TPM は制限しない）。"""
+    monkeypatch.setenv("GEMINI_RPM", str(rpm))
+    monkeypatch.setenv("GEMINI_TPM", str(10 ** 9))
+    return QuotaScheduler()
+
+
+def _drain(sched: QuotaScheduler, delay: float = 0.0) -> None:
+    """バケットを空にし、最初の割り当てを delay 秒遅らせる（以降の割り当ては全て補充待ちになる）。
+
+    イベントループの起動を待つ間に補充された分で先に割り当てられないよう、ループの中で呼ぶ。
+    """
+    now = time.monotonic()
+    for bucket in sched._model_buckets(MODEL):
+        bucket.level = -delay * bucket.rate / 60
+        bucket.updated = now
+
+
+def test_bucket_wait_time():
+    bucket = _Bucket(60)
+    assert bucket.wait_time(1) == 0
+    bucket.level = 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    # 容量を超える量は容量ぶんで待つ（永久に待たない）
+    bucket.level = 0.0
+    assert bucket.wait_time(1000) == pytest.approx(60)
+
+
+def test_bucket_refill_is_capped(monkeypatch):
+    bucket = _Bucket(60)
+    bucket.level = 0.0
+    bucket.refill(bucket.updated + 30)
+    assert bucket.level == pytest.approx(30)
+    bucket.refill(bucket.updated + 600)
+    assert bucket.level == 60
+
+
+def test_model_limits_env_override(monkeypatch):
+    monkeypatch.delenv("GEMINI_RPM", raising=False)
+    monkeypatch.delenv("GEMINI_TPM", raising=False)
+    assert model_limits("unknown-model") == {"rpm": 60, "tpm": 250_000}
+    monkeypatch.setenv("GEMINI_RPM", "7")
+    assert model_limits(MODEL)["rpm"] == 7
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with scheduling("store", "urgent"):
+            pass
+
+
+def test_fair_share_between_stores(monkeypatch):
+    """同じ優先度では、後から来た店舗も先にバックログを積んだ店舗と交互に割り当てられる。"""
+    sched = _scheduler(6000, monkeypatch)
+    order = []
+
+    async def calls(store: str, n: int):
+        async def one():
+            await sched.acquire(MODEL, 100)
+            order.append(store)
+
+        with scheduling(store):
+            await asyncio.gather(*(one() for _ in range(n)))
+
+    async def run():
+        # 両店舗の呼び出しが揃ってから割り当てが始まるようにする
+        _drain(sched, delay=0.1)
+        big = asyncio.create_task(calls("big", 40))
+        await asyncio.sleep(0)
+        await calls("small", 5)
+        big.cancel()
+        await asyncio.gather(big, return_exceptions=True)
+
+    asyncio.run(run())
+    assert order.count("small") == 5
+    # small の 5 回は big の残り 40 回を待たずに、交互に近い順番で割り当てられる
+    assert order.index("small") < 3
+    assert len(order) - order[::-1].index("small") <= 12
+
+
+def test_controller_hands_slots_in_order_key():
+    """枠の待ち行列は admit() が返したキーの順。到着の遅い小さいキーが先に枠を受け取る。"""
+    controller = LLMController(initial=1, max_concurrency=1)
+    started = []
+
+    async def run():
+        async def one(name: str, key: tuple):
+            async def admit():
+                return key
+
+            async def fn():
+                started.append(name)
+                await asyncio.sleep(0.001)
+
+            await controller.call(fn, admit=admit)
+
+        batch = [asyncio.create_task(one(f"b{i}", (1, float(i), i))) for i in range(10)]
+        await asyncio.sleep(0)
+        await one("i0", (0, 0.0, 100))
+        await asyncio.gather(*batch)
+
+    asyncio.run(run())
+    assert started.index("i0") <= 2
+
+
+def test_late_interactive_store_overtakes_queued_batch(monkeypatch):
+    """バッチ店舗の呼び出しが大量に待っていても、後から来た対話実行の店舗が先に処理される。
+
+    スケジューラの割り当てを同時実行枠より前に受けるので、待っている全ての呼び出しが順位付けの対象になる。
+    """
+    sched = _scheduler(6000, monkeypatch)
+    monkeypatch.setattr(analyzer, "scheduler", sched)
+    monkeypatch.setattr(analyzer, "_controller", LLMController())
+    monkeypatch.setattr(analyzer, "_token_usage", analyzer.contextvars.ContextVar("token_usage", default=None))
+    done = []
+
+    async def generate_content(model, contents, config):
+        await asyncio.sleep(0.002)
+        done.append(contents)
+        return SimpleNamespace(text="ok", usage_metadata=None)
+
+    monkeypatch.setattr(analyzer, "_client", SimpleNamespace(
+        aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))))
+
+    async def store(name: str, priority: str, n: int):
+        with scheduling(name, priority):
+            await asyncio.gather(*(analyzer._generate(name, stage="kando") for _ in range(n)))
+
+    async def run():
+        _drain(sched)
+        batch = asyncio.create_task(store("batch", "batch", 300))
+        await asyncio.sleep(0.05)
+        await store("interactive", "interactive", 3)
+        batch.cancel()
+        await asyncio.gather(batch, return_exceptions=True)
+
+    asyncio.run(run())
+    positions = [i for i, name in enumerate(done) if name == "interactive"]
+    assert len(positions) == 3
+    # 到着時点で処理中・割り当て済みだったバッチの呼び出しだけが先に終わる
+    assert max(positions) < 20
+
+
+def test_token_usage_outside_run_is_not_shared():
+    """begin_run() の外の呼び出しは、モジュール共通の dict に積算しない。"""
+    response = SimpleNamespace(text="ok", usage_metadata=None)
+
+    async def call():
+        analyzer._record_usage("kando", MODEL, "プロンプト", response)
+        return analyzer._usage_by_stage()
+
+    assert asyncio.run(call())["kando"]["calls"] == 1
+    assert asyncio.run(call())["kando"]["calls"] == 1
+    assert analyzer._token_usage.get() is None
@@ -0,0 +1,36 @@
+import pytest
+
+from normalizer import NORMALIZER_VERSION, content_hash, normalize_review, normalize_text
+
+# 実際のサイトの本文の形（Google マップは本文の後に食事の種類・料金・項目別評価が続く）
+SAMPLES = [
+    ("ランチで利用しました。\n\n\n\nパスタがとても美味しかったです！\n食事の種類\nランチ\n1 人あたりの料金\n"
+     "￥1,000～2,000\n食事: 5\nサービス: 4\n雰囲気: 5",
+     "ランチで利用しました。\n\nパスタがとても美味しかったです!", "f39c4462173d5d1c"),
+    ("店員さんの対応が丁寧でした。 \n 駐車場あり。\n食事：５　サービス：４",
+     "店員さんの対応が丁寧でした。\n駐車場あり。", "25631bc64352332c"),
+    ("子連れでも安心です。\nグループの人数\n4 人", "子連れでも安心です。", "a33642a395693d9e"),
+    # TripAdvisor（全角英数字・半角カナ・CRLF）
+    ("ＦＵＴＵＲＥ　ＴＲＡＩＮの雰囲気が最高。ｶﾌｪﾗﾃも美味しい　　です。\r\nGreat diner in Kyoto.  Friendly\tstaff!"
+     "\n\n\n\nWould visit again.",
+     "FUTURE TRAINの雰囲気が最高。カフェラテも美味しい です。\nGreat diner in Kyoto. Friendly staff!\n\nWould visit again.",
+     "9d406e230a3b82ec"),
+]
+
+
+@pytest.mark.parametrize("raw, text, digest", SAMPLES)
+def test_normalize_text_and_hash_are_pinned(raw, text, digest):
+    """正規化結果とハッシュが変わると保存済みの口コミキー（review_key）が全て変わる。"""
+    assert normalize_text(raw) == text
+    assert content_hash(text) == digest
+    assert normalize_text(text) == text
+
+
+def test_normalize_review_runs_once():
+    review = {"text": SAMPLES[0][0]}
+    assert normalize_review(review) is review
+    assert review == {"text": SAMPLES[0][1], "content_hash": SAMPLES[0][2], "normalized": NORMALIZER_VERSION}
+    # 処理済みの口コミは本文を書き換えない
+    done = {"text": "ｶﾌｪ", "content_hash": "x", "normalized": NORMALIZER_VERSION}
+    assert normalize_review(dict(done)) == done
+    assert normalize_review({})["text"] == ""
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import analyzer
+import pipeline
+from mock_backend import synthetic_reviews
+from pipeline import ReviewStream
+
+TIMEOUT = 10
+
+
+async def _stream(reviews: list[dict], chunk: int = 7, **options) -> dict:
+    stream = ReviewStream(**options)
+    consumer = asyncio.create_task(stream.run())
+    try:
+        for i in range(0, len(reviews), chunk):
+            await stream.put([dict(r) for r in reviews[i:i + chunk]])
+    finally:
+        await stream.close()
+    return await consumer
+
+
+def test_streamed_run_matches_batch_analysis(mock_llm, tmp_path, monkeypatch):
+    reviews = synthetic_reviews(80, seed=5)
+    streamed = asyncio.run(_stream(reviews, include_gap=True, queue_size=4))
+    # キーワード辞書とステージキャッシュを共有しないよう別のディレクトリで実行する
+    (tmp_path / "batch").mkdir()
+    monkeypatch.chdir(tmp_path / "batch")
+    batch = analyzer.analyze_reviews([dict(r) for r in reviews], include_gap=True)
+
+    assert [r["text"] for r in streamed["reviews"]] == [r["text"] for r in batch["reviews"]]
+    assert streamed["duplicates"] == batch["duplicates"]
+    for key in ("keywords", "experience", "kando", "gap"):
+        assert streamed[key] == batch[key], key
+
+
+def test_close_without_reviews_returns(mock_llm):
+    async def run():
+        stream = ReviewStream()
+        consumer = asyncio.create_task(stream.run())
+        await stream.close()
+        return await asyncio.wait_for(consumer, TIMEOUT)
+
+    assert asyncio.run(run())["reviews"] == []
+
+
+@pytest.mark.parametrize("target", ["prepare_review", "score_kando_batch"])
+def test_consumer_failure_releases_scraper(mock_llm, monkeypatch, target):
+    """分析側が失敗したら、満杯のキューで待つスクレイパーも止まり close() も返る。"""
+    async def fail(*args, **kwargs):
+        raise ValueError("分析失敗")
+
+    monkeypatch.setattr(pipeline, target, fail if target == "score_kando_batch" else lambda review: 1 / 0)
+    reviews = synthetic_reviews(300, seed=2)
+
+    async def run():
+        stream = ReviewStream(queue_size=1)
+        consumer = asyncio.create_task(stream.run())
+        with pytest.raises(RuntimeError):
+            try:
+                for review in reviews:
+                    await asyncio.wait_for(stream.put([review]), TIMEOUT)
+            finally:
+                await asyncio.wait_for(stream.close(), TIMEOUT)
+        with pytest.raises((ValueError, ZeroDivisionError)):
+            await asyncio.wait_for(consumer, TIMEOUT)
+
+    asyncio.run(run())
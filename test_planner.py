@@ -0,0 +1,49 @@
+import analyzer
+from batching import pack_batches
+from compression import PromptCompressor
+from dedupe import split_duplicates
+from mock_backend import synthetic_reviews
+from planner import plan_run
+
+
+def _texts(reviews: list[dict]) -> list[str]:
+    canonical, _ = split_duplicates([analyzer.prepare_review(r) for r in reviews])
+    compressor = PromptCompressor()
+    for r in canonical:
+        compressor.add(r.get("text", ""))
+    return compressor.texts
+
+
+def test_calls_follow_batch_packing(mock_llm):
+    reviews = synthetic_reviews(150, seed=4)
+    texts = _texts(reviews)
+    plan = plan_run(reviews, include_gap=True, gap_mode="mapreduce")
+    calls = {s["stage"]: s["calls"] for s in plan["stages"]}
+
+    assert plan["reviews"] + plan["duplicates"] == len(reviews)
+    assert set(plan["cache"].values()) == {"run"}
+    assert calls["keywords"] == len(pack_batches(texts, "keywords"))
+    assert calls["kando"] == len(pack_batches(texts, "kando"))
+    assert calls["gap_map"] == len(pack_batches(texts, "gap_map"))
+    assert calls["experience"] == calls["kando_comment"] == calls["gap_reduce"] == 1
+    assert plan["total"]["calls"] == sum(calls.values())
+    assert all(s["input_tokens"] > 0 and s["cost_usd"] > 0 for s in plan["stages"])
+
+    # 見積もりのバッチ数は実際の分析の呼び出し回数と一致する
+    usage = analyzer.analyze_reviews(reviews, include_gap=True, gap_mode="mapreduce")["token_usage"]
+    for stage in ("keywords", "kando", "gap_map"):
+        assert usage[stage]["calls"] == calls[stage], stage
+
+
+def test_cached_stages_count_as_zero(mock_llm):
+    reviews = synthetic_reviews(60, seed=8)
+    analyzer.analyze_reviews(reviews, include_gap=True)
+    plan = plan_run(reviews, include_gap=True)
+    assert set(plan["cache"].values()) == {"cached"}
+    assert plan["stages"] == []
+    assert plan["total"]["calls"] == 0
+    assert plan["total"]["cost_usd"] == 0
+
+    plan = plan_run(reviews, include_gap=True, force_stages=["kando"])
+    assert [s["stage"] for s in plan["stages"]] == ["kando", "kando_comment"]
+    assert plan["stages"][0]["calls"] == len(pack_batches(_texts(reviews), "kando"))
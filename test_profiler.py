@@ -0,0 +1,61 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import analyzer  # noqa: E402
+from llm_control import LLMController  # noqa: E402
+from llm_scheduler import QuotaScheduler  # noqa: E402
+from profiler import Profiler, profiler  # noqa: E402
+
+
+def test_summary_groups_and_sums_tokens():
+    p = Profiler()
+    with p.span("kando", "llm", input_tokens=10, output_tokens=2):
+        pass
+    with p.span("kando", "llm", input_tokens=5, output_tokens=1, failed=1):
+        pass
+    with p.span("build_html", "report"):
+        pass
+    rows = p.summary()
+    assert [(r["category"], r["name"]) for r in rows] == [("llm", "kando"), ("report", "build_html")]
+    assert rows[0]["count"] == 2
+    assert rows[0]["input_tokens"] == 15
+    assert rows[0]["failed"] == 1
+
+
+def test_trace_puts_overlapping_spans_on_separate_lanes():
+    p = Profiler()
+    start = time.perf_counter()
+    p.record("a", "llm", start, start + 2)
+    p.record("b", "llm", start + 1, start + 3)
+    p.record("c", "llm", start + 2.5, start + 4)
+    events = [e for e in p.trace()["traceEvents"] if e["ph"] == "X"]
+    tids = {e["name"]: e["tid"] for e in events}
+    assert tids["a"] != tids["b"]
+    assert tids["c"] == tids["a"]
+
+
+def test_llm_span_covers_only_the_api_call(monkeypatch):
+    """クォータ待ちは LLM 待ち（queue）に記録され、LLM 呼び出しの区間には含まれない。"""
+    monkeypatch.setenv("GEMINI_RPM", "600")  # 1 回あたり 0.1 秒の補充
+    sched = QuotaScheduler()
+    sched._model_buckets(analyzer.stage_model("kando"))[0].level = 0.0
+    monkeypatch.setattr(analyzer, "scheduler", sched)
+    monkeypatch.setattr(analyzer, "_controller", LLMController())
+
+    async def generate_content(model, contents, config):
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(text="ok", usage_metadata=None)
+
+    monkeypatch.setattr(analyzer, "_client", SimpleNamespace(
+        aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))))
+    profiler.reset()
+    assert asyncio.run(analyzer._generate("prompt", stage="kando")) == "ok"
+
+    events = {(e["cat"], e["name"]): e for e in profiler.events}
+    assert events[("queue", "kando.quota")]["dur"] >= 0.05
+    assert events[("llm", "kando")]["dur"] < 0.05
+    assert events[("llm", "kando")]["args"]["input_tokens"] > 0
@@ -0,0 +1,102 @@
+from collections import Counter
+
+import pytest
+
+from batching import estimate_tokens
+from sampling import (representative_sample, required_sample_size, stratified_estimate,
+                      stratified_estimate_from_moments, stratified_sample)
+
+
+def test_required_sample_size():
+    assert required_sample_size(0, 0.05) == 0
+    assert required_sample_size(10 ** 6, 0.05) == 385
+    # 有限母集団修正で小さい母集団では減り、母集団を超えない
+    assert required_sample_size(100, 0.05) == 80
+    assert required_sample_size(10, 0.01) == 10
+
+
+def test_stratified_sample_is_proportional():
+    strata = ["a"] * 80 + ["b"] * 20
+    picked = stratified_sample(strata, 10)
+    assert picked == sorted(picked) == stratified_sample(strata, 10)
+    assert Counter(strata[i] for i in picked) == {"a": 8, "b": 2}
+    assert stratified_sample(strata, 100) == list(range(100))
+
+
+def test_small_strata_get_at_least_one():
+    strata = ["a"] * 99 + ["b"]
+    picked = stratified_sample(strata, 5)
+    assert len(picked) == 5
+    assert 99 in picked
+
+
+def test_stratified_estimate_weights_by_population():
+    values = {"a": [0.0, 2.0], "b": [4.0, 6.0]}
+    sizes = {"a": 90, "b": 10}
+    estimate, low, high = stratified_estimate(values, sizes)
+    assert estimate == pytest.approx(0.9 * 1.0 + 0.1 * 5.0)
+    assert low < estimate < high
+    moments = {h: (len(vs), sum(vs), sum(v * v for v in vs)) for h, vs in values.items()}
+    assert stratified_estimate_from_moments(moments, sizes) == pytest.approx((estimate, low, high))
+
+
+def test_census_has_no_sampling_error():
+    estimate, low, high = stratified_estimate({"a": [1.0, 2.0, 3.0]}, {"a": 3})
+    assert estimate == low == high == pytest.approx(2.0)
+    assert stratified_estimate({}, {"a": 3}) == (0.0, 0.0, 0.0)
+
+
+def test_many_small_strata_never_exceed_n():
+    """層の数が n より多くても、抽出数は n を超えない（感動分析の費用見積もりどおりになる）。"""
+    strata = [f"s{k}" for k in range(100) for _ in range(2)]
+    picked = stratified_sample(strata, 50)
+    assert len(picked) == 50
+    assert len({strata[i] for i in picked}) == 50
+
+    # 大きい層の配分を戻して、小さい層にも 1 件ずつ残す
+    strata = ["big"] * 100 + [f"s{k}" for k in range(8)]
+    picked = stratified_sample(strata, 10)
+    assert len(picked) == 10
+    assert Counter(strata[i] for i in picked)["big"] == 2
+
+
+TOPICS = {
+    "ramen": "濃厚な豚骨スープのラーメンで、替え玉を頼みました。麺の硬さを選べます。",
+    "sushi": "カウンターで握りたての寿司をいただきました。大将のおまかせが良かったです。",
+    "cafe": "窓際の席でケーキとコーヒーを楽しみました。静かで読書に向いています。",
+}
+
+
+def _topic_texts() -> tuple[list[str], list[str]]:
+    texts, topics = [], []
+    for i in range(60):
+        topic = list(TOPICS)[i % 3]
+        texts.append(f"{TOPICS[topic]}{i}回目の訪問です。")
+        topics.append(topic)
+    return texts, topics
+
+
+def test_representative_sample_covers_each_cluster():
+    texts, topics = _topic_texts()
+    picked = representative_sample(texts, budget=1000, cap=200, max_items=3)
+    assert len(picked) == 3
+    assert {topics[i] for i in picked} == set(TOPICS)
+
+
+def test_representative_sample_is_deterministic_and_within_budget():
+    texts, _ = _topic_texts()
+    facets = {"source": ["tabelog", "google_maps"] * 30}
+    picked = representative_sample(texts, budget=300, cap=40, facets=facets, seed=7)
+    assert picked == representative_sample(texts, budget=300, cap=40, facets=facets, seed=7)
+    assert len(set(picked)) == len(picked)
+    assert sum(min(estimate_tokens(texts[i]), 40) for i in picked) <= 300
+
+
+def test_representative_sample_small_inputs():
+    texts = ["美味しい", "", "また来たい", "普通"]
+    # 全件が予算に収まるならクラスタに分けずに全件（空の本文は除く）
+    assert representative_sample(texts, budget=1000, cap=100, max_items=10) == [0, 2, 3]
+    assert representative_sample(texts, budget=0, cap=100) == []
+    assert representative_sample([], budget=100, cap=100) == []
+    # 同じ本文ばかりでも件数の上限を守る
+    assert len(representative_sample(["同じ本文です"] * 5, budget=1000, cap=100, max_items=2)) <= 2
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+import analyzer
+import main
+import mock_backend
+from mock_backend import synthetic_reviews
+from stage_cache import StageCache, digest
+
+
+def test_digest_ignores_key_order():
+    assert digest({"a": 1, "b": [1, 2]}) == digest({"b": [1, 2], "a": 1})
+    assert digest({"a": 1}) != digest({"a": 2})
+
+
+def test_run_caches_and_force_recomputes(tmp_path):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    async def run(cache: StageCache):
+        return await cache.run("kando", "k1", compute)
+
+    directory = str(tmp_path / "cache")
+    first = StageCache(directory)
+    assert first.status("kando", "k1") == "run"
+    assert asyncio.run(run(first)) == {"n": 1}
+    second = StageCache(directory)
+    assert second.status("kando", "k1") == "cached"
+    assert asyncio.run(run(second)) == {"n": 1}
+    forced = StageCache(directory, force=["kando"])
+    assert asyncio.run(run(forced)) == {"n": 2}
+    assert [r["status"] for r in first.report() + second.report() + forced.report()] == ["run", "cached", "forced"]
+    assert StageCache(directory).load("kando", "k1") == {"n": 2}  # 計算し直した結果で上書きする
+
+    disabled = StageCache(str(tmp_path / "off"), enabled=False)
+    asyncio.run(run(disabled))
+    assert disabled.status("kando", "k1") == "run"
+
+
+def _statuses(result: dict) -> dict[str, str]:
+    return {r["stage"]: r["status"] for r in result["stage_cache"]}
+
+
+@pytest.fixture
+def corpus():
+    return synthetic_reviews(60, seed=11)
+
+
+def _analyze(reviews: list[dict], **kwargs) -> dict:
+    return analyzer.analyze_reviews([dict(r) for r in reviews], include_gap=True, compress=False, **kwargs)
+
+
+def test_rerun_reuses_every_stage(mock_llm, corpus):
+    first = _analyze(corpus)
+    assert set(_statuses(first).values()) == {"run"}
+    calls = sum(mock_llm.attempts.values())
+    second = _analyze(corpus)
+    assert set(_statuses(second).values()) == {"cached"}
+    assert sum(mock_llm.attempts.values()) == calls  # LLM を呼ばない
+    for key in ("keywords", "experience", "kando", "gap"):
+        assert second[key] == first[key]
+
+
+def test_changed_input_recomputes_only_that_stage_and_downstream(mock_llm, corpus, monkeypatch):
+    _analyze(corpus)
+    # 感動分析のプロンプトの版を上げても、他のステージは再利用する
+    monkeypatch.setitem(analyzer.PROMPT_VERSIONS, "kando", 2)
+    assert _statuses(_analyze(corpus)) == {"keywords": "cached", "experience": "cached", "kando": "run",
+                                           "gap": "cached"}
+
+    # キーワードの結果が変わると、それを入力にする体験価値も計算し直す
+    monkeypatch.setitem(analyzer.PROMPT_VERSIONS, "keywords", 2)
+    monkeypatch.delitem(mock_backend.VOCAB, "美味しい")
+    assert _statuses(_analyze(corpus)) == {"keywords": "run", "experience": "run", "kando": "cached",
+                                           "gap": "cached"}
+
+
+def test_force_stages(mock_llm, corpus):
+    _analyze(corpus)
+    result = _analyze(corpus, force_stages=main._force_stages("experience, gap"))
+    assert _statuses(result) == {"keywords": "cached", "experience": "forced", "kando": "cached", "gap": "forced"}
+    plan = analyzer.plan_analysis(corpus, include_gap=True, compress=False, force_stages=["kando"])
+    assert {row["stage"]: row["status"] for row in plan} == {"keywords": "cached", "experience": "cached",
+                                                             "kando": "forced", "gap": "cached"}
+    with pytest.raises(SystemExit):
+        main._force_stages("experience,summary")
@@ -0,0 +1,47 @@
+from datetime import date
+
+import numpy as np
+
+from timeseries import assign_buckets, bucket_label, bucket_of, build_trends, detect_changes
+
+
+def _day(y: int, m: int, d: int) -> int:
+    return date(y, m, d).toordinal()
+
+
+def test_bucket_of_month_and_week():
+    assert bucket_label(bucket_of(_day(2025, 6, 30), "month"), "month") == "2025-06"
+    monday = _day(2025, 6, 16)
+    assert bucket_of(monday, "week") == bucket_of(monday + 6, "week") != bucket_of(monday - 1, "week")
+    assert bucket_label(bucket_of(monday + 3, "week"), "week") == "2025-06-16"
+
+
+def test_wide_ranges_are_unplaced():
+    ranges = [(_day(2025, 6, 1), _day(2025, 6, 30)), (_day(2024, 6, 1), _day(2025, 5, 31)), None]
+    assert assign_buckets(ranges, "month").tolist() == [bucket_of(_day(2025, 6, 15), "month"), -1, -1]
+
+
+def test_detect_changes_ignores_flat_series():
+    means = np.array([4.0, 4.1, 3.9, 4.0, 4.05, 3.95, 4.0, 4.1, 3.9, 4.0])
+    assert detect_changes(means, np.full(10, 10), sigma=0.5) == []
+
+
+def test_build_trends_detects_rating_drop():
+    """12 か月のうち 9 か月目から評点が 1 点下がると、その月に下降の変化点が記録される。"""
+    ranges, ratings = [], []
+    for month in range(1, 13):
+        level = 4.0 if month < 9 else 3.0
+        for i in range(10):
+            ranges.append((_day(2024, month, 10), _day(2024, month, 10)))
+            ratings.append(level + (0.5 if i % 2 else -0.5))
+    ranges.append(None)
+    ratings.append("")
+
+    trends = build_trends(ranges, ratings, {}, len(ranges))
+    assert trends["buckets"][0] == "2024-01" and len(trends["buckets"]) == 12
+    assert trends["reviews"] == [10] * 12
+    assert trends["unplaced"] == 1
+    assert trends["rating"][0] == 4.0 and trends["rating"][-1] == 3.0
+    assert [(c["series"], c["bucket"], c["direction"]) for c in trends["changes"]] == [("rating", "2024-09", "down")]
+    assert trends["changes"][0]["before"] == 4.0
+    assert trends["changes"][0]["after"] == 3.0
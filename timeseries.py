@@ -0,0 +1,191 @@
+"""月別・週別のトレンド集計と変化検出モジュール。
+
+正規化済みの日付範囲（dates.py）から口コミを月または週のバケットに割り当て、
+バケットごとのキーワード出現率・平均評点・感動の7類型スコアを numpy でまとめて集計する。
+各系列は両側 CUSUM で持続的な水準の変化を検出し、変化点として記録する。
+
+- 日付範囲の中央日でバケットを決める。範囲がバケット幅より広い口コミ（「1 年前」など）は
+  どのバケットにも入れない（unplaced として件数だけ数える）。
+- CUSUM は各バケットの値を z = (値 - 基準水準) / (σ √(1/件数 + 1/基準の件数)) に標準化して累積し、
+  許容幅 CUSUM_K を超えた分が閾値 CUSUM_H を超えたら変化ありとする。基準水準は区間の先頭
+  BASELINE_BUCKETS バケットの平均で、変化点からは新しい区間として取り直す。
+  件数が MIN_BUCKET_REVIEWS 未満のバケットは累積に加えない。
+
+結果（analysis["trends"]）はそのまま折れ線グラフに使える形で保存する。
+"""
+
+from datetime import date
+
+import numpy as np
+
+from kando_matrix import KandoMatrix
+
+GRANULARITIES = {"month": 31, "week": 7}  # バケットに割り当てられる日付範囲の最大幅（日）
+MAX_BUCKETS = {"month": 36, "week": 52}
+MIN_BUCKET_REVIEWS = 3
+CUSUM_K = 1.0
+CUSUM_H = 4.0
+BASELINE_BUCKETS = 6
+
+
+def bucket_of(ordinal: int, granularity: str) -> int:
+    """日付の序数をバケット番号に変換する（month: 年×12+月-1 / week: 月曜始まりの通し週番号）。"""
+    if granularity == "month":
+        d = date.fromordinal(ordinal)
+        return d.year * 12 + d.month - 1
+    return (ordinal - 1) // 7
+
+
+def bucket_label(bucket: int, granularity: str) -> str:
+    if granularity == "month":
+        return f"{bucket // 12}-{bucket % 12 + 1:02d}"
+    return date.fromordinal(bucket * 7 + 1).isoformat()
+
+
+def assign_buckets(date_ranges: list, granularity: str) -> np.ndarray:
+    """口コミごとのバケット番号（割り当てられない口コミは -1）。"""
+    width = GRANULARITIES[granularity]
+    out = np.full(len(date_ranges), -1, dtype=np.int64)
+    for i, r in enumerate(date_ranges):
+        if r and r[1] - r[0] < width:
+            out[i] = bucket_of((r[0] + r[1]) // 2, granularity)
+    return out
+
+
+def build_trends(date_ranges: list, ratings: list, keyword_bits: dict[str, int], size: int,
+                 kando: KandoMatrix | None = None, kando_types: list[str] | None = None,
+                 granularity: str = "month") -> dict:
+    """バケット別の系列と変化点を返す。keyword_bits は KeywordIndex.keywords（語 → 口コミのビットマップ）。"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"未知の集計単位: {granularity}（{' / '.join(GRANULARITIES)}）")
+    buckets = assign_buckets(date_ranges, granularity)
+    placed = buckets >= 0
+    if not placed.any():
+        return {"granularity": granularity, "buckets": [], "reviews": [], "unplaced": int(len(buckets)),
+                "rating": [], "keywords": {}, "kando": {}, "changes": []}
+
+    # 最初のバケットから最後のバケットまで欠けなく並べる（直近 MAX_BUCKETS 個まで）
+    last = int(buckets[placed].max())
+    first = max(int(buckets[placed].min()), last - MAX_BUCKETS[granularity] + 1)
+    in_range = placed & (buckets >= first)
+    slot = np.where(in_range, buckets - first, 0)
+    n_slots = last - first + 1
+    counts = np.bincount(slot[in_range], minlength=n_slots)
+
+    series: dict[str, dict] = {}
+
+    # 平均評点（評点なしは除く）
+    rating_values = np.array([_to_float(r) for r in ratings])
+    rated = in_range & (rating_values > 0)
+    rating_n = np.bincount(slot[rated], minlength=n_slots)
+    rating_sum = np.bincount(slot[rated], weights=rating_values[rated], minlength=n_slots)
+    series["rating"] = {"mean": _safe_div(rating_sum, rating_n), "n": rating_n,
+                        "sigma": float(rating_values[rated].std(ddof=1)) if rated.sum() > 1 else 0.0}
+
+    # キーワード出現率（ビットマップを展開して bincount）
+    for word, bits in keyword_bits.items():
+        present = _unpack(bits, size)
+        hits = np.bincount(slot[in_range & present], minlength=n_slots)
+        p = present[in_range].mean()
+        series[f"keyword:{word}"] = {"mean": _safe_div(hits, counts), "n": counts,
+                                     "sigma": float(np.sqrt(p * (1 - p)))}
+
+    # 感動の7類型（採点済みの口コミの平均）
+    if kando is not None and len(kando) == size:
+        scored = in_range & kando.scored
+        kando_n = np.bincount(slot[scored], minlength=n_slots)
+        for k, t in enumerate(kando_types or []):
+            values = kando.scores[:, k].astype(float)
+            sums = np.bincount(slot[scored], weights=values[scored], minlength=n_slots)
+            series[f"kando:{t}"] = {"mean": _safe_div(sums, kando_n), "n": kando_n,
+                                    "sigma": float(values[scored].std(ddof=1)) if scored.sum() > 1 else 0.0}
+
+    labels = [bucket_label(first + i, granularity) for i in range(n_slots)]
+    changes = []
+    for name, s in series.items():
+        for change in detect_changes(s["mean"], s["n"], s["sigma"]):
+            if name.startswith("keyword:"):  # 出現率は系列と同じく % で記録する
+                change["before"], change["after"] = round(change["before"] * 100, 1), round(change["after"] * 100, 1)
+            change["series"] = name
+            change["bucket"] = labels[change.pop("index")]
+            changes.append(change)
+    changes.sort(key=lambda c: (c["bucket"], c["series"]))
+
+    def rounded(s: dict, scale: float = 1.0, digits: int = 2) -> list[float | None]:
+        return [round(float(v) * scale, digits) if n > 0 else None for v, n in zip(s["mean"], s["n"])]
+
+    return {
+        "granularity": granularity,
+        "buckets": labels,
+        "reviews": counts.tolist(),
+        "unplaced": int((~placed).sum()),
+        "rating": rounded(series["rating"]),
+        "keywords": {w: rounded(series[f"keyword:{w}"], 100, 1) for w in keyword_bits},
+        "kando": {t: rounded(series[f"kando:{t}"]) for t in (kando_types or []) if f"kando:{t}" in series},
+        "changes": changes,
+    }
+
+
+def detect_changes(means: np.ndarray, n: np.ndarray, sigma: float,
+                   k: float = CUSUM_K, h: float = CUSUM_H) -> list[dict]:
+    """両側 CUSUM で基準水準からの持続的な上昇・下降を検出する。
+
+    基準水準は区間の先頭 BASELINE_BUCKETS バケットの平均。変化を検出したら、累積が 0 から
+    立ち上がり始めたバケットを変化点とし、そこから新しい区間として基準水準を取り直す。
+    戻り値: [{"index": バケット位置, "direction": "up"/"down", "before": 変化前の平均, "after": 変化後の平均}]
+    """
+    valid = np.flatnonzero(n >= MIN_BUCKET_REVIEWS)
+    if sigma <= 0 or len(valid) < BASELINE_BUCKETS + 1:
+        return []
+
+    def level(idx) -> float:
+        return float((means[idx] * n[idx]).sum() / n[idx].sum())
+
+    changes = []
+    start = 0  # valid 内での区間の先頭
+    while start + BASELINE_BUCKETS < len(valid):
+        base = valid[start:start + BASELINE_BUCKETS]
+        target, base_n = level(base), n[base].sum()
+        upper = lower = 0.0
+        up_from = down_from = start + BASELINE_BUCKETS
+        found = None
+        for j in range(start + BASELINE_BUCKETS, len(valid)):
+            i = valid[j]
+            z = (means[i] - target) / (sigma * np.sqrt(1 / n[i] + 1 / base_n))
+            if upper == 0.0:
+                up_from = j
+            if lower == 0.0:
+                down_from = j
+            upper = max(0.0, upper + z - k)
+            lower = max(0.0, lower - z - k)
+            if upper > h or lower > h:
+                found = (up_from, "up") if upper > h else (down_from, "down")
+                break
+        if found is None:
+            break
+        j, direction = found
+        end = min(j + BASELINE_BUCKETS, len(valid))
+        changes.append({
+            "index": int(valid[j]),
+            "direction": direction,
+            "before": round(level(valid[start:j]), 3),
+            "after": round(level(valid[j:end]), 3),
+        })
+        start = j
+    return changes
+
+
+def _unpack(bits: int, size: int) -> np.ndarray:
+    raw = np.frombuffer(bits.to_bytes((size + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder="little")[:size].astype(bool)
+
+
+def _safe_div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.divide(a, b, out=np.zeros(len(a)), where=b > 0)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0